@@ -88,6 +88,14 @@ server {
         access_log off;
     }
 
+    # 人口网格等二进制数据：存在 .gz 文件时直接发送预压缩版本
+    location ~* \\.bin\$ {
+        gzip_static on;
+        default_type application/octet-stream;
+        expires 1M;
+        add_header Cache-Control \"public\";
+    }
+
     # Optional: Hide Nginx version
     server_tokens off;
 }
@@ -62,20 +62,20 @@ echo "✅ 服务器环境准备完成"
 
 # 4. 上传Flask应用文件
 echo "📤 上传Flask应用文件..."
-scp -i "${SSH_KEY}" "${LOCAL_FLASK_DIR}/app.py" "${REMOTE_USER}@${SERVER_HOST}:${REMOTE_DIR}/"
+scp -i "${SSH_KEY}" "${LOCAL_FLASK_DIR}"/*.py "${REMOTE_USER}@${SERVER_HOST}:${REMOTE_DIR}/"
+# 批量等时圈按书房 id 查询坐标，需要书房数据
+scp -i "${SSH_KEY}" "./static/data/城市书房数据.json" "${REMOTE_USER}@${SERVER_HOST}:${REMOTE_DIR}/"
+# 人口覆盖统计 (/api/coverage) 需要人口网格，静态等时圈包存在时一并上传
+scp -i "${SSH_KEY}" "./static/data/population_grid.bin" "${REMOTE_USER}@${SERVER_HOST}:${REMOTE_DIR}/"
+if [ -f "./static/data/isochrones.geojson" ]; then
+    scp -i "${SSH_KEY}" "./static/data/isochrones.geojson" "${REMOTE_USER}@${SERVER_HOST}:${REMOTE_DIR}/"
+fi
 
 echo "✅ 文件上传完成"
 
-# 5. 创建requirements.txt
-echo "📝 创建requirements.txt..."
-cat > /tmp/requirements.txt << 'EOF'
-Flask==2.3.3
-Flask-CORS==4.0.0
-requests==2.31.0
-python-dotenv==1.0.0
-EOF
-
-scp -i "${SSH_KEY}" /tmp/requirements.txt "${REMOTE_USER}@${SERVER_HOST}:${REMOTE_DIR}/"
+# 5. 上传requirements.txt
+echo "📝 上传requirements.txt..."
+scp -i "${SSH_KEY}" ./requirements.txt "${REMOTE_USER}@${SERVER_HOST}:${REMOTE_DIR}/"
 
 # 6. 创建启动脚本
 echo "🔧 创建启动脚本..."
@@ -92,10 +92,13 @@ pip install -r requirements.txt
 
 # 设置环境变量
 export FLASK_RUN_PORT=5002
+export LIBRARY_DATA_PATH=/home/ubuntu/mapbox-proxy/城市书房数据.json
+export POPULATION_DATA_PATH=/home/ubuntu/mapbox-proxy/population_grid.bin
+export ISOCHRONE_BUNDLE_PATH=/home/ubuntu/mapbox-proxy/isochrones.geojson
 
-# 启动服务器
+# 启动服务器 (gunicorn + gevent，配置见 gunicorn.conf.py)
 echo "启动Mapbox等时圈代理服务器..."
-python3 app.py
+exec gunicorn -c gunicorn.conf.py wsgi:app
 EOF
 
 scp -i "${SSH_KEY}" /tmp/start_server.sh "${REMOTE_USER}@${SERVER_HOST}:${REMOTE_DIR}/"
@@ -113,7 +116,11 @@ User=ubuntu
 WorkingDirectory=/home/ubuntu/mapbox-proxy
 Environment=PATH=/home/ubuntu/mapbox-proxy/venv/bin
 Environment=FLASK_RUN_PORT=5002
-ExecStart=/home/ubuntu/mapbox-proxy/venv/bin/python app.py
+Environment=LIBRARY_DATA_PATH=/home/ubuntu/mapbox-proxy/城市书房数据.json
+Environment=POPULATION_DATA_PATH=/home/ubuntu/mapbox-proxy/population_grid.bin
+Environment=ISOCHRONE_BUNDLE_PATH=/home/ubuntu/mapbox-proxy/isochrones.geojson
+ExecStart=/home/ubuntu/mapbox-proxy/venv/bin/gunicorn -c gunicorn.conf.py wsgi:app
+ExecReload=/bin/kill -HUP $MAINPID
 Restart=always
 RestartSec=3
 
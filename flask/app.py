@@ -1,12 +1,38 @@
 # app.py
 import os
-from flask import Flask, request, jsonify, Response
+import contextvars
+import functools
+import gzip
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, request, jsonify, Response, g, send_file, send_from_directory
 import requests
 from dotenv import load_dotenv
 from flask_cors import CORS # Import Flask-Cors
 import re
+from isochrone_cache import cache_from_env
+from upstream import UpstreamUnavailable, client_from_env
+from singleflight import SingleFlight, make_flight_key
+from isochrone_backends import IsochroneError, backend_from_env
+import isochrone_simplify
+import coverage
+import site_selection
+import scheduler
+import style_bundle
+import vector_tiles
+from library_store import LibraryStore
+import tile_cache as tile_cache_module
+import metrics
+from log_setup import setup_logging
+import compression
+from static_assets import AssetManifest, DIST_DIR, SITE_DIR, guess_type
 
 load_dotenv() # Load environment variables from .env file
+setup_logging()
+logger = logging.getLogger('proxy')
 
 app = Flask(__name__)
 
@@ -23,9 +49,153 @@ CORS(app, origins=allowed_origins, supports_credentials=True) # Enable CORS for
 MAPBOX_ACCESS_TOKEN = os.getenv('MAPBOX_ACCESS_TOKEN')
 
 if not MAPBOX_ACCESS_TOKEN:
-    print('错误：Mapbox Access Token 未在 .env 文件中设置！')
+    logger.error("Mapbox Access Token 未在 .env 文件中设置！")
     exit(1)
 
+# === 所有代理路由共用的上游客户端 (keep-alive 连接池 + 超时 + 重试) ===
+upstream = client_from_env()
+# 合并同时进行的相同上游请求（等时圈、瓦片、字体、精灵图）
+upstream_flight = SingleFlight()
+
+# === 等时圈响应缓存 (进程内 LRU + 可选 SQLite) ===
+isochrone_cache = cache_from_env()
+
+# === 等时圈后端 (Mapbox 或本地路网) ===
+isochrone_backend = backend_from_env(upstream, MAPBOX_ACCESS_TOKEN)
+
+def isochrone_cache_key(profile, minutes, lng, lat):
+    return isochrone_cache.make_key(profile, minutes, lng, lat, backend=isochrone_backend.name)
+
+# === 批量等时圈：并发上限 ===
+ISOCHRONE_BATCH_CONCURRENCY = int(os.getenv('ISOCHRONE_BATCH_CONCURRENCY', 8))
+ISOCHRONE_BATCH_MAX_POINTS = int(os.getenv('ISOCHRONE_BATCH_MAX_POINTS', 500))
+isochrone_executor = ThreadPoolExecutor(
+    max_workers=ISOCHRONE_BATCH_CONCURRENCY, thread_name_prefix='isochrone')
+
+# === 过期缓存先返回、后台刷新 (stale-while-revalidate) ===
+refresh_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('UPSTREAM_REFRESH_WORKERS', 4)), thread_name_prefix='refresh')
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+def refresh_in_background(cache, key, fn):
+    """已返回过期缓存后在后台调用 fn() 刷新；同一键同时只排队一次，失败只记日志，旧缓存继续可用"""
+    metrics.STALE_SERVED.inc(cache)
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        # 后台刷新排在所有浏览器请求之后
+        scheduler.set_context('background')
+        try:
+            fn()
+            metrics.BACKGROUND_REFRESHES.inc(cache, 'ok')
+        except Exception as e:
+            metrics.BACKGROUND_REFRESHES.inc(cache, 'error')
+            logger.warning("后台刷新失败: %s (%s)", key, e)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    refresh_executor.submit(run)
+
+LIBRARY_DATA_PATH = os.getenv('LIBRARY_DATA_PATH') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'static', 'data', '城市书房数据.json')
+_library_store = None
+
+class DataUnavailable(Exception):
+    """书房数据、人口网格等数据文件不存在，对应 HTTP 503"""
+
+@app.errorhandler(DataUnavailable)
+def data_unavailable(e):
+    logger.error("数据文件缺失: %s", e)
+    return jsonify({"error": "服务端缺少数据文件，暂时无法提供该功能。", "missing": str(e)}), 503
+
+def get_library_store():
+    """书房数据和网格索引，首次调用时从 城市书房数据.json 加载"""
+    global _library_store
+    if _library_store is None:
+        try:
+            _library_store = LibraryStore(LIBRARY_DATA_PATH)
+        except FileNotFoundError as e:
+            raise DataUnavailable(e.filename or LIBRARY_DATA_PATH) from e
+    return _library_store
+
+def validate_isochrone_params(lng, lat, minutes, profile):
+    """校验并转换等时圈参数，非法时抛出 ValueError/TypeError"""
+    lng_float = float(lng)
+    lat_float = float(lat)
+    minutes_int = int(minutes)
+    if not (1 <= minutes_int <= 60):
+        raise ValueError("Minutes out of range")
+    if profile not in ['walking', 'cycling', 'driving']:
+        raise ValueError("Invalid profile")
+    return lng_float, lat_float, minutes_int, profile
+
+def fetch_isochrone(profile, minutes, lng, lat):
+    """用当前后端计算等时圈 GeoJSON 并写入缓存，坐标需已吸附；失败时抛出异常。
+
+    相同参数的并发调用只会计算（或向 Mapbox 请求）一次。
+    """
+    def fetch():
+        data = isochrone_backend.isochrone(profile, minutes, lng, lat)
+        isochrone_cache.set(isochrone_cache_key(profile, minutes, lng, lat), data)
+        return data
+
+    return upstream_flight.do(f"isochrone:{isochrone_backend.name}:{profile}:{minutes}:{lng},{lat}", fetch)
+
+def simplified_isochrone(key, data, options):
+    """按 zoom / precision 简化的等时圈，简化结果与原始结果存在同一个缓存中；options 为 None 时返回原始结果。
+
+    简化结果的键带上原始条目的存入时间，原始结果在后台刷新后不会再返回旧几何的简化结果；
+    这里的读取不计入缓存命中率，命中率只反映原始等时圈。
+    """
+    if options is None:
+        return data
+    cached, stored_at = isochrone_cache.peek(key, allow_stale=True)
+    if cached is None or (cached is not data and cached != data):
+        # 原始结果不在缓存中（已被淘汰）或刚被刷新为另一个版本，无法对应存入时间，只计算不缓存
+        return isochrone_simplify.simplify_collection(data, options)
+    variant_key = isochrone_cache.variant_key(key, stored_at, isochrone_simplify.variant_key(options))
+    simplified, _ = isochrone_cache.peek(variant_key, allow_stale=True)
+    if simplified is None:
+        simplified = isochrone_simplify.simplify_collection(data, options)
+        isochrone_cache.set(variant_key, simplified)
+    return simplified
+
+def describe_isochrone_error(e):
+    """把计算等时圈（请求 Mapbox）时的异常转换为 (错误信息 dict, HTTP 状态码)"""
+    if isinstance(e, IsochroneError):
+        logger.info("无法计算等时圈: %s", e)
+        return {"error": "无法计算等时圈。", "details": str(e)}, 422
+    if isinstance(e, scheduler.Overloaded):
+        logger.info("上游请求排队已满: %s", e)
+        return {"error": "请求过多，请稍后重试。", "retry_after": e.retry_after}, 429
+    if isinstance(e, UpstreamUnavailable):
+        logger.info("Mapbox 熔断中，直接返回: %s", e)
+        return {"error": "Mapbox 暂时不可用，请稍后重试。", "retry_after": round(e.retry_after)}, 503
+    if isinstance(e, requests.exceptions.Timeout):
+        logger.warning("请求 Mapbox 超时")
+        return {"error": "请求 Mapbox 超时。"}, 504 # Gateway Timeout
+    if isinstance(e, requests.exceptions.HTTPError):
+        logger.warning("Mapbox API HTTP 错误: %s", e.response.status_code)
+        try:
+            error_details = e.response.json().get('message', '无法获取等时圈数据')
+        except ValueError: # Handle cases where error response is not JSON
+            error_details = e.response.text
+        return {
+            "error": f"Mapbox API 错误 (状态码: {e.response.status_code})",
+            "details": error_details
+            }, e.response.status_code
+    if isinstance(e, requests.exceptions.RequestException):
+        # Catch other potential request errors (DNS failure, connection error etc.)
+        logger.warning("请求 Mapbox 时出错: %s", e)
+        return {"error": "连接 Mapbox 时出错。"}, 502 # Bad Gateway
+    logger.exception("代理服务器内部错误: %s", e)
+    return {"error": "代理服务器内部错误。"}, 500
+
 @app.route('/api/isochrone', methods=['GET'])
 def isochrone_proxy():
     lng = request.args.get('lng')
@@ -35,214 +205,862 @@ def isochrone_proxy():
 
     # --- Input Validation ---
     try:
-        lng_float = float(lng)
-        lat_float = float(lat)
-        minutes_int = int(minutes)
-        if not (1 <= minutes_int <= 60):
-            raise ValueError("Minutes out of range")
-        if profile not in ['walking', 'cycling', 'driving']:
-             raise ValueError("Invalid profile")
+        lng_float, lat_float, minutes_int, profile = validate_isochrone_params(lng, lat, minutes, profile)
+        simplify = isochrone_simplify.parse_options(
+            request.args.get('zoom'), request.args.get('precision'), request.args.get('encoding'))
     except (TypeError, ValueError, AttributeError) as e:
-         print(f"输入验证错误: {e}")
-         return jsonify({"error": "无效的输入参数(lng, lat, minutes, profile)。"}), 400
+         logger.info("输入验证错误: %s", e)
+         return jsonify({"error": "无效的输入参数(lng, lat, minutes, profile, zoom, precision, encoding)。"}), 400
     # --- End Validation ---
 
-    mapbox_url = f"https://api.mapbox.com/isochrone/v1/mapbox/{profile}/{lng_float},{lat_float}"
-    params = {
-        'contours_minutes': minutes_int,
-        'polygons': 'true',
-        'access_token': MAPBOX_ACCESS_TOKEN
-    }
+    # 坐标吸附到缓存网格，上游也请求吸附后的坐标，保证同一缓存键对应同一结果
+    lng_float, lat_float = isochrone_cache.snap(lng_float, lat_float)
+    cache_key = isochrone_cache_key(profile, minutes_int, lng_float, lat_float)
+    cached, stale = isochrone_cache.lookup(cache_key)
+    if cached is not None:
+        if stale:
+            refresh_in_background('isochrone', cache_key, lambda: fetch_isochrone(
+                profile, minutes_int, lng_float, lat_float))
+        response = jsonify(simplified_isochrone(cache_key, cached, simplify))
+        response.headers['X-Cache'] = 'STALE' if stale else 'HIT'
+        return response
 
-    print(f"收到代理请求: {request.url}")
-    print(f"转发到 Mapbox: {mapbox_url} (参数: {params})")
+    logger.debug("等时圈缓存未命中: %s %s %s,%s", profile, minutes_int, lng_float, lat_float)
 
     try:
-        response = requests.get(mapbox_url, params=params, timeout=10) # 10 second timeout
-        response.raise_for_status() # Raises an HTTPError for bad responses (4xx or 5xx)
-
-        print(f"Mapbox 响应状态: {response.status_code}")
+        data = fetch_isochrone(profile, minutes_int, lng_float, lat_float)
         # Forward the successful response (GeoJSON data)
-        return jsonify(response.json())
-
-    except requests.exceptions.Timeout:
-        print("请求 Mapbox 超时")
-        return jsonify({"error": "请求 Mapbox 超时。"}), 504 # Gateway Timeout
-    except requests.exceptions.HTTPError as e:
-         print(f"Mapbox API HTTP 错误: {e.response.status_code}")
-         try:
-             error_details = e.response.json().get('message', '无法获取等时圈数据')
-         except ValueError: # Handle cases where error response is not JSON
-             error_details = e.response.text
-         return jsonify({
-             "error": f"Mapbox API 错误 (状态码: {e.response.status_code})",
-             "details": error_details
-             }), e.response.status_code
-    except requests.exceptions.RequestException as e:
-        # Catch other potential request errors (DNS failure, connection error etc.)
-        print(f"请求 Mapbox 时出错: {e}")
-        return jsonify({"error": "连接 Mapbox 时出错。"}), 502 # Bad Gateway
+        proxied_response = jsonify(simplified_isochrone(cache_key, data, simplify))
+        proxied_response.headers['X-Cache'] = 'MISS'
+        return proxied_response
     except Exception as e:
-        print(f"代理服务器内部错误: {e}")
-        return jsonify({"error": "代理服务器内部错误。"}), 500
+        error, status = describe_isochrone_error(e)
+        response = jsonify(error)
+        if 'retry_after' in error:
+            response.headers['Retry-After'] = str(error['retry_after'])
+        return response, status
+
+# === 新增：批量等时圈 (NDJSON 流式返回) ===
+@app.route('/api/isochrones/batch', methods=['POST'])
+def isochrone_batch():
+    """批量获取等时圈。
+
+    请求体 JSON：{"points": [{"id": ..., "lng": ..., "lat": ...}], "library_ids": [1, 2],
+    "minutes": 15, "profile": "walking"}，points 与 library_ids 至少提供一个；
+    可选 zoom / precision / encoding，含义与 /api/isochrone 相同。
+    每完成一个就输出一行 JSON（application/x-ndjson），缓存命中的最先返回。
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "请求体必须是 JSON 对象。"}), 400
+
+    try:
+        _, _, minutes_int, profile = validate_isochrone_params(
+            0, 0, body.get('minutes', 15), body.get('profile', 'walking'))
+        simplify = isochrone_simplify.parse_options(body.get('zoom'), body.get('precision'), body.get('encoding'))
+        points = list(body.get('points') or [])
+        library_ids = list(body.get('library_ids') or [])
+    except (TypeError, ValueError) as e:
+        logger.info("批量等时圈输入验证错误: %s", e)
+        return jsonify({"error": "无效的输入参数(points, library_ids, minutes, profile, zoom, precision, encoding)。"}), 400
+
+    # 单个点或书房 id 无效时只有该项返回错误行，其余照常计算
+    items = []
+    for point in points:
+        try:
+            lng_float, lat_float, _, _ = validate_isochrone_params(point['lng'], point['lat'], minutes_int, profile)
+            items.append((point.get('id'), lng_float, lat_float, None))
+        except (TypeError, ValueError, KeyError, AttributeError) as e:
+            logger.info("批量等时圈坐标无效: %s", e)
+            item_id = point.get('id') if isinstance(point, dict) else None
+            items.append((item_id, None, None, ({"error": "无效的坐标(lng, lat)。"}, 400)))
+    library_store = get_library_store() if library_ids else None
+    for library_id in library_ids:
+        try:
+            lng_float, lat_float = library_store.coordinates(int(library_id))
+            items.append((library_id, lng_float, lat_float, None))
+        except (TypeError, ValueError):
+            items.append((library_id, None, None, ({"error": "无效的书房 id。"}, 400)))
+        except KeyError:
+            items.append((library_id, None, None, ({"error": "书房不存在。"}, 404)))
+
+    if not items:
+        return jsonify({"error": "points 和 library_ids 不能同时为空。"}), 400
+    if len(items) > ISOCHRONE_BATCH_MAX_POINTS:
+        return jsonify({"error": f"单次最多 {ISOCHRONE_BATCH_MAX_POINTS} 个点。"}), 400
+
+    logger.info("批量等时圈请求: %d 个点", len(items), extra={"profile": profile, "minutes": minutes_int})
+    client = scheduler.current_context()[1]
+
+    def generate():
+        # 批量请求排在交互请求之后；工作线程中沿用这里的优先级和客户端
+        scheduler.set_context('bulk', client)
+        pending = {}
+        failed = 0
+        for index, (item_id, lng_float, lat_float, invalid) in enumerate(items):
+            if invalid is not None:
+                error, status = invalid
+                failed += 1
+                yield json.dumps(dict(error, id=item_id, index=index, status=status), ensure_ascii=False) + '\n'
+                continue
+            lng_float, lat_float = isochrone_cache.snap(lng_float, lat_float)
+            result = {"id": item_id, "index": index, "lng": lng_float, "lat": lat_float}
+            cache_key = isochrone_cache_key(profile, minutes_int, lng_float, lat_float)
+            cached, stale = isochrone_cache.lookup(cache_key)
+            if cached is not None:
+                if stale:
+                    refresh_in_background('isochrone', cache_key, functools.partial(
+                        fetch_isochrone, profile, minutes_int, lng_float, lat_float))
+                data = simplified_isochrone(cache_key, cached, simplify)
+                yield json.dumps(dict(result, status=200, cache='STALE' if stale else 'HIT', data=data),
+                                 ensure_ascii=False) + '\n'
+                continue
+            future = isochrone_executor.submit(
+                contextvars.copy_context().run, fetch_isochrone, profile, minutes_int, lng_float, lat_float)
+            pending[future] = (result, cache_key)
+
+        for future in as_completed(pending):
+            result, cache_key = pending[future]
+            try:
+                result.update(status=200, cache='MISS', data=simplified_isochrone(cache_key, future.result(), simplify))
+            except Exception as e:
+                error, status = describe_isochrone_error(e)
+                result.update(error, status=status)
+                failed += 1
+            yield json.dumps(result, ensure_ascii=False) + '\n'
+
+        yield json.dumps({"done": True, "total": len(items), "failed": failed}) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+# === 新增：人口覆盖统计 ===
+POPULATION_DATA_PATH = os.getenv('POPULATION_DATA_PATH') or coverage.default_population_path()
+ISOCHRONE_BUNDLE_PATH = os.getenv('ISOCHRONE_BUNDLE_PATH') or coverage.ISOCHRONE_BUNDLE_PATH
+_coverage_analyzer = None
+
+def get_coverage_analyzer():
+    """人口网格和书房分区只在第一次请求时加载"""
+    global _coverage_analyzer
+    if _coverage_analyzer is None:
+        library_store = get_library_store()
+        try:
+            _coverage_analyzer = coverage.CoverageAnalyzer(POPULATION_DATA_PATH, library_store)
+        except FileNotFoundError as e:
+            raise DataUnavailable(e.filename or POPULATION_DATA_PATH) from e
+    return _coverage_analyzer
+
+@app.route('/api/coverage', methods=['GET'])
+def coverage_stats():
+    """按区县统计书房等时圈覆盖 / 未覆盖的人口。
+
+    source=auto（默认）先取等时圈缓存，缓存里没有的书房再用静态等时圈包；
+    source=cache / bundle 只用其中一种。不会为此请求上游。
+    """
+    minutes = request.args.get('minutes', '15')
+    profile = request.args.get('profile', 'walking')
+    source = request.args.get('source', 'auto')
+    try:
+        _, _, minutes_int, profile = validate_isochrone_params(0, 0, minutes, profile)
+        if source not in ('auto', 'cache', 'bundle'):
+            raise ValueError("Invalid source")
+    except (TypeError, ValueError) as e:
+        logger.info("覆盖统计输入验证错误: %s", e)
+        return jsonify({"error": "无效的输入参数(minutes, profile, source)。"}), 400
+
+    analyzer = get_coverage_analyzer()
+    geometries = {}
+    from_cache = 0
+    if source in ('auto', 'cache'):
+        # 一次批量读取，不计入等时圈缓存的命中率统计
+        keys = {library['id']: isochrone_cache_key(profile, minutes_int, library['lng'], library['lat'])
+                for library in analyzer.libraries}
+        found = isochrone_cache.peek_many(list(keys.values()))
+        for library in analyzer.libraries:
+            cached, _ = found.get(keys[library['id']], (None, None))
+            polygons = coverage.prepare_geometry(coverage.isochrone_geometry(cached, minutes_int)) if cached else []
+            if polygons:
+                geometries[library['id']] = polygons
+        from_cache = len(geometries)
+    if source in ('auto', 'bundle'):
+        for library_id, geometry in coverage.isochrones_from_bundle(
+                profile, minutes_int, ISOCHRONE_BUNDLE_PATH).items():
+            geometries.setdefault(library_id, geometry)
+
+    result = analyzer.analyze(geometries)
+    result.update(profile=profile, minutes=minutes_int,
+                  sources={"cache": from_cache, "bundle": len(geometries) - from_cache})
+    return jsonify(result)
+
+# === 新增：新书房选址 (贪心最大覆盖) ===
+SITE_SELECTION_MAX_K = 50
+SITE_SELECTION_MAX_RADIUS_M = 20000
+_site_selector = None
+
+def get_site_selector():
+    """与覆盖统计共用人口网格和书房数据"""
+    global _site_selector
+    if _site_selector is None:
+        _site_selector = site_selection.SiteSelector(
+            get_coverage_analyzer(), get_library_store(), ISOCHRONE_BUNDLE_PATH)
+    return _site_selector
+
+@app.route('/api/site-selection', methods=['GET'])
+def site_selection_proposals():
+    """推荐 k 个新增覆盖人口最多的书房位置。
+
+    覆盖预算为 radius_m（米），或 profile + minutes（换算为直线距离，现有书房优先按静态等时圈计算覆盖）；
+    district 只在该区县内选点，per_district=1 时每个区县各选 k 个。
+    """
+    district = request.args.get('district') or None
+    per_district = request.args.get('per_district') == '1'
+    try:
+        k = int(request.args.get('k', 5))
+        if not (1 <= k <= SITE_SELECTION_MAX_K):
+            raise ValueError("k out of range")
+        _, _, minutes_int, profile = validate_isochrone_params(
+            0, 0, request.args.get('minutes', '15'), request.args.get('profile', 'walking'))
+        radius_m = request.args.get('radius_m')
+        if radius_m is not None:
+            radius_m = float(radius_m)
+            if not (0 < radius_m <= SITE_SELECTION_MAX_RADIUS_M):
+                raise ValueError("radius_m out of range")
+        selector = get_site_selector()
+        if district is not None and district not in selector.analyzer.districts:
+            raise ValueError(f"Unknown district: {district}")
+    except (TypeError, ValueError) as e:
+        logger.info("选址输入验证错误: %s", e)
+        return jsonify({"error": f"无效的输入参数(k, radius_m, profile, minutes, district)，k 取 1-{SITE_SELECTION_MAX_K}，"
+                                 f"radius_m 不超过 {SITE_SELECTION_MAX_RADIUS_M}。"}), 400
+
+    options = dict(radius_m=radius_m, profile=profile, minutes=minutes_int)
+    if per_district:
+        return jsonify({"k": k, "districts": selector.select_per_district(k, **options)})
+    return jsonify(selector.select(k, district=district, **options))
+
+# === 新增：书房最近邻 / 半径查询 ===
+LIBRARY_QUERY_MAX_K = 50
+LIBRARY_QUERY_MAX_RADIUS_M = 50000
+
+def parse_point(args):
+    """从查询参数读取 lng/lat，非法时抛出 ValueError/TypeError"""
+    lng_float = float(args.get('lng'))
+    lat_float = float(args.get('lat'))
+    if not (-180 <= lng_float <= 180 and -90 <= lat_float <= 90):
+        raise ValueError("Coordinates out of range")
+    return lng_float, lat_float
+
+@app.route('/api/libraries/nearest', methods=['GET'])
+def libraries_nearest():
+    """离 (lng, lat) 最近的 k 个书房（默认 5 个），附带大圆距离 distance_m"""
+    try:
+        lng_float, lat_float = parse_point(request.args)
+        k = int(request.args.get('k', 5))
+        if not (1 <= k <= LIBRARY_QUERY_MAX_K):
+            raise ValueError("k out of range")
+    except (TypeError, ValueError) as e:
+        logger.info("最近书房查询输入验证错误: %s", e)
+        return jsonify({"error": f"无效的输入参数(lng, lat, k)，k 取 1-{LIBRARY_QUERY_MAX_K}。"}), 400
+    libraries = get_library_store().nearest(lng_float, lat_float, k)
+    return jsonify({"lng": lng_float, "lat": lat_float, "count": len(libraries), "libraries": libraries})
+
+@app.route('/api/libraries/within', methods=['GET'])
+def libraries_within():
+    """(lng, lat) 周围 radius_m 米（默认 1200，即步行约 15 分钟）内的书房，按距离排序"""
+    try:
+        lng_float, lat_float = parse_point(request.args)
+        radius_m = float(request.args.get('radius_m', 1200))
+        if not (0 < radius_m <= LIBRARY_QUERY_MAX_RADIUS_M):
+            raise ValueError("radius_m out of range")
+    except (TypeError, ValueError) as e:
+        logger.info("半径书房查询输入验证错误: %s", e)
+        return jsonify({"error": f"无效的输入参数(lng, lat, radius_m)，radius_m 不超过 {LIBRARY_QUERY_MAX_RADIUS_M}。"}), 400
+    libraries = get_library_store().within(lng_float, lat_float, radius_m)
+    return jsonify({"lng": lng_float, "lat": lat_float, "radius_m": radius_m,
+                    "count": len(libraries), "libraries": libraries})
+
+# === 新增：等时圈缓存统计 ===
+@app.route('/api/isochrone/cache/stats')
+def isochrone_cache_stats():
+    """返回等时圈缓存的命中/未命中计数"""
+    return jsonify(isochrone_cache.stats())
+
+# === 新增：上游连接池统计 ===
+@app.route('/api/upstream/stats')
+def upstream_stats():
+    """返回上游客户端的请求数、并发峰值、连接池饱和次数和合并请求数"""
+    stats = upstream.stats()
+    stats['coalesced'] = upstream_flight.stats()
+    return jsonify(stats)
+
+# === 上游响应透传 (流式或缓冲) ===
+PROXY_STREAMING = os.getenv('PROXY_STREAMING', '1') != '0'
+PROXY_CHUNK_SIZE = int(os.getenv('PROXY_CHUNK_SIZE', 64 * 1024))
+# 透传给浏览器的上游响应头；Content-Encoding/Content-Length 只在流式模式下原样保留
+PASSTHROUGH_HEADERS = ('Content-Encoding', 'Content-Length', 'ETag', 'Last-Modified', 'Cache-Control')
+
+def fetch_passthrough(mapbox_url, params):
+    """请求需要原样透传的上游资源，非 2xx 时关闭连接并抛出 HTTPError"""
+    headers = None
+    if PROXY_STREAMING:
+        # 让上游按浏览器能解码的编码返回，之后不解压直接转发 (例如 gzip 压缩的 PBF 瓦片)
+        headers = {'Accept-Encoding': request.headers.get('Accept-Encoding', 'identity')}
+    response = upstream.get(mapbox_url, params=params, headers=headers, stream=PROXY_STREAMING)
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError:
+        response.close()
+        raise
+    return response
+
+def passthrough_response(response, default_content_type=None):
+    """把上游响应体原样转发：流式模式下按块转发未解码的字节，否则一次性读入内存"""
+    content_type = response.headers.get('Content-Type', default_content_type)
+    headers = {name: response.headers[name] for name in PASSTHROUGH_HEADERS if name in response.headers}
+    if not PROXY_STREAMING:
+        # response.content 已被 requests 解压，不能再声明上游的编码和长度
+        headers.pop('Content-Encoding', None)
+        headers.pop('Content-Length', None)
+        return Response(response.content, status=response.status_code,
+                        content_type=content_type, headers=headers)
+
+    def generate():
+        try:
+            yield from response.raw.stream(PROXY_CHUNK_SIZE, decode_content=False)
+        finally:
+            response.close()
+
+    proxied_response = Response(generate(), status=response.status_code,
+                                content_type=content_type, headers=headers)
+    # 转发的字节取决于浏览器的 Accept-Encoding
+    proxied_response.vary.add('Accept-Encoding')
+    return proxied_response
+
+def proxy_error_response(e, error):
+    """代理路由的错误响应：调度器排队已满返回 429，熔断中返回 503，均带 Retry-After；其他错误返回 500"""
+    if isinstance(e, (scheduler.Overloaded, UpstreamUnavailable)):
+        retry_after = max(1, round(e.retry_after))
+        response = jsonify(dict(error, retry_after=retry_after))
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 429 if isinstance(e, scheduler.Overloaded) else 503
+    return jsonify(error), 500
+
+# === 瓦片 / 字体 / 精灵图磁盘缓存 ===
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+tile_cache = tile_cache_module.cache_from_env(os.path.join(APP_DIR, 'cache', 'mapbox'))
+# 浏览器端缓存时间：字体按 Unicode 区间切分，内容基本不变；瓦片和精灵图随样式更新
+CACHE_CONTROL = {
+    'tiles': f"public, max-age={int(os.getenv('TILE_BROWSER_MAX_AGE', 24 * 3600))}",
+    'fonts': f"public, max-age={int(os.getenv('FONT_BROWSER_MAX_AGE', 30 * 24 * 3600))}, immutable",
+    'sprites': f"public, max-age={int(os.getenv('SPRITE_BROWSER_MAX_AGE', 24 * 3600))}",
+}
+
+def cached_response(kind, entry, default_content_type=None):
+    """从缓存条目构造响应，浏览器的 If-None-Match 命中时返回 304；对象文件已不存在时返回 None"""
+    proxied_response = Response(content_type=entry.get('content_type') or default_content_type)
+    proxied_response.set_etag(entry['sha'][:32])
+    proxied_response.headers['Cache-Control'] = CACHE_CONTROL[kind]
+    if entry.get('last_modified'):
+        proxied_response.headers['Last-Modified'] = entry['last_modified']
+    proxied_response.vary.add('Accept-Encoding')
+    # 弱比较：动态压缩后 ETag 会变为弱 ETag
+    if request.if_none_match.contains_weak(entry['sha'][:32]):
+        proxied_response.status_code = 304
+        return proxied_response
+
+    body = tile_cache.read(entry)
+    if body is None:
+        return None
+    encoding = entry.get('content_encoding')
+    if encoding and request.accept_encodings.best_match([encoding]):
+        proxied_response.headers['Content-Encoding'] = encoding
+    elif encoding == 'gzip':
+        body = gzip.decompress(body)
+    proxied_response.set_data(body)
+    return proxied_response
+
+def cached_proxy(kind, upstream_path, params, default_content_type=None):
+    """带磁盘缓存的透传：新鲜的缓存直接返回，过期的向上游做条件请求，未启用缓存时流式透传"""
+    if tile_cache is None:
+        return passthrough_response(fetch_passthrough(upstream.url(upstream_path), params), default_content_type)
+
+    key = tile_cache_module.make_cache_key(kind, upstream_path, params)
+    entry = tile_cache.lookup(kind, key)
+    if entry is None or not tile_cache.is_fresh(entry):
+        stale = entry
+        fill = lambda: upstream_flight.do(
+            make_flight_key(upstream.url(upstream_path), params),
+            lambda: tile_cache.fill(upstream, kind, key, upstream_path, params, stale))
+        if stale is not None and tile_cache.is_servable_stale(stale):
+            # 先返回旧数据，条件请求放到后台
+            refresh_in_background(kind, key, fill)
+        else:
+            # 未缓存或超过过期上限：同步请求，失败时不再返回旧数据
+            entry = fill()
+    response = cached_response(kind, entry, default_content_type)
+    if response is None:
+        # 缓存目录由所有 worker 共用，对象文件可能在 lookup 之后被其他 worker 淘汰，按未命中重新完整请求
+        logger.info("缓存对象已被淘汰，重新请求上游: %s", key)
+        entry = upstream_flight.do(
+            make_flight_key(upstream.url(upstream_path), params),
+            lambda: tile_cache.fill(upstream, kind, key, upstream_path, params))
+        response = cached_response(kind, entry, default_content_type)
+    if response is None:
+        # 刚写入又被淘汰（缓存上限过小时才会发生），直接透传
+        return passthrough_response(fetch_passthrough(upstream.url(upstream_path), params), default_content_type)
+    return response
+
+# === 新增：瓦片缓存统计 ===
+@app.route('/api/tiles/cache/stats')
+def tile_cache_stats():
+    """返回瓦片/字体/精灵图磁盘缓存的命中率和占用空间"""
+    if tile_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(tile_cache.stats(), enabled=True))
+
+# === 新增：人口 / 书房矢量瓦片 (MVT) ===
+VECTOR_TILE_MAX_ZOOM = int(os.getenv('VECTOR_TILE_MAX_ZOOM', 14))
+VECTOR_TILE_CACHE_SIZE = int(os.getenv('VECTOR_TILE_CACHE_SIZE', 4096))
+VECTOR_TILE_CACHE_CONTROL = f"public, max-age={int(os.getenv('VECTOR_TILE_BROWSER_MAX_AGE', 3600))}"
+_vector_tile_service = None
+
+def get_vector_tile_service():
+    """金字塔在第一次请求时构建，与覆盖统计使用同一份人口网格"""
+    global _vector_tile_service
+    if _vector_tile_service is None:
+        libraries = get_library_store().libraries
+        try:
+            grid = coverage.load_population_grid(POPULATION_DATA_PATH)
+        except FileNotFoundError as e:
+            raise DataUnavailable(e.filename or POPULATION_DATA_PATH) from e
+        _vector_tile_service = vector_tiles.VectorTileService(
+            grid, libraries, VECTOR_TILE_MAX_ZOOM, VECTOR_TILE_CACHE_SIZE)
+    return _vector_tile_service
+
+@app.route('/api/tiles/<any(population, libraries):layer>/<int:z>/<int:x>/<int:y>.pbf')
+def vector_tile(layer, z, x, y):
+    """人口网格 / 书房的 MVT 瓦片，低缩放级别下为合并后的点；空瓦片返回 204"""
+    service = get_vector_tile_service()
+    try:
+        entry = service.tile(layer, z, x, y)
+    except ValueError as e:
+        logger.info("矢量瓦片参数错误: %s", e)
+        return jsonify({"error": f"瓦片坐标超出范围，z 取 0-{service.max_zoom}。"}), 404
+    if not entry['body']:
+        response = Response(status=204, content_type='application/vnd.mapbox-vector-tile')
+        response.headers['Cache-Control'] = VECTOR_TILE_CACHE_CONTROL
+        return response
+
+    response = Response(content_type='application/vnd.mapbox-vector-tile')
+    response.set_etag(entry['etag'])
+    response.headers['Cache-Control'] = VECTOR_TILE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    if request.if_none_match.contains_weak(entry['etag']):
+        response.status_code = 304
+        return response
+    body, encoding = service.encoded_body(entry, compression.best_encoding(request.accept_encodings))
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.set_data(body)
+    return response
+
+@app.route('/api/tiles/<any(population, libraries):layer>.json')
+def vector_tilejson(layer):
+    """TileJSON，可直接作为 Mapbox GL 样式中 vector 数据源的 url"""
+    tiles_url = request.url_root.rstrip('/') + f"/api/tiles/{layer}/{{z}}/{{x}}/{{y}}.pbf"
+    return jsonify(get_vector_tile_service().tilejson(layer, tiles_url))
 
 # === 新增：代理 Mapbox 样式请求 ===
 @app.route('/api/mapbox/styles/v1/<path:style_path>')
 def styles_proxy(style_path):
     """代理 Mapbox 样式请求，例如：mapbox://styles/mapbox/dark-v10"""
-    mapbox_url = f"https://api.mapbox.com/styles/v1/{style_path}"
+    mapbox_url = upstream.url(f"styles/v1/{style_path}")
     params = {'access_token': MAPBOX_ACCESS_TOKEN}
     
-    print(f"样式代理请求: {style_path}")
+    logger.debug("样式代理请求: %s", style_path)
     
     try:
-        response = requests.get(mapbox_url, params=params, timeout=10)
-        response.raise_for_status()
-        return jsonify(response.json())
+        # 样式 JSON 无需改写，直接透传原始字节，省去解析/序列化
+        return passthrough_response(fetch_passthrough(mapbox_url, params), 'application/json')
     except Exception as e:
-        print(f"样式代理错误: {e}")
-        return jsonify({"error": "无法获取地图样式"}), 500
+        logger.warning("样式代理错误: %s", e)
+        return proxy_error_response(e, {"error": "无法获取地图样式"})
 
 # === 新增：代理 Mapbox 矢量瓦片数据源请求 ===
 @app.route('/api/mapbox/v4/<path:tile_source_path>.json')
 def vector_source_proxy(tile_source_path):
     """代理矢量瓦片数据源请求，例如：mapbox://mapbox.mapbox-streets-v8"""
-    mapbox_url = f"https://api.mapbox.com/v4/{tile_source_path}.json"
+    mapbox_url = upstream.url(f"v4/{tile_source_path}.json")
     params = {'access_token': MAPBOX_ACCESS_TOKEN, 'secure': True}
     
-    print(f"矢量数据源代理请求: {tile_source_path}")
+    logger.debug("矢量数据源代理请求: %s", tile_source_path)
     
     try:
-        response = requests.get(mapbox_url, params=params, timeout=10)
+        response = upstream.get(mapbox_url, params=params)
         response.raise_for_status()
         source_json = response.json()
         
         # 替换URL，指向我们的代理
         if 'tiles' in source_json:
-            original_tiles = source_json['tiles']
-            proxied_tiles = []
-            for tile_url in original_tiles:
-                # 从原始URL中提取域名后的路径
-                tile_path = re.sub(r'^https?://[^/]+', '', tile_url)
-                # 指向我们的代理
-                proxied_url = f"/api/mapbox/tiles{tile_path}"
-                proxied_tiles.append(proxied_url)
-            source_json['tiles'] = proxied_tiles
+            source_json['tiles'] = style_bundle.proxy_tiles(source_json['tiles'])
         
         return jsonify(source_json)
     except Exception as e:
-        print(f"矢量数据源代理错误: {e}")
-        return jsonify({"error": "无法获取矢量数据源"}), 500
+        logger.warning("矢量数据源代理错误: %s", e)
+        return proxy_error_response(e, {"error": "无法获取矢量数据源"})
 
 # === 新增：代理 Mapbox 瓦片请求 ===
 @app.route('/api/mapbox/tiles/<path:tile_path>')
 def tiles_proxy(tile_path):
     """代理实际的瓦片请求"""
-    mapbox_url = f"https://api.mapbox.com/tiles/{tile_path}"
     # 对于瓦片，我们需要保留所有查询参数
     params = dict(request.args)
     params['access_token'] = MAPBOX_ACCESS_TOKEN
     
-    print(f"瓦片代理请求: {tile_path}")
+    logger.debug("瓦片代理请求: %s", tile_path)
     
     try:
-        response = requests.get(mapbox_url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        # 创建响应，保留原始内容类型
-        proxied_response = Response(
-            response.content, 
-            status=response.status_code,
-            content_type=response.headers.get('Content-Type')
-        )
-        return proxied_response
+        return cached_proxy('tiles', f"tiles/{tile_path}", params)
     except Exception as e:
-        print(f"瓦片代理错误: {e}")
-        return jsonify({"error": "无法获取地图瓦片"}), 500
+        logger.warning("瓦片代理错误: %s", e)
+        return proxy_error_response(e, {"error": "无法获取地图瓦片"})
 
 # === 新增：代理 Mapbox 字体请求 ===
 @app.route('/api/mapbox/fonts/v1/<path:font_path>')
 def fonts_proxy(font_path):
     """代理字体请求，例如：mapbox://fonts/mapbox/{fontstack}/{range}.pbf"""
-    mapbox_url = f"https://api.mapbox.com/fonts/v1/{font_path}"
     params = {'access_token': MAPBOX_ACCESS_TOKEN}
     
-    print(f"字体代理请求: {font_path}")
+    logger.debug("字体代理请求: %s", font_path)
     
     try:
-        response = requests.get(mapbox_url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        # 创建响应，保留原始内容类型
-        proxied_response = Response(
-            response.content, 
-            status=response.status_code,
-            content_type=response.headers.get('Content-Type', 'application/x-protobuf')
-        )
-        return proxied_response
+        return cached_proxy('fonts', f"fonts/v1/{font_path}", params, 'application/x-protobuf')
     except Exception as e:
-        print(f"字体代理错误: {e}")
-        return jsonify({"error": "无法获取地图字体"}), 500
+        logger.warning("字体代理错误: %s", e)
+        return proxy_error_response(e, {"error": "无法获取地图字体"})
 
 # === 新增：代理 Mapbox 精灵图请求 ===
 @app.route('/api/mapbox/sprites/v1/<path:sprite_path>')
 def sprites_proxy(sprite_path):
     """代理精灵图请求"""
-    mapbox_url = f"https://api.mapbox.com/sprites/v1/{sprite_path}"
     params = {'access_token': MAPBOX_ACCESS_TOKEN}
     
-    print(f"精灵图代理请求: {sprite_path}")
+    logger.debug("精灵图代理请求: %s", sprite_path)
     
     try:
-        response = requests.get(mapbox_url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        # 创建响应，保留原始内容类型
-        proxied_response = Response(
-            response.content, 
-            status=response.status_code,
-            content_type=response.headers.get('Content-Type')
-        )
-        return proxied_response
+        return cached_proxy('sprites', f"sprites/v1/{sprite_path}", params)
     except Exception as e:
-        print(f"精灵图代理错误: {e}")
-        return jsonify({"error": "无法获取地图精灵图"}), 500
+        logger.warning("精灵图代理错误: %s", e)
+        return proxy_error_response(e, {"error": "无法获取地图精灵图"})
+
+# === 新增：样式包 (样式 + 内联 TileJSON + 改写后的精灵图 / 字体 / 瓦片地址) ===
+STYLE_BUNDLE_TTL = int(os.getenv('STYLE_BUNDLE_TTL', 300))
+STYLE_BUNDLE_CACHE_CONTROL = f"public, max-age={int(os.getenv('STYLE_BUNDLE_BROWSER_MAX_AGE', 300))}"
+style_bundles = style_bundle.StyleBundleCache(
+    STYLE_BUNDLE_TTL, max_stale=float(os.getenv('STYLE_BUNDLE_STALE_MAX', 24 * 3600)))
+
+def fetch_mapbox_json(path, params):
+    """返回 (解析后的 JSON, 原始字节)，非 2xx 时抛出 HTTPError"""
+    response = upstream.get(upstream.url(path), params=params)
+    response.raise_for_status()
+    return response.json(), response.content
+
+@app.route('/api/style-bundle/<owner>/<style_id>')
+def style_bundle_proxy(owner, style_id):
+    """一次返回可直接交给 Mapbox GL 的样式：数据源已内联 TileJSON，所有地址指向本代理"""
+    style_path = f"{owner}/{style_id}"
+    # 改写后的地址是绝对地址，不同的访问域名分别缓存
+    base = request.url_root.rstrip('/')
+    key = (style_path, base)
+    entry, state = style_bundles.lookup(key)
+    if state != 'fresh':
+        params = {'access_token': MAPBOX_ACCESS_TOKEN}
+        refresh = lambda: upstream_flight.do(f"style-bundle:{style_path}|{base}", lambda: style_bundles.refresh(
+            key,
+            lambda: fetch_mapbox_json(f"styles/v1/{style_path}", params),
+            lambda tileset: fetch_mapbox_json(f"v4/{tileset}.json", dict(params, secure=True))[0],
+            base, logger))
+        if state == 'stale':
+            # 先返回旧的样式包，重新获取样式放到后台
+            refresh_in_background('style_bundle', key, refresh)
+        else:
+            try:
+                entry = refresh()
+            except requests.exceptions.RequestException as e:
+                logger.warning("样式包错误: %s (%s)", style_path, e)
+                return proxy_error_response(e, {"error": "无法获取地图样式"})
+
+    response = Response(content_type='application/json')
+    response.set_etag(entry['etag'])
+    response.headers['Cache-Control'] = STYLE_BUNDLE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    if request.if_none_match.contains_weak(entry['etag']):
+        response.status_code = 304
+        return response
+    response.set_data(entry['body'])
+    return response
 
 # === 新增：通用 Mapbox API 代理 ===
 @app.route('/api/mapbox/<path:proxy_path>')
 def general_mapbox_proxy(proxy_path):
     """通用 Mapbox API 代理，处理其他类型的请求"""
-    mapbox_url = f"https://api.mapbox.com/{proxy_path}"
+    mapbox_url = upstream.url(proxy_path)
     params = dict(request.args)
     params['access_token'] = MAPBOX_ACCESS_TOKEN
     
-    print(f"通用代理请求: {proxy_path}")
+    logger.debug("通用代理请求: %s", proxy_path)
+    # 前端不直接依赖的接口，不与底图瓦片争抢名额
+    scheduler.set_context('bulk', scheduler.current_context()[1])
     
     try:
-        response = requests.get(mapbox_url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        # 根据响应内容类型返回适当的响应
-        content_type = response.headers.get('Content-Type', '')
-        if 'application/json' in content_type:
-            return jsonify(response.json())
-        else:
-            proxied_response = Response(
-                response.content, 
-                status=response.status_code,
-                content_type=content_type
-            )
-            return proxied_response
+        # JSON 与二进制响应一样原样透传，不做解析/序列化
+        return passthrough_response(fetch_passthrough(mapbox_url, params))
     except Exception as e:
-        print(f"通用代理错误: {e}")
-        return jsonify({"error": f"无法代理请求: {proxy_path}"}), 500
+        logger.warning("通用代理错误: %s", e)
+        return proxy_error_response(e, {"error": f"无法代理请求: {proxy_path}"})
+
+# === 新增：上游请求调度 (优先级 + 令牌桶 + 按客户端公平排队) ===
+# 部署在 nginx 等反向代理之后时设为 1，按 X-Forwarded-For 中的第一个地址区分客户端
+TRUST_FORWARDED_FOR = os.getenv('TRUST_FORWARDED_FOR', '0') == '1'
+
+def client_address():
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get('X-Forwarded-For')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.remote_addr
+
+@app.before_request
+def set_upstream_context():
+    # 优先级默认按上游接口类型，批量等时圈和通用代理在路由中改为 bulk
+    scheduler.set_context(None, client_address())
+
+# === 新增：请求计时、Prometheus 指标与健康检查 ===
+# 超过该耗时（毫秒）的请求以 WARNING 记录，便于定位慢请求；0 表示不记录
+LOG_SLOW_REQUEST_MS = float(os.getenv('LOG_SLOW_REQUEST_MS', 2000))
+STARTED_AT = time.time()
+
+@app.before_request
+def start_request_timer():
+    # 用路由规则而不是实际路径做标签，瓦片路径不会让指标数量无限增长
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_started = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc(g.metrics_route)
+
+@app.after_request
+def record_request_metrics(response):
+    """响应体发送完毕（流式响应为最后一块发出）后记录耗时、字节数和状态码"""
+    route = g.pop('metrics_route', None)
+    if route is None:
+        return response
+    started = g.pop('metrics_started')
+    method, path, status = request.method, request.path, response.status_code
+    sent = [0]
+    if response.is_streamed:
+        body = response.response
+
+        def counted():
+            try:
+                for chunk in body:
+                    sent[0] += len(chunk)
+                    yield chunk
+            finally:
+                close = getattr(body, 'close', None)
+                if close is not None:
+                    close()
+
+        response.response = counted()
+    else:
+        sent[0] = response.calculate_content_length() or 0
+
+    response.call_on_close(lambda: finish_request_metrics(route, started, method, path, status, sent[0]))
+    return response
+
+@app.teardown_request
+def record_failed_request_metrics(exc):
+    """after_request 没有执行（未处理的异常、调试模式下直接抛出等）时，g 中仍有 metrics_route，按 500 记录"""
+    route = g.pop('metrics_route', None)
+    if route is None:
+        return
+    finish_request_metrics(route, g.pop('metrics_started'), request.method, request.path, 500, 0)
+
+def finish_request_metrics(route, started, method, path, status, sent):
+    seconds = time.perf_counter() - started
+    metrics.HTTP_IN_FLIGHT.dec(route)
+    metrics.HTTP_REQUESTS.inc(route, method, status)
+    metrics.HTTP_DURATION.observe(seconds, route)
+    metrics.HTTP_RESPONSE_BYTES.inc(route, amount=sent)
+    fields = {'route': route, 'path': path, 'status': status, 'ms': round(seconds * 1000, 1), 'bytes': sent}
+    if LOG_SLOW_REQUEST_MS and seconds * 1000 >= LOG_SLOW_REQUEST_MS:
+        logger.warning("慢请求", extra=fields)
+    else:
+        logger.debug("请求完成", extra=fields)
+
+CIRCUIT_STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+def collect_cache_metrics():
+    """抓取时读取各缓存、连接池和请求合并的统计，热路径上不重复计数"""
+    iso = isochrone_cache.stats()
+    families = [
+        ('proxy_isochrone_cache_lookups_total', 'counter', '等时圈缓存查找次数',
+         [({'result': 'memory_hit'}, iso['memory_hits']), ({'result': 'disk_hit'}, iso['disk_hits']),
+          ({'result': 'miss'}, iso['misses'])]),
+        ('proxy_isochrone_cache_hit_ratio', 'gauge', '等时圈缓存命中率', [({}, iso['hit_ratio'])]),
+        ('proxy_isochrone_cache_entries', 'gauge', '等时圈内存缓存条目数', [({}, iso['memory_entries'])]),
+    ]
+    if tile_cache is not None:
+        tiles = tile_cache.stats()
+        families += [
+            ('proxy_tile_cache_lookups_total', 'counter', '瓦片/字体/精灵图磁盘缓存查找次数',
+             [({'result': 'hit'}, tiles['hits']), ({'result': 'miss'}, tiles['misses'])]),
+            ('proxy_tile_cache_revalidated_total', 'counter', '向上游重新验证后沿用缓存的次数',
+             [({}, tiles['revalidated'])]),
+            ('proxy_tile_cache_hit_ratio', 'gauge', '磁盘缓存命中率', [({}, tiles['hit_ratio'])]),
+            ('proxy_tile_cache_bytes', 'gauge', '磁盘缓存占用字节数', [({}, tiles['bytes'])]),
+        ]
+    if _vector_tile_service is not None:
+        vector = _vector_tile_service.cache.stats()
+        families += [
+            ('proxy_vector_tile_cache_lookups_total', 'counter', '人口 / 书房矢量瓦片缓存查找次数',
+             [({'result': 'hit'}, vector['hits']), ({'result': 'miss'}, vector['misses'])]),
+            ('proxy_vector_tile_cache_bytes', 'gauge', '矢量瓦片缓存占用字节数（未压缩）', [({}, vector['bytes'])]),
+        ]
+    bundles = style_bundles.stats()
+    families += [
+        ('proxy_style_bundle_requests_total', 'counter',
+         '样式包请求：hit 未过期，revalidated 版本未变，built 重新生成，stale 过期后先返回旧结果',
+         [({'result': 'hit'}, bundles['hits']), ({'result': 'revalidated'}, bundles['revalidated']),
+          ({'result': 'built'}, bundles['built']), ({'result': 'stale'}, bundles['stale'])]),
+        ('proxy_style_bundle_bytes', 'gauge', '缓存的样式包字节数', [({}, bundles['bytes'])]),
+    ]
+    kinds = upstream.kind_stats()
+    families += [
+        ('proxy_upstream_circuit_state', 'gauge', '熔断器状态：0 闭合，1 半开，2 断开',
+         [({'kind': kind}, CIRCUIT_STATE_VALUES[item['state']]) for kind, item in kinds.items()]),
+        ('proxy_upstream_circuit_opened_total', 'counter', '熔断器断开次数',
+         [({'kind': kind}, item['opened']) for kind, item in kinds.items()]),
+        ('proxy_upstream_circuit_rejected_total', 'counter', '熔断期间直接拒绝的上游请求数',
+         [({'kind': kind}, item['rejected']) for kind, item in kinds.items()]),
+        ('proxy_upstream_read_timeout_seconds', 'gauge', '按最近 p95 自适应的读取超时',
+         [({'kind': kind}, item['read_timeout']) for kind, item in kinds.items()]),
+    ]
+    if upstream.scheduler is not None:
+        queue = upstream.scheduler.stats()
+        families += [
+            ('proxy_upstream_queue_depth', 'gauge', '调度器中排队等待名额的上游请求数',
+             [({'priority': priority}, count) for priority, count in queue['queued'].items()]),
+            ('proxy_upstream_queue_oldest_wait_seconds', 'gauge', '各优先级队首请求已等待的时间',
+             [({'priority': priority}, seconds) for priority, seconds in queue['oldest_wait_seconds'].items()]),
+            ('proxy_upstream_scheduler_in_flight', 'gauge', '已取得名额、正在请求上游的数量', [({}, queue['in_flight'])]),
+            ('proxy_upstream_admitted_total', 'counter', '调度器放行的上游请求数',
+             [({'priority': priority}, count) for priority, count in queue['admitted'].items()]),
+        ]
+        if queue['tokens'] is not None:
+            families.append(('proxy_upstream_rate_tokens', 'gauge', '令牌桶中剩余的令牌', [({}, queue['tokens'])]))
+    pool = upstream.stats()
+    flight = upstream_flight.stats()
+    families += [
+        ('proxy_upstream_in_flight', 'gauge', '正在进行的上游请求数', [({}, pool['in_flight'])]),
+        ('proxy_upstream_pool_size', 'gauge', '上游连接池大小', [({}, pool['pool_size'])]),
+        ('proxy_upstream_pool_saturated_total', 'counter', '发起请求时连接池已占满的次数',
+         [({}, pool['saturated'])]),
+        ('proxy_singleflight_calls_total', 'counter', '请求合并：leader 实际请求上游，shared 等待共享结果',
+         [({'role': 'leader'}, flight['leaders']), ({'role': 'shared'}, flight['shared'])]),
+        ('proxy_singleflight_in_flight', 'gauge', '正在进行的合并请求数', [({}, flight['in_flight'])]),
+    ]
+    return families
+
+metrics.REGISTRY.add_collector(collect_cache_metrics)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus 文本格式的指标"""
+    return Response(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/health')
+def health():
+    """存活检查：不访问上游，只报告进程状态和当前配置"""
+    return jsonify({
+        "status": "ok",
+        "uptime_s": round(time.time() - STARTED_AT, 1),
+        "isochrone_backend": isochrone_backend.name,
+        "tile_cache": tile_cache is not None,
+        "upstream_circuits": {kind: item['state'] for kind, item in upstream.kind_stats().items()},
+        "pid": os.getpid(),
+    })
+
+# === 新增：动态响应压缩 (br / gzip) ===
+COMPRESS_RESPONSES = os.getenv('COMPRESS_RESPONSES', '1') != '0'
+# 小于该字节数的响应不压缩，压缩头和 CPU 开销不划算
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_LEVELS = {
+    'gzip': int(os.getenv('COMPRESS_GZIP_LEVEL', 6)),
+    'br': int(os.getenv('COMPRESS_BROTLI_QUALITY', 5)),
+}
+
+# 在 record_request_metrics 之后注册，所以先于它执行，指标记录的是压缩后的字节数
+@app.after_request
+def compress_response(response):
+    """按 Accept-Encoding 压缩缓冲的文本类响应；流式透传、文件和已编码的响应原样返回"""
+    if (not COMPRESS_RESPONSES or response.status_code != 200 or response.direct_passthrough
+            or response.is_streamed or 'Content-Encoding' in response.headers
+            or not compression.is_compressible(response.mimetype)):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = compression.best_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    compressed = compression.compress(body, encoding, COMPRESS_LEVELS[encoding])
+    if len(compressed) >= len(body):
+        return response
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # 压缩后的字节与原响应不同，只能作为弱 ETag
+        response.set_etag(etag, weak=True)
+    return response
+
+# === 新增：预压缩静态资源 (内容哈希文件名 + immutable 缓存) ===
+# 由 static_assets.py 构建；未构建时 /assets/ 返回 404
+static_assets = AssetManifest(os.getenv('STATIC_ASSETS_DIR', DIST_DIR))
+ASSET_IMMUTABLE_MAX_AGE = int(os.getenv('ASSET_IMMUTABLE_MAX_AGE', 365 * 24 * 3600))
+
+@app.route('/assets/<path:filename>')
+def static_asset(filename):
+    """哈希文件名按 immutable 长期缓存；原路径（HTML 入口、CSS 相对引用）每次用 ETag 验证"""
+    resolved = static_assets.resolve(filename)
+    if resolved is None:
+        if filename.startswith('static/'):
+            # 未纳入构建的文件（图片等）按原样提供，入口页中的相对引用仍然有效
+            response = send_from_directory(os.path.join(SITE_DIR, 'static'), filename[len('static/'):])
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return jsonify({"error": "资源不存在。"}), 404
+    entry, hashed = resolved
+    encoding = compression.best_encoding(request.accept_encodings, entry['encodings'])
+    etag = entry['sha1'][:32] + (f"-{encoding}" if encoding else '')
+    response = send_file(static_assets.path(entry, encoding), mimetype=guess_type(filename),
+                         etag=etag, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if entry['encodings']:
+        response.vary.add('Accept-Encoding')
+    if hashed:
+        response.headers['Cache-Control'] = f"public, max-age={ASSET_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/')
 def index():
     return "Mapbox Isochrone Flask Proxy is running!"
 
 if __name__ == '__main__':
+    # 仅用于本地开发；生产环境请使用 gunicorn -c gunicorn.conf.py wsgi:app
     # Use environment variable for port, default to 5001 if not set
     port = int(os.environ.get('FLASK_RUN_PORT', 5001))
-    # Run in debug mode for development (auto-reloads), set debug=False for production
-    app.run(host='0.0.0.0', port=port, debug=True)
+    # Run in debug mode for development (auto-reloads), set FLASK_DEBUG=0 to disable
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_DEBUG', '1') == '1', threaded=True)
@@ -0,0 +1,447 @@
+# benchmark.py
+"""代理压测：本地模拟 Mapbox 上游 (fake_mapbox.py) + 按真实流量构造的场景，结果输出为 JSON。
+
+    python benchmark.py                                       # 全部场景，JSON 打印到标准输出
+    python benchmark.py --scenario tile_burst --users 50 --out bench.json
+    python benchmark.py --server gunicorn --latency-ms 120 --error-rate 0.02 --history bench_history.jsonl
+
+代理以子进程方式启动（开发服务器或 gunicorn），上游指向进程内的模拟服务，缓存目录放在临时目录，
+每次运行都从冷缓存开始。场景：
+
+    tile_burst     多个用户同时打开地图：样式、TileJSON、精灵图、字体，再并发请求视口内的瓦片
+    generate_all   “生成所有等时圈”：/api/isochrones/batch 一次请求全部书房，第一轮冷缓存，之后命中缓存
+    random_clicks  以固定速率在书房范围内随机点击 /api/isochrone，部分点击重复之前的位置
+
+每个场景报告延迟 p50/p95/p99、吞吐量、状态码、上游请求数（模拟服务按类型计数）和代理进程的 RSS。
+--history 把每次结果追加为一行 JSON，便于跟踪回归。
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import fake_mapbox
+from library_store import LibraryStore
+from seed_tiles import LIBRARY_DATA_PATH, library_bbox, lnglat_to_tile
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULT_FORMAT = 1
+SCENARIOS = ('tile_burst', 'generate_all', 'random_clicks')
+BROWSER_CONNECTIONS = 6  # 浏览器对同一主机的并发连接数
+TILESET = 'mapbox.mapbox-streets-v8'
+STYLE = 'mapbox/dark-v10'
+FONT_RANGES = ('0-255', '19968-20223')  # 拉丁字符 + 最常用的一段汉字
+
+
+def percentile(sorted_values, q):
+    """线性插值的百分位数，sorted_values 需已排序"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class Recorder:
+    """收集一个场景中每个请求的延迟、状态码和响应大小（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+        self.statuses = {}
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    def add(self, seconds, status, size=0):
+        with self._lock:
+            self.samples.append(seconds)
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+            self.bytes += size
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def summary(self):
+        duration = (self.finished or time.monotonic()) - self.started
+        latencies = sorted(seconds * 1000 for seconds in self.samples)
+        errors = sum(count for status, count in self.statuses.items() if not status.startswith(('2', '3')))
+
+        def ms(value):
+            return round(value, 2) if value is not None else None
+
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'status': dict(sorted(self.statuses.items())),
+            'duration_s': round(duration, 3),
+            'throughput_rps': round(len(latencies) / duration, 2) if duration > 0 else None,
+            'bytes': self.bytes,
+            'latency_ms': {
+                'p50': ms(percentile(latencies, 50)),
+                'p95': ms(percentile(latencies, 95)),
+                'p99': ms(percentile(latencies, 99)),
+                'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+                'max': ms(latencies[-1]) if latencies else None,
+            },
+        }
+
+
+def process_tree_rss_kb(pid):
+    """pid 及其所有子进程的 RSS 之和 (KB)，读取 /proc，非 Linux 系统返回 None"""
+    if not os.path.isdir('/proc'):
+        return None
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # 第二个字段是可能含空格的进程名，用最后一个 ')' 分隔
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class RssSampler:
+    """场景运行期间每隔 interval 秒采样一次代理进程的 RSS，记录开始、峰值和结束值"""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.start_kb = self.peak_kb = self.end_kb = None
+
+    def start(self):
+        self.start_kb = self.peak_kb = process_tree_rss_kb(self.pid)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = process_tree_rss_kb(self.pid)
+            if rss is not None:
+                self.peak_kb = max(self.peak_kb or 0, rss)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.end_kb = process_tree_rss_kb(self.pid)
+        if self.end_kb is not None:
+            self.peak_kb = max(self.peak_kb or 0, self.end_kb)
+        return {'start': self.start_kb, 'peak': self.peak_kb, 'end': self.end_kb}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class ProxyProcess:
+    """以子进程方式运行代理，上游指向模拟服务，缓存放在临时目录"""
+
+    def __init__(self, server, upstream_base, workdir, workers=2):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.log_path = os.path.join(workdir, 'proxy.log')
+        env = dict(os.environ)
+        env.update({
+            'MAPBOX_ACCESS_TOKEN': 'benchmark',
+            'MAPBOX_API_BASE': upstream_base,
+            'FLASK_RUN_PORT': str(self.port),
+            'FLASK_DEBUG': '0',
+            'TILE_CACHE_DIR': os.path.join(workdir, 'tiles'),
+            'ISOCHRONE_CACHE_DB': '',
+            'ISOCHRONE_BACKEND': 'mapbox',
+            'PYTHONUNBUFFERED': '1',
+        })
+        if server == 'gunicorn':
+            env.setdefault('WEB_CONCURRENCY', str(workers))
+            command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+        else:
+            command = [sys.executable, 'app.py']
+        self._log = open(self.log_path, 'wb')
+        self.process = subprocess.Popen(command, cwd=APP_DIR, env=env, stdout=self._log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                if requests.get(f"{self.base_url}/", timeout=1).ok:
+                    return
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"代理未能启动，日志见 {self.log_path}")
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self._log.close()
+
+
+class Client:
+    """每个线程一个 keep-alive Session，模拟浏览器复用连接"""
+
+    def __init__(self, base_url, recorder, pool_size=64):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.pool_size = pool_size
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_maxsize=self.pool_size))
+            session.headers['Accept-Encoding'] = 'gzip, deflate'
+            self._local.session = session
+        return session
+
+    def get(self, path, params=None, started=None):
+        """发起 GET 并记录；started 为计划发出的时间（开环压测时用它计算延迟，排队时间也计入）"""
+        started = started or time.monotonic()
+        try:
+            response = self.session.get(f"{self.base_url}{path}", params=params, timeout=60)
+            body = response.content
+        except requests.exceptions.RequestException as e:
+            self.recorder.add(time.monotonic() - started, type(e).__name__)
+            return None
+        self.recorder.add(time.monotonic() - started, response.status_code, len(body))
+        return response
+
+
+def tile_burst(context):
+    """users 个用户同时打开地图，每个用户最多 6 个并发连接"""
+    args, client = context['args'], context['client']
+    rng = random.Random(args.seed)
+    west, south, east, north = context['bbox']
+    centers = [(rng.uniform(west, east), rng.uniform(south, north)) for _ in range(args.users)]
+
+    def open_map(center):
+        style = client.get(f"/api/mapbox/styles/v1/{STYLE}")
+        tilejson = client.get(f"/api/mapbox/v4/{TILESET}.json")
+        template = None
+        if tilejson is not None and tilejson.ok:
+            template = tilejson.json()['tiles'][0]
+        requests_to_send = []
+        if style is not None and style.ok:
+            style_json = style.json()
+            sprite = style_json['sprite'][len('mapbox://sprites/'):]
+            requests_to_send += [f"/api/mapbox/sprites/v1/{sprite}/sprite{suffix}" for suffix in ('.json', '.png')]
+            fontstack = ','.join(style_json['layers'][-1]['layout']['text-font'])
+            requests_to_send += [f"/api/mapbox/fonts/v1/mapbox/{fontstack}/{r}.pbf" for r in FONT_RANGES]
+        if template:
+            x, y = lnglat_to_tile(center[0], center[1], args.zoom)
+            for dx in range(-1, 3):
+                for dy in range(-1, 2):
+                    requests_to_send.append(template.replace('{z}', str(args.zoom))
+                                            .replace('{x}', str(x + dx)).replace('{y}', str(y + dy)))
+        with ThreadPoolExecutor(max_workers=BROWSER_CONNECTIONS) as browser:
+            list(browser.map(client.get, requests_to_send))
+
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        list(executor.map(open_map, centers))
+    return {'users': args.users, 'zoom': args.zoom}
+
+
+def generate_all(context):
+    """每轮一个批量请求包含所有书房；每个书房的结果按到达时间计入延迟"""
+    args, client, recorder = context['args'], context['client'], context['recorder']
+    library_ids = context['library_ids']
+    rounds = []
+    for _ in range(args.rounds):
+        started = time.monotonic()
+        first_ms, items, failed, hits = None, 0, 0, 0
+        try:
+            response = client.session.post(
+                f"{client.base_url}/api/isochrones/batch",
+                json={'library_ids': library_ids, 'minutes': 15, 'profile': 'walking'},
+                stream=True, timeout=300)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                item = json.loads(line)
+                if item.get('done'):
+                    continue
+                elapsed = time.monotonic() - started
+                first_ms = first_ms if first_ms is not None else round(elapsed * 1000, 2)
+                recorder.add(elapsed, item.get('status'), len(line))
+                items += 1
+                failed += item.get('status') != 200
+                hits += item.get('cache') == 'HIT'
+        except requests.exceptions.RequestException as e:
+            recorder.add(time.monotonic() - started, type(e).__name__)
+        rounds.append({'seconds': round(time.monotonic() - started, 3), 'first_ms': first_ms,
+                       'items': items, 'failed': failed, 'cache_hits': hits})
+    return {'libraries': len(library_ids), 'rounds': rounds}
+
+
+def random_clicks(context):
+    """开环：按固定速率发出点击，不因服务变慢而降速；延迟从计划发出时间算起"""
+    args, client = context['args'], context['client']
+    rng = random.Random(args.seed + 1)
+    west, south, east, north = context['bbox']
+    interval = 1.0 / args.rate
+    total = int(args.duration * args.rate)
+    clicked = []
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.max_in_flight) as executor:
+        futures = []
+        for i in range(total):
+            if clicked and rng.random() < args.repeat_ratio:
+                lng, lat = rng.choice(clicked)
+            else:
+                lng, lat = round(rng.uniform(west, east), 6), round(rng.uniform(south, north), 6)
+                clicked.append((lng, lat))
+            params = {'lng': lng, 'lat': lat, 'minutes': rng.choice((5, 10, 15)),
+                      'profile': rng.choice(('walking', 'cycling'))}
+            scheduled = start + i * interval
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(client.get, '/api/isochrone', params, scheduled))
+        wait(futures)
+    return {'rate': args.rate, 'planned_duration_s': args.duration, 'repeat_ratio': args.repeat_ratio}
+
+
+SCENARIO_FUNCTIONS = {
+    'tile_burst': tile_burst,
+    'generate_all': generate_all,
+    'random_clicks': random_clicks,
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    fake = fake_mapbox.fake_from_args(args)
+    fake_server = fake_mapbox.start_server(fake)
+    upstream_base = 'http://%s:%d' % fake_server.server_address[:2]
+    workdir = tempfile.mkdtemp(prefix='heluo-bench-')
+    proxy = ProxyProcess(args.server, upstream_base, workdir, args.workers)
+    try:
+        proxy.wait_ready()
+        store = LibraryStore(LIBRARY_DATA_PATH)
+        results = {}
+        for name in args.scenario or SCENARIOS:
+            recorder = Recorder()
+            context = {
+                'args': args,
+                'recorder': recorder,
+                'client': Client(proxy.base_url, recorder),
+                'bbox': library_bbox(),
+                'library_ids': [library['id'] for library in store.libraries],
+            }
+            fake.reset()
+            sampler = RssSampler(proxy.process.pid)
+            sampler.start()
+            print(f"运行场景 {name} ...", file=sys.stderr)
+            extra = SCENARIO_FUNCTIONS[name](context)
+            recorder.finish()
+            result = recorder.summary()
+            result['rss_kb'] = sampler.stop()
+            result['upstream'] = fake.stats()
+            result.update(extra)
+            results[name] = result
+            latency = result['latency_ms']
+            print(f"  {result['requests']} 个请求, {result['errors']} 个错误, {result['throughput_rps']} req/s, "
+                  f"p50 {latency['p50']}ms p95 {latency['p95']}ms p99 {latency['p99']}ms, "
+                  f"上游 {result['upstream']['total']} 次, RSS 峰值 {result['rss_kb']['peak']} KB", file=sys.stderr)
+    except Exception:
+        print(f"压测失败，代理日志见 {proxy.log_path}", file=sys.stderr)
+        args.keep_workdir = True
+        raise
+    finally:
+        proxy.stop()
+        fake_server.shutdown()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'format': RESULT_FORMAT,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_commit': git_commit(),
+        'server': args.server,
+        'config': {key: value for key, value in vars(args).items() if key not in ('out', 'history')},
+        'scenarios': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='用本地模拟的 Mapbox 压测代理，输出 JSON 结果')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='要运行的场景，可重复指定，默认全部')
+    parser.add_argument('--server', choices=['flask', 'gunicorn'], default='flask',
+                        help='flask 为开发服务器 (app.py)，gunicorn 使用 gunicorn.conf.py')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker 数 (WEB_CONCURRENCY 未设置时)')
+    parser.add_argument('--users', type=int, default=20, help='tile_burst: 同时打开地图的用户数')
+    parser.add_argument('--zoom', type=int, default=13, help='tile_burst: 视口缩放级别')
+    parser.add_argument('--rounds', type=int, default=2, help='generate_all: 批量请求轮数（第一轮为冷缓存）')
+    parser.add_argument('--rate', type=float, default=10, help='random_clicks: 每秒点击数')
+    parser.add_argument('--duration', type=float, default=15, help='random_clicks: 持续秒数')
+    parser.add_argument('--repeat-ratio', type=float, default=0.2, help='random_clicks: 重复点击之前位置的比例')
+    parser.add_argument('--max-in-flight', type=int, default=64, help='random_clicks: 客户端最大并发数')
+    fake_mapbox.add_arguments(parser)
+    parser.add_argument('--out', help='结果写入文件，默认打印到标准输出')
+    parser.add_argument('--history', help='把结果追加为一行 JSON 到该文件')
+    parser.add_argument('--keep-workdir', action='store_true', help='保留临时目录（代理日志和缓存）')
+    args = parser.parse_args()
+
+    result = run(args)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.history:
+        with open(args.history, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+
+if __name__ == '__main__':
+    main()
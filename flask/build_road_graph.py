@@ -0,0 +1,203 @@
+# build_road_graph.py
+"""把 OSM 路网导出为本地等时圈后端 (ISOCHRONE_BACKEND=local) 使用的 {profile}.npz。
+
+    python build_road_graph.py luoyang.osm                     # 默认导出 walking/cycling/driving
+    python build_road_graph.py luoyang.osm.bz2 --profile walking --out graphs
+
+输入为 OSM XML（.osm / .osm.gz / .osm.bz2，可用 osmium 或 Overpass 导出洛阳范围）。
+第一遍扫描 way 收集用到的节点，第二遍只保留这些节点的坐标，内存占用与路网规模成正比。
+输出数组：node_lng/node_lat (float64)、indptr/indices (int32, CSR 邻接表)、seconds (float32, 边的通行秒数)。
+"""
+import argparse
+import bz2
+import gzip
+import math
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from isochrone_backends import EARTH_RADIUS_M
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 每种出行方式允许的道路类型与速度 (km/h)
+PROFILES = {
+    'walking': {
+        'speeds': dict.fromkeys([
+            'trunk', 'trunk_link', 'primary', 'primary_link', 'secondary', 'secondary_link',
+            'tertiary', 'tertiary_link', 'unclassified', 'residential', 'living_street', 'service',
+            'pedestrian', 'footway', 'path', 'steps', 'track', 'cycleway',
+        ], 5),
+        'oneway': False,  # 步行不受单行限制
+    },
+    'cycling': {
+        'speeds': dict.fromkeys([
+            'trunk', 'trunk_link', 'primary', 'primary_link', 'secondary', 'secondary_link',
+            'tertiary', 'tertiary_link', 'unclassified', 'residential', 'living_street', 'service',
+            'cycleway', 'path', 'track',
+        ], 15),
+        'oneway': True,
+    },
+    'driving': {
+        'speeds': {
+            'motorway': 100, 'motorway_link': 60,
+            'trunk': 80, 'trunk_link': 50,
+            'primary': 60, 'primary_link': 40,
+            'secondary': 50, 'secondary_link': 35,
+            'tertiary': 40, 'tertiary_link': 30,
+            'unclassified': 30, 'residential': 25,
+            'living_street': 10, 'service': 15,
+        },
+        'oneway': True,
+    },
+}
+
+
+def open_osm(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def iter_elements(path, tag):
+    """流式遍历指定标签的元素，处理完立即释放，避免整棵树驻留内存。
+
+    只 clear() 元素本身时，清空后的元素仍挂在根节点 <osm> 下，百万级节点时同样占用大量内存，
+    所以每处理完一个顶层元素就清空根节点。
+    """
+    with open_osm(path) as f:
+        root = None
+        for event, element in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                continue
+            if element.tag == tag:
+                yield element
+            if element.tag in ('node', 'way', 'relation'):
+                root.clear()
+
+
+def read_ways(path, profiles):
+    """第一遍：返回 [(节点 id 列表, {profile: (速度 km/h, 方向)})]，方向为 0 双向 / 1 正向 / -1 反向"""
+    ways = []
+    for element in iter_elements(path, 'way'):
+        tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+        highway = tags.get('highway')
+        if not highway or tags.get('area') == 'yes':
+            continue
+        usage = {}
+        for profile in profiles:
+            config = PROFILES[profile]
+            speed = config['speeds'].get(highway)
+            if speed is None:
+                continue
+            direction = 0
+            if config['oneway']:
+                oneway = tags.get('oneway')
+                if oneway in ('yes', 'true', '1') or (oneway is None and tags.get('junction') == 'roundabout'):
+                    direction = 1
+                elif oneway == '-1':
+                    direction = -1
+                if profile == 'cycling' and tags.get('oneway:bicycle') == 'no':
+                    direction = 0
+            usage[profile] = (speed, direction)
+        if usage:
+            refs = [int(nd.get('ref')) for nd in element.iter('nd')]
+            if len(refs) >= 2:
+                ways.append((refs, usage))
+    return ways
+
+
+def read_nodes(path, wanted):
+    """第二遍：只读取路网用到的节点坐标，返回 {节点 id: (lng, lat)}"""
+    coordinates = {}
+    for element in iter_elements(path, 'node'):
+        node_id = int(element.get('id'))
+        if node_id in wanted:
+            coordinates[node_id] = (float(element.get('lon')), float(element.get('lat')))
+    return coordinates
+
+
+def segment_meters(a, b):
+    """两点间的大圆距离（米）"""
+    lng1, lat1, lng2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+
+def build_graph(ways, coordinates, profile):
+    """把某个 profile 可用的道路转换为 CSR 数组 dict"""
+    node_index = {}
+    sources, targets, seconds = [], [], []
+
+    def index_of(node_id):
+        if node_id not in node_index:
+            node_index[node_id] = len(node_index)
+        return node_index[node_id]
+
+    for refs, usage in ways:
+        if profile not in usage:
+            continue
+        speed, direction = usage[profile]
+        meters_per_second = speed / 3.6
+        for a, b in zip(refs, refs[1:]):
+            if a not in coordinates or b not in coordinates:
+                continue  # 导出范围边缘被截断的道路
+            cost = segment_meters(coordinates[a], coordinates[b]) / meters_per_second
+            ia, ib = index_of(a), index_of(b)
+            if direction >= 0:
+                sources.append(ia)
+                targets.append(ib)
+                seconds.append(cost)
+            if direction <= 0:
+                sources.append(ib)
+                targets.append(ia)
+                seconds.append(cost)
+
+    node_count = len(node_index)
+    node_lng = np.empty(node_count, dtype=np.float64)
+    node_lat = np.empty(node_count, dtype=np.float64)
+    for node_id, index in node_index.items():
+        node_lng[index], node_lat[index] = coordinates[node_id]
+
+    sources = np.asarray(sources, dtype=np.int32)
+    order = np.argsort(sources, kind='stable')
+    indptr = np.zeros(node_count + 1, dtype=np.int32)
+    np.cumsum(np.bincount(sources, minlength=node_count), out=indptr[1:])
+    return {
+        'node_lng': node_lng,
+        'node_lat': node_lat,
+        'indptr': indptr,
+        'indices': np.asarray(targets, dtype=np.int32)[order],
+        'seconds': np.asarray(seconds, dtype=np.float32)[order],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='把 OSM 路网导出为本地等时圈后端使用的 npz 文件')
+    parser.add_argument('osm', help='OSM XML 文件 (.osm / .osm.gz / .osm.bz2)')
+    parser.add_argument('--profile', action='append', choices=sorted(PROFILES),
+                        help='出行方式，可重复指定，默认全部')
+    parser.add_argument('--out', default=os.path.join(APP_DIR, 'graphs'), help='输出目录')
+    args = parser.parse_args()
+
+    profiles = args.profile or list(PROFILES)
+    ways = read_ways(args.osm, profiles)
+    wanted = {node_id for refs, _ in ways for node_id in refs}
+    print(f"读取到 {len(ways)} 条道路，涉及 {len(wanted)} 个节点")
+    coordinates = read_nodes(args.osm, wanted)
+
+    os.makedirs(args.out, exist_ok=True)
+    for profile in profiles:
+        graph = build_graph(ways, coordinates, profile)
+        path = os.path.join(args.out, f"{profile}.npz")
+        np.savez_compressed(path, **graph)
+        print(f"{profile}: {len(graph['node_lng'])} 个节点, {len(graph['indices'])} 条有向边 -> {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# compression.py
+"""按 Accept-Encoding 协商的 br / gzip 压缩，代理的动态响应和静态资源构建共用。
+
+brotli 为可选依赖（pip install brotli），未安装时只使用 gzip。
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 服务端偏好顺序：客户端给出的 q 值相同时优先 br
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# 值得压缩的类型；图片、woff2 和已编码的瓦片本身已压缩
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/geo+json',
+    'application/x-ndjson',
+    'application/javascript',
+    'application/x-javascript',
+    'application/xml',
+    'application/x-protobuf',
+    'application/vnd.mapbox-vector-tile',
+    'application/octet-stream',
+    'image/svg+xml',
+    'font/ttf',
+)
+
+
+def is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(data, encoding, level):
+    """level：gzip 为 1-9，br 为 quality 0-11"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    # mtime=0 使相同输入得到相同输出，预压缩文件可以按内容比较
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def best_encoding(accept_encodings, available=ENCODINGS):
+    """available 中客户端接受且 q 值最高的编码，都不接受时返回 None"""
+    return accept_encodings.best_match([encoding for encoding in ENCODINGS if encoding in available])
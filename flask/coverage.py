@@ -0,0 +1,216 @@
+# coverage.py
+"""人口覆盖分析：书房等时圈内外各有多少人口。
+
+人口网格来自 population_grid.py 导出的二进制网格，或原始的 static/data/population_data.json
+（heatmapData = [{lng, lat, count}, ...]），启动时一次性读入 NumPy 数组；
+每个网格按最近的书房归属到该书房所在的区县。
+等时圈多边形来自代理的等时圈缓存或 build_isochrones.py 生成的静态包。
+
+    python coverage.py                                # 默认 walking 15 分钟，读取静态包
+    python coverage.py --profile cycling --minutes 10 --json
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+import population_grid
+from library_store import LibraryStore
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(APP_DIR, '..', 'static', 'data')
+POPULATION_DATA_PATH = os.path.join(DATA_DIR, 'population_data.json')
+LIBRARY_DATA_PATH = os.path.join(DATA_DIR, '城市书房数据.json')
+ISOCHRONE_BUNDLE_PATH = os.path.join(DATA_DIR, 'isochrones.geojson')
+
+
+def default_population_path():
+    """优先使用 population_grid.py 导出的二进制网格，不存在时读取原始 JSON"""
+    return population_grid.GRID_PATH if os.path.exists(population_grid.GRID_PATH) else POPULATION_DATA_PATH
+
+
+def load_population_grid(path=None):
+    """读取人口网格，返回 (lng, lat, count) 三个数组；.bin 文件以内存映射方式读取"""
+    path = path or default_population_path()
+    if path.endswith('.bin'):
+        return population_grid.PopulationGrid(path).cells()
+    return population_grid.load_source(path)
+
+
+def prepare_geometry(geometry):
+    """把 Polygon / MultiPolygon 转换为 [(外包框, [外环, 洞...]), ...]，环为 NumPy 数组，其他类型返回 []。
+
+    列表转数组是整个判断过程中最慢的一步，静态包的结果会缓存起来重复使用。
+    """
+    if geometry is None:
+        return []
+    if geometry['type'] == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        return []
+    prepared = []
+    for polygon in polygons:
+        rings = [np.asarray(ring, dtype=np.float64)[:, :2] for ring in polygon]
+        (west, south), (east, north) = rings[0].min(axis=0), rings[0].max(axis=0)
+        prepared.append(((float(west), float(south), float(east), float(north)), rings))
+    return prepared
+
+
+def ring_contains(lngs, lats, ring):
+    """射线法判断点是否在环内：按边循环改为 (点 × 边) 矩阵一次算完"""
+    x1, y1 = ring[:-1, 0], ring[:-1, 1]
+    x2, y2 = ring[1:, 0], ring[1:, 1]
+    px, py = lngs[:, None], lats[:, None]
+    crosses = (y1 > py) != (y2 > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_at = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    return np.count_nonzero(crosses & (px < x_at), axis=1) % 2 == 1
+
+
+def geometry_contains(lngs, lats, polygons):
+    """prepare_geometry 的结果（含洞）覆盖的点，返回布尔数组；lngs 需按升序排列"""
+    inside = np.zeros(len(lngs), dtype=bool)
+    for (west, south, east, north), (outer, *holes) in polygons:
+        # 经度有序，二分查找出外包框内的网格，只对这些点做射线判断
+        start = int(np.searchsorted(lngs, west, side='left'))
+        stop = int(np.searchsorted(lngs, east, side='right'))
+        in_lat = (lats[start:stop] >= south) & (lats[start:stop] <= north)
+        candidates = np.flatnonzero(in_lat) + start
+        if not len(candidates):
+            continue
+        hit = ring_contains(lngs[candidates], lats[candidates], outer)
+        for hole in holes:
+            hit &= ~ring_contains(lngs[candidates], lats[candidates], hole)
+        inside[candidates[hit]] = True
+    return inside
+
+
+_bundle_cache = {}
+
+
+def isochrones_from_bundle(profile, minutes, path=ISOCHRONE_BUNDLE_PATH):
+    """从静态等时圈包中取出 {书房 id: prepare_geometry 结果}，包不存在时返回空 dict。
+
+    按文件修改时间缓存，包重新生成后自动重新读取。
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    key = (path, profile, minutes)
+    cached = _bundle_cache.get(key)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'r', encoding='utf-8') as f:
+            bundle = json.load(f)
+        cached = (mtime, {
+            feature['properties']['library_id']: prepare_geometry(feature['geometry'])
+            for feature in bundle.get('features', [])
+            if feature['properties'].get('profile') == profile
+            and feature['properties'].get('contour') == minutes
+        })
+        _bundle_cache[key] = cached
+    return cached[1]
+
+
+def isochrone_geometry(collection, minutes):
+    """从 Mapbox 格式的 FeatureCollection 中取出指定分钟数的多边形"""
+    for feature in collection.get('features', []):
+        if feature.get('properties', {}).get('contour') in (minutes, None):
+            return feature['geometry']
+    return None
+
+
+class CoverageAnalyzer:
+    """人口网格 + 书房分区，网格只在创建时加载一次"""
+
+    def __init__(self, population_path=None, library_store=None):
+        lngs, lats, counts = load_population_grid(population_path)
+        order = np.argsort(lngs, kind='stable')
+        self.lngs, self.lats, self.counts = lngs[order], lats[order], counts[order]
+        library_store = library_store or LibraryStore(LIBRARY_DATA_PATH)
+        self.libraries = library_store.libraries
+        self.districts = list(dict.fromkeys(library['district'] for library in self.libraries))
+
+        # 网格归属到最近书房所在的区县（经度按纬度余弦缩放后比较距离）
+        library_lngs, library_lats = library_store.lngs, library_store.lats
+        cos_lat = np.cos(np.radians(self.lats.mean()))
+        dx = (self.lngs[:, None] - library_lngs[None, :]) * cos_lat
+        dy = self.lats[:, None] - library_lats[None, :]
+        nearest = np.argmin(dx * dx + dy * dy, axis=1)
+        district_index = {district: i for i, district in enumerate(self.districts)}
+        library_district = np.array([district_index[library['district']] for library in self.libraries])
+        self.cell_district = library_district[nearest]
+
+    def analyze(self, geometries):
+        """geometries 为 {书房 id: prepare_geometry 结果}，返回按区县和全市汇总的覆盖人口"""
+        covered = np.zeros(len(self.lngs), dtype=bool)
+        libraries = []
+        for library in self.libraries:
+            geometry = geometries.get(library['id'])
+            if geometry is None:
+                continue
+            inside = geometry_contains(self.lngs, self.lats, geometry)
+            covered |= inside
+            libraries.append({
+                'id': library['id'],
+                'name': library['name'],
+                'district': library['district'],
+                'population': round(float(self.counts[inside].sum()), 2),
+            })
+
+        district_count = len(self.districts)
+        totals = np.bincount(self.cell_district, weights=self.counts, minlength=district_count)
+        covered_totals = np.bincount(self.cell_district[covered], weights=self.counts[covered],
+                                     minlength=district_count)
+        districts = {}
+        for i, district in enumerate(self.districts):
+            districts[district] = self._summary(totals[i], covered_totals[i])
+
+        return {
+            'total': self._summary(self.counts.sum(), self.counts[covered].sum()),
+            'districts': districts,
+            'libraries': libraries,
+            'missing': [library['id'] for library in self.libraries if library['id'] not in geometries],
+            'cells': int(len(self.lngs)),
+        }
+
+    @staticmethod
+    def _summary(total, covered):
+        total, covered = float(total), float(covered)
+        return {
+            'population': round(total, 2),
+            'covered': round(covered, 2),
+            'uncovered': round(total - covered, 2),
+            'ratio': round(covered / total, 4) if total else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='统计书房等时圈覆盖的人口')
+    parser.add_argument('--profile', default='walking', choices=['walking', 'cycling', 'driving'])
+    parser.add_argument('--minutes', type=int, default=15)
+    parser.add_argument('--bundle', default=ISOCHRONE_BUNDLE_PATH, help='build_isochrones.py 生成的等时圈包')
+    parser.add_argument('--json', action='store_true', help='输出 JSON')
+    args = parser.parse_args()
+
+    geometries = isochrones_from_bundle(args.profile, args.minutes, args.bundle)
+    if not geometries:
+        parser.error(f"{args.bundle} 中没有 {args.profile} {args.minutes} 分钟的等时圈，请先运行 build_isochrones.py")
+    result = CoverageAnalyzer().analyze(geometries)
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    total = result['total']
+    print(f"{args.profile} {args.minutes} 分钟：覆盖 {total['covered']:.0f} / {total['population']:.0f} ({total['ratio']:.1%})")
+    for district, summary in result['districts'].items():
+        print(f"  {district}: {summary['covered']:.0f} / {summary['population']:.0f} ({summary['ratio']:.1%})")
+    if result['missing']:
+        print(f"缺少 {len(result['missing'])} 个书房的等时圈: {result['missing']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+# fake_mapbox.py
+"""本地模拟的 Mapbox 上游，用于压测和离线调试代理，不消耗 Mapbox 配额。
+
+实现代理会用到的接口：等时圈、样式、TileJSON、矢量瓦片 (PBF)、字体、精灵图。
+每个响应前按配置等待一段延迟，并按错误率返回 503；所有请求按类型计数，
+`/__fake/stats` 返回计数，`/__fake/reset` 清零。
+
+    python fake_mapbox.py --port 8765 --latency-ms 80 --jitter-ms 40 --error-rate 0.01
+    MAPBOX_API_BASE=http://127.0.0.1:8765 MAPBOX_ACCESS_TOKEN=fake python app.py
+
+benchmark.py 会在进程内启动它，也可以单独运行给 build_isochrones.py --base-url 使用。
+"""
+import argparse
+import gzip
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# 各出行方式的平均速度 (米/分钟)，用来决定等时圈的大小
+SPEED_M_PER_MIN = {'walking': 83, 'cycling': 250, 'driving': 500}
+TILE_VARIANTS = 32  # 预先生成的瓦片种类数，按 z/x/y 哈希选取，避免请求时现场生成
+
+ROUTES = [
+    ('isochrone', re.compile(r'^/isochrone/v1/mapbox/(?P<profile>[\w-]+)/(?P<lng>-?[\d.]+),(?P<lat>-?[\d.]+)$')),
+    ('styles', re.compile(r'^/styles/v1/(?P<owner>[^/]+)/(?P<style>[^/]+)$')),
+    ('tilejson', re.compile(r'^/v4/(?P<tileset>[^/]+)\.json$')),
+    ('tiles', re.compile(r'^/(?:tiles/)?v4/[^/]+/\d+/\d+/\d+\.(?:vector\.pbf|mvt)$')),
+    ('fonts', re.compile(r'^/fonts/v1/[^/]+/[^/]+/\d+-\d+\.pbf$')),
+    ('sprites', re.compile(r'^/sprites/v1/[^/]+/[^/]+/sprite(?:@2x)?\.(?P<ext>json|png)$')),
+]
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field(number, payload):
+    """长度前缀字段 (wire type 2)"""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def fake_vector_tile(size, seed):
+    """生成一个结构合法的 Mapbox Vector Tile：一个 road 图层，若干条随机折线，总大小约为 size 字节。
+
+    坐标是随机游走的小整数，压缩率与真实瓦片接近（gzip 后约为原大小的一半）。
+    """
+    rng = random.Random(seed)
+    features = []
+    total = 0
+    feature_id = 1
+    while total < size:
+        points = rng.randint(8, 64)
+        # MoveTo(1) + LineTo(points - 1)
+        geometry = [_varint(1 << 3 | 1), _varint(_zigzag(rng.randint(0, 4096))), _varint(_zigzag(rng.randint(0, 4096))),
+                    _varint((points - 1) << 3 | 2)]
+        for _ in range(points - 1):
+            geometry.append(_varint(_zigzag(rng.randint(-64, 64))))
+            geometry.append(_varint(_zigzag(rng.randint(-64, 64))))
+        feature = (_varint(1 << 3) + _varint(feature_id)                    # id
+                   + _field(2, _varint(0) + _varint(rng.randint(0, 3)))     # tags: class=<value>
+                   + _varint(3 << 3) + _varint(2)                           # type = LINESTRING
+                   + _field(4, b''.join(geometry)))
+        features.append(_field(2, feature))
+        total += len(features[-1])
+        feature_id += 1
+    values = b''.join(_field(4, _field(1, name.encode())) for name in ('primary', 'secondary', 'street', 'path'))
+    layer = (_varint(15 << 3) + _varint(2)           # version
+             + _field(1, b'road')                   # name
+             + b''.join(features)
+             + _field(3, b'class')                  # keys
+             + values
+             + _varint(5 << 3) + _varint(4096))     # extent
+    return _field(3, layer)
+
+
+def fake_png(width, height, seed):
+    """合法的 RGBA PNG，内容为随机色块"""
+    rng = random.Random(seed)
+    rows = b''.join(b'\x00' + bytes(rng.getrandbits(8) for _ in range(4)) * width for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows))
+            + chunk(b'IEND', b''))
+
+
+def fake_isochrone(profile, lng, lat, minutes_list, vertices, polygons=True):
+    """与 Mapbox Isochrone API 结构相同的 FeatureCollection，每个分钟数一个带随机起伏的近似圆"""
+    rng = random.Random(f"{profile}:{lng:.5f},{lat:.5f}")
+    speed = SPEED_M_PER_MIN.get(profile, 83)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    colors = ['#bf4040', '#bfa040', '#40bf40', '#4040bf']
+    features = []
+    # Mapbox 按分钟数从大到小返回
+    for index, minutes in enumerate(sorted(minutes_list, reverse=True)):
+        radius_m = speed * minutes
+        ring = []
+        for i in range(vertices):
+            angle = 2 * math.pi * i / vertices
+            r = radius_m * (0.75 + 0.25 * rng.random())
+            ring.append([round(lng + r * math.cos(angle) / (111320 * cos_lat), 6),
+                         round(lat + r * math.sin(angle) / 110540, 6)])
+        ring.append(ring[0])
+        color = colors[index % len(colors)]
+        features.append({
+            'type': 'Feature',
+            'properties': {'fill': color, 'fillOpacity': 0.33, 'fill-opacity': 0.33, 'fillColor': color,
+                           'color': color, 'contour': minutes, 'opacity': 0.33, 'metric': 'time'},
+            'geometry': {'type': 'Polygon', 'coordinates': [ring]} if polygons
+            else {'type': 'LineString', 'coordinates': ring},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def fake_style(owner, style):
+    return {
+        'version': 8,
+        'name': style,
+        'sources': {'composite': {'type': 'vector', 'url': 'mapbox://mapbox.mapbox-streets-v8'}},
+        'sprite': f'mapbox://sprites/{owner}/{style}',
+        'glyphs': 'mapbox://fonts/mapbox/{fontstack}/{range}.pbf',
+        'layers': [
+            {'id': 'background', 'type': 'background', 'paint': {'background-color': '#111'}},
+            {'id': 'road', 'type': 'line', 'source': 'composite', 'source-layer': 'road',
+             'paint': {'line-color': '#444'}},
+            {'id': 'road-label', 'type': 'symbol', 'source': 'composite', 'source-layer': 'road',
+             'layout': {'text-field': ['get', 'name'], 'text-font': ['DIN Pro Regular', 'Arial Unicode MS Regular']}},
+        ],
+    }
+
+
+def fake_tilejson(tileset):
+    return {
+        'tilejson': '2.2.0',
+        'name': tileset,
+        'scheme': 'xyz',
+        'minzoom': 0,
+        'maxzoom': 16,
+        'tiles': [f'https://a.tiles.mapbox.com/v4/{tileset}/{{z}}/{{x}}/{{y}}.vector.pbf',
+                  f'https://b.tiles.mapbox.com/v4/{tileset}/{{z}}/{{x}}/{{y}}.vector.pbf'],
+    }
+
+
+class FakeMapbox:
+    """模拟服务的配置、预生成的响应体和请求计数（线程安全）"""
+
+    def __init__(self, latency_ms=50, jitter_ms=0, error_rate=0.0, tile_bytes=40 * 1024,
+                 font_bytes=32 * 1024, isochrone_vertices=200, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.isochrone_vertices = isochrone_vertices
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.tiles = [fake_vector_tile(tile_bytes, f"{seed}:{i}") for i in range(TILE_VARIANTS)]
+        self.tiles_gzip = [gzip.compress(tile, mtime=0) for tile in self.tiles]
+        font_rng = random.Random(f"{seed}:font")
+        self.font = bytes(font_rng.getrandbits(8) for _ in range(font_bytes))
+        self.sprite_png = fake_png(64, 64, seed)
+        self.sprite_json = json.dumps({f'icon-{i}': {'x': (i % 4) * 16, 'y': (i // 4) * 16, 'width': 16,
+                                                      'height': 16, 'pixelRatio': 1} for i in range(16)}).encode()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = {}
+            self._errors = 0
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'requests': dict(self._counts), 'total': sum(self._counts.values()),
+                    'errors': self._errors, 'bytes': self._bytes}
+
+    def _record(self, kind, size, error):
+        with self._lock:
+            self._counts[kind] = self._counts.get(kind, 0) + 1
+            self._errors += error
+            self._bytes += size
+
+    def _delay_and_fail(self):
+        with self._rng_lock:
+            delay = self.latency_ms + self._rng.uniform(0, self.jitter_ms)
+            failed = self._rng.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay / 1000)
+        return failed
+
+    def respond(self, path, query, accept_encoding):
+        """返回 (状态码, 响应头 dict, 响应体)"""
+        for kind, pattern in ROUTES:
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            return 404, {'Content-Type': 'application/json'}, b'{"message":"Not Found"}'
+        if not query.get('access_token'):
+            self._record(kind, 0, True)
+            return 401, {'Content-Type': 'application/json'}, b'{"message":"Not Authorized - No Token"}'
+
+        if self._delay_and_fail():
+            body = b'{"message":"Service Unavailable"}'
+            self._record(kind, len(body), True)
+            return 503, {'Content-Type': 'application/json'}, body
+
+        headers = {}
+        if kind == 'isochrone':
+            minutes = [int(m) for m in query.get('contours_minutes', '15').split(',')]
+            data = fake_isochrone(match['profile'], float(match['lng']), float(match['lat']), minutes,
+                                  self.isochrone_vertices, query.get('polygons', 'false') == 'true')
+            body, content_type = json.dumps(data).encode(), 'application/json'
+        elif kind == 'styles':
+            body, content_type = json.dumps(fake_style(match['owner'], match['style'])).encode(), 'application/json'
+        elif kind == 'tilejson':
+            body, content_type = json.dumps(fake_tilejson(match['tileset'])).encode(), 'application/json'
+        elif kind == 'tiles':
+            variant = zlib.crc32(path.encode()) % TILE_VARIANTS
+            content_type = 'application/vnd.mapbox-vector-tile'
+            # 与 Mapbox 相同：客户端接受 gzip 时返回压缩后的瓦片
+            if 'gzip' in accept_encoding:
+                body = self.tiles_gzip[variant]
+                headers['Content-Encoding'] = 'gzip'
+            else:
+                body = self.tiles[variant]
+            headers['ETag'] = f'"{variant:08x}"'
+        elif kind == 'fonts':
+            body, content_type = self.font, 'application/x-protobuf'
+        else:
+            if match['ext'] == 'png':
+                body, content_type = self.sprite_png, 'image/png'
+            else:
+                body, content_type = self.sprite_json, 'application/json'
+        headers['Content-Type'] = content_type
+        headers.setdefault('Cache-Control', 'max-age=43200')
+        self._record(kind, len(body), False)
+        return 200, headers, body
+
+
+class FakeMapboxHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 支持 keep-alive，与真实上游一样复用连接
+
+    def do_GET(self):
+        fake = self.server.fake
+        url = urlsplit(self.path)
+        if url.path == '/__fake/stats':
+            status, headers, body = 200, {'Content-Type': 'application/json'}, json.dumps(fake.stats()).encode()
+        elif url.path == '/__fake/reset':
+            fake.reset()
+            status, headers, body = 200, {'Content-Type': 'application/json'}, b'{"reset":true}'
+        else:
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            status, headers, body = fake.respond(url.path, query, self.headers.get('Accept-Encoding', ''))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 压测时每个请求都打印日志会影响结果
+
+
+def start_server(fake, host='127.0.0.1', port=0):
+    """在后台线程中启动模拟服务，返回 server（server.server_address 为实际监听地址）"""
+    server = ThreadingHTTPServer((host, port), FakeMapboxHandler)
+    server.daemon_threads = True
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, name='fake-mapbox', daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    """模拟服务的命令行参数，benchmark.py 共用"""
+    parser.add_argument('--latency-ms', type=float, default=50, help='每个上游响应的固定延迟（毫秒）')
+    parser.add_argument('--jitter-ms', type=float, default=30, help='在固定延迟上再随机增加 0~jitter 毫秒')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 503 的概率 (0~1)')
+    parser.add_argument('--tile-bytes', type=int, default=40 * 1024, help='矢量瓦片未压缩大小（字节）')
+    parser.add_argument('--font-bytes', type=int, default=32 * 1024, help='字体 PBF 大小（字节）')
+    parser.add_argument('--isochrone-vertices', type=int, default=200, help='每个等时圈多边形的顶点数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，相同种子生成相同的响应和延迟序列')
+
+
+def fake_from_args(args):
+    return FakeMapbox(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                      tile_bytes=args.tile_bytes, font_bytes=args.font_bytes,
+                      isochrone_vertices=args.isochrone_vertices, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟的 Mapbox 上游')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(fake_from_args(args), args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"模拟 Mapbox 服务已启动: http://{host}:{port} (延迟 {args.latency_ms}+{args.jitter_ms}ms, "
+          f"错误率 {args.error_rate:.1%})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+# gunicorn.conf.py
+"""生产环境入口：gunicorn -c gunicorn.conf.py wsgi:app
+
+默认使用 gevent 协程 worker：requests 的 socket 调用被打上猴子补丁后变为非阻塞，
+等待 Mapbox 时不会占住工作线程，单个进程即可同时挂起数百个上游请求，
+路由代码与开发服务器下完全相同。没有安装 gevent 时可设 GUNICORN_WORKER_CLASS=gthread。
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('FLASK_RUN_PORT', '5002')}"
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+if worker_class == 'gevent':
+    # 每个 worker 同时处理的连接数（协程数）
+    worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+    concurrency = int(os.getenv('UPSTREAM_POOL_SIZE', 100))
+else:
+    threads = int(os.getenv('GUNICORN_THREADS', 16))
+    concurrency = threads
+
+# 连接池按每个 worker 的并发量配置，见 upstream.client_from_env
+os.environ.setdefault('WORKER_THREADS', str(concurrency))
+# 上游令牌桶是整台机器的配额，每个 worker 分得 1/workers，见 upstream.scheduler_from_env
+os.environ.setdefault('UPSTREAM_WORKERS', str(workers))
+
+# 上游读取超时之外再留出余量，避免慢请求被当作卡死的 worker 杀掉
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
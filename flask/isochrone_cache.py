@@ -0,0 +1,279 @@
+# isochrone_cache.py
+"""等时圈响应缓存：进程内 LRU + TTL，可选 SQLite 持久化层。
+
+前端请求的几乎都是同一批书房坐标 (minutes=15, profile=walking)，
+因此按 (profile, minutes, 吸附到网格后的经纬度) 缓存 Mapbox 的返回结果。
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 批量读取 SQLite 时每条语句的键数，低于 SQLite 默认的 999 个参数上限
+DB_BATCH_SIZE = 500
+# 派生结果（例如按缩放级别简化的几何）的键 = 原始键 + 分隔符 + 后缀；原始键本身不含该分隔符
+VARIANT_SEPARATOR = '|'
+
+
+def snap_coordinate(value, grid):
+    """把经度/纬度吸附到 grid（度）大小的网格上，grid<=0 时原样返回"""
+    if grid <= 0:
+        return value
+    # round 后再格式化，避免 112.4300000001 这类浮点尾巴进入缓存键
+    decimals = max(0, len(f"{grid:.10f}".rstrip('0').split('.')[1]))
+    return round(round(value / grid) * grid, decimals)
+
+
+class IsochroneCache:
+    """两级等时圈缓存。
+
+    - 一级：进程内 OrderedDict 实现的 LRU，容量 max_entries，条目 ttl 秒后过期
+    - 二级（可选）：SQLite 文件，进程重启后仍可命中，同样遵守 ttl
+    - 过期 max_stale 秒内的条目由 lookup() 返回并标记为过期，用于先响应后刷新
+    - 派生结果的键带上原始条目的存入时间 (variant_key)，原始条目重新写入时删除旧的派生结果
+    """
+
+    def __init__(self, max_entries=1024, ttl=7 * 24 * 3600, grid=0.0001, db_path=None, max_stale=0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.grid = grid
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expirations': 0,
+        }
+        if db_path:
+            self._init_db()
+
+    # --- 键 ---
+    def snap(self, lng, lat):
+        """返回吸附后的 (lng, lat)，上游请求也应使用吸附后的坐标以保证结果一致"""
+        return snap_coordinate(lng, self.grid), snap_coordinate(lat, self.grid)
+
+    def make_key(self, profile, minutes, lng, lat, backend='mapbox'):
+        snapped_lng, snapped_lat = self.snap(lng, lat)
+        key = f"{profile}:{minutes}:{snapped_lng}:{snapped_lat}"
+        # 非 Mapbox 后端加前缀，切换后端时不会读到另一个后端的结果
+        return key if backend == 'mapbox' else f"{backend}:{key}"
+
+    def variant_key(self, key, stored_at, suffix):
+        """原始条目的派生结果键；原始条目刷新后存入时间变化，不会读到按旧几何计算的结果"""
+        return f"{key}{VARIANT_SEPARATOR}{stored_at:.6f}{VARIANT_SEPARATOR}{suffix}"
+
+    # --- 读写 ---
+    def get(self, key):
+        """命中返回缓存的 GeoJSON(dict)，未命中或已过期返回 None"""
+        return self.lookup(key, allow_stale=False)[0]
+
+    def lookup(self, key, allow_stale=True):
+        """返回 (GeoJSON, 是否已过期)，未命中时为 (None, False)。
+
+        过期不超过 max_stale 秒的条目仍然返回，由调用方先用旧结果响应、再在后台刷新；
+        allow_stale=False 时这类条目按未命中返回和计数。超过 ttl + max_stale 的条目删除。
+        每次调用只计一次命中 / 过期命中 / 未命中。
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                age = now - stored_at
+                if age <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return value, False
+                if age <= self.ttl + self.max_stale:
+                    self._entries.move_to_end(key)
+                    if not allow_stale:
+                        self._stats['misses'] += 1
+                        return None, False
+                    self._stats['stale_hits'] += 1
+                    return value, True
+                del self._entries[key]
+                self._stats['expirations'] += 1
+
+        if self.db_path:
+            row = self._db_get(key)
+            if row is not None:
+                stored_at, payload = row
+                age = now - stored_at
+                if age <= self.ttl + self.max_stale:
+                    value = json.loads(payload)
+                    stale = age > self.ttl
+                    with self._lock:
+                        self._memory_put(key, value, stored_at)
+                        if stale and not allow_stale:
+                            self._stats['misses'] += 1
+                            return None, False
+                        self._stats['stale_hits' if stale else 'disk_hits'] += 1
+                    return value, stale
+                self._db_delete(key)
+                with self._lock:
+                    self._stats['expirations'] += 1
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None, False
+
+    def peek_many(self, keys, allow_stale=False):
+        """批量读取，返回 {键: (GeoJSON, 存入时间)}，只包含命中的键。
+
+        只读不计数、不调整 LRU 顺序，也不回填内存，供覆盖统计等一次扫描全部书房的场景使用；
+        内存中没有的键用一个 SQLite 连接分批查询。
+        """
+        limit = self.ttl + self.max_stale if allow_stale else self.ttl
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and now - entry[0] <= limit:
+                    found[key] = (entry[1], entry[0])
+        remaining = [key for key in keys if key not in found]
+        if self.db_path and remaining:
+            for key, stored_at, payload in self._db_get_many(remaining):
+                if now - stored_at <= limit:
+                    found[key] = (json.loads(payload), stored_at)
+        return found
+
+    def peek(self, key, allow_stale=False):
+        """不计数的单个读取，返回 (GeoJSON, 存入时间)，未命中时为 (None, None)"""
+        return self.peek_many([key], allow_stale).get(key, (None, None))
+
+    def set(self, key, value):
+        stored_at = time.time()
+        is_variant = VARIANT_SEPARATOR in key
+        prefix = f"{key}{VARIANT_SEPARATOR}"
+        with self._lock:
+            if not is_variant:
+                for variant in [k for k in self._entries if k.startswith(prefix)]:
+                    del self._entries[variant]
+            self._memory_put(key, value, stored_at)
+            self._stats['stores'] += 1
+        if self.db_path:
+            self._db_put(key, value, stored_at)
+            if not is_variant:
+                self._db_delete_variants(prefix)
+
+    def _memory_put(self, key, value, stored_at):
+        # 调用方需持有 self._lock
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM isochrones')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._entries)
+        hits = stats['memory_hits'] + stats['disk_hits']
+        lookups = hits + stats['misses']
+        stats['hits'] = hits
+        stats['hit_ratio'] = round(hits / lookups, 4) if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['ttl'] = self.ttl
+        stats['max_stale'] = self.max_stale
+        stats['grid'] = self.grid
+        stats['disk_enabled'] = bool(self.db_path)
+        return stats
+
+    # --- SQLite 持久化层 ---
+    def _connect(self):
+        # 每次操作单独建连接，避免跨线程共享 sqlite3 连接
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def _init_db(self):
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS isochrones ('
+                ' key TEXT PRIMARY KEY,'
+                ' stored_at REAL NOT NULL,'
+                ' payload TEXT NOT NULL)'
+            )
+
+    def _db_get(self, key):
+        try:
+            with self._connect() as conn:
+                return conn.execute(
+                    'SELECT stored_at, payload FROM isochrones WHERE key = ?', (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("读取等时圈磁盘缓存出错: %s", e)
+            return None
+
+    def _db_get_many(self, keys):
+        rows = []
+        try:
+            with self._connect() as conn:
+                # SQLite 单条语句的参数个数有上限，分批查询
+                for start in range(0, len(keys), DB_BATCH_SIZE):
+                    batch = keys[start:start + DB_BATCH_SIZE]
+                    rows.extend(conn.execute(
+                        f"SELECT key, stored_at, payload FROM isochrones WHERE key IN ({','.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall())
+        except sqlite3.Error as e:
+            logger.warning("读取等时圈磁盘缓存出错: %s", e)
+        return rows
+
+    def _db_put(self, key, value, stored_at):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO isochrones (key, stored_at, payload) VALUES (?, ?, ?)',
+                    (key, stored_at, json.dumps(value, separators=(',', ':'))),
+                )
+        except sqlite3.Error as e:
+            logger.warning("写入等时圈磁盘缓存出错: %s", e)
+
+    def _db_delete_variants(self, prefix):
+        # 以 prefix 开头的键按字典序落在 [prefix, prefix 末位 + 1) 区间内，可以走主键索引
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        try:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM isochrones WHERE key >= ? AND key < ?', (prefix, upper))
+        except sqlite3.Error as e:
+            logger.warning("删除等时圈磁盘缓存出错: %s", e)
+
+    def _db_delete(self, key):
+        try:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM isochrones WHERE key = ?', (key,))
+        except sqlite3.Error as e:
+            logger.warning("删除等时圈磁盘缓存出错: %s", e)
+
+
+def cache_from_env():
+    """根据环境变量 (.env) 创建缓存实例"""
+    db_path = os.getenv('ISOCHRONE_CACHE_DB', '').strip() or None
+    return IsochroneCache(
+        max_entries=int(os.getenv('ISOCHRONE_CACHE_SIZE', 1024)),
+        ttl=float(os.getenv('ISOCHRONE_CACHE_TTL', 7 * 24 * 3600)),
+        max_stale=float(os.getenv('ISOCHRONE_CACHE_STALE_MAX', 7 * 24 * 3600)),
+        grid=float(os.getenv('ISOCHRONE_CACHE_GRID', 0.0001)),
+        db_path=db_path,
+    )
@@ -0,0 +1,173 @@
+# isochrone_simplify.py
+"""等时圈几何的服务端简化：Douglas-Peucker 抽稀、坐标取整，可选差分整数编码。
+
+Mapbox 返回的等时圈为 6 位小数（约 0.1 米），每个多边形几百个顶点，全市视图下一个屏幕像素就有几十米，
+绝大多数顶点画不出来。按请求的缩放级别把容差设为一个像素、小数位取到半个像素以内，
+顶点数和字节数都能降一个数量级，浏览器端解析和三角化也随之变快。
+
+    zoom       地图缩放级别 (0-22)，容差 = 该级别一个像素对应的经度，小数位随之确定
+    precision  保留的小数位 (0-7)；只给 precision 时容差取 10^-precision
+    encoding   geojson（默认）或 delta：每个环编码为 [x0, y0, dx1, dy1, ...] 的整数数组，
+               实际坐标 = 累加值 / scale，scale 记录在 FeatureCollection 的 encoding 字段中
+
+简化在米制比例下进行（纬度按 1/cos(lat) 拉伸，与 Web 墨卡托在城市范围内一致），
+闭合环简化后少于 4 个点时保留取整后的原环，洞缩没了直接丢弃。
+"""
+import math
+
+import numpy as np
+
+# Mapbox GL 的瓦片边长（像素）
+TILE_SIZE = 512
+MAX_ZOOM = 22
+MAX_PRECISION = 7
+ENCODINGS = ('geojson', 'delta')
+
+
+def pixel_degrees(zoom):
+    """缩放级别 zoom 下一个像素对应的经度"""
+    return 360 / (TILE_SIZE * 2 ** zoom)
+
+
+def parse_options(zoom=None, precision=None, encoding=None):
+    """校验请求参数，返回 (容差, 小数位, 编码)；都未提供时返回 None，非法时抛出 ValueError/TypeError"""
+    if zoom in (None, '') and precision in (None, '') and encoding in (None, '', 'geojson'):
+        return None
+    encoding = encoding or 'geojson'
+    if encoding not in ENCODINGS:
+        raise ValueError("Invalid encoding")
+    if zoom not in (None, ''):
+        zoom = int(zoom)
+        if not (0 <= zoom <= MAX_ZOOM):
+            raise ValueError("zoom out of range")
+        tolerance = pixel_degrees(zoom)
+        # 取整误差不超过半个像素
+        decimals = min(MAX_PRECISION, max(0, math.ceil(-math.log10(tolerance / 2))))
+    else:
+        tolerance = None
+        decimals = 6
+    if precision not in (None, ''):
+        decimals = int(precision)
+        if not (0 <= decimals <= MAX_PRECISION):
+            raise ValueError("precision out of range")
+    if tolerance is None:
+        tolerance = 10.0 ** -decimals if precision not in (None, '') else 0.0
+    return tolerance, decimals, encoding
+
+
+def variant_key(options):
+    """同一等时圈不同简化结果在缓存中的键后缀"""
+    tolerance, decimals, encoding = options
+    return f"simplified:{tolerance:.3g}:{decimals}:{encoding}"
+
+
+def douglas_peucker(points, tolerance):
+    """返回保留点的布尔掩码，首尾点总是保留；每段的点到线段距离一次向量化算完"""
+    count = len(points)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = points[start], points[end]
+        inner = points[start + 1:end]
+        ab = b - a
+        length_sq = float(ab @ ab)
+        if length_sq == 0:
+            # 闭合环的首尾是同一个点，退化为到该点的距离
+            distances = np.hypot(*(inner - a).T)
+        else:
+            distances = np.abs(ab[0] * (inner[:, 1] - a[1]) - ab[1] * (inner[:, 0] - a[0])) / math.sqrt(length_sq)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return keep
+
+
+def simplify_line(coords, tolerance, decimals, closed, y_scale):
+    """简化一条线 / 一个环，返回取整后的 ndarray；闭合环不足 4 个点时返回 None"""
+    points = np.asarray(coords, dtype=np.float64)[:, :2]
+    if tolerance > 0 and len(points) > 2:
+        scaled = points * (1.0, y_scale)
+        points = points[douglas_peucker(scaled, tolerance)]
+    rounded = np.round(points, decimals)
+    # 取整后相邻重复的点去掉
+    changed = np.ones(len(rounded), dtype=bool)
+    changed[1:] = np.any(rounded[1:] != rounded[:-1], axis=1)
+    rounded = rounded[changed]
+    if closed:
+        if len(rounded) < 4:
+            return None
+        if not np.array_equal(rounded[0], rounded[-1]):
+            rounded = np.vstack([rounded, rounded[:1]])
+    return rounded
+
+
+def encode_line(points, decimals, encoding):
+    if encoding == 'delta':
+        integers = np.round(points * 10 ** decimals).astype(np.int64)
+        integers[1:] = np.diff(integers, axis=0)
+        return integers.ravel().tolist()
+    if decimals == 0:
+        return points.astype(np.int64).tolist()
+    return points.tolist()
+
+
+def simplify_rings(rings, tolerance, decimals, encoding, y_scale):
+    """一个多边形（外环 + 洞）；外环过小时保留只取整不抽稀的结果"""
+    simplified = []
+    for i, ring in enumerate(rings):
+        points = simplify_line(ring, tolerance, decimals, True, y_scale)
+        if points is None and i == 0:
+            points = simplify_line(ring, 0, decimals, True, y_scale)
+        if points is not None:
+            simplified.append(encode_line(points, decimals, encoding))
+        elif i == 0:
+            return None
+    return simplified
+
+
+def simplify_geometry(geometry, tolerance, decimals, encoding):
+    """Polygon / MultiPolygon / LineString / MultiLineString，其他类型原样返回"""
+    if not geometry:
+        return geometry
+    kind, coords = geometry['type'], geometry['coordinates']
+    if not coords:
+        return geometry
+    if kind == 'Polygon':
+        y_scale = 1 / math.cos(math.radians(coords[0][0][1]))
+        rings = simplify_rings(coords, tolerance, decimals, encoding, y_scale)
+        coords = rings or []
+    elif kind == 'MultiPolygon':
+        y_scale = 1 / math.cos(math.radians(coords[0][0][0][1]))
+        polygons = (simplify_rings(polygon, tolerance, decimals, encoding, y_scale) for polygon in coords)
+        coords = [polygon for polygon in polygons if polygon]
+    elif kind == 'LineString':
+        y_scale = 1 / math.cos(math.radians(coords[0][1]))
+        coords = encode_line(simplify_line(coords, tolerance, decimals, False, y_scale), decimals, encoding)
+    elif kind == 'MultiLineString':
+        y_scale = 1 / math.cos(math.radians(coords[0][0][1]))
+        coords = [encode_line(simplify_line(line, tolerance, decimals, False, y_scale), decimals, encoding)
+                  for line in coords]
+    else:
+        return geometry
+    return {'type': kind, 'coordinates': coords}
+
+
+def simplify_collection(collection, options):
+    """返回简化后的 FeatureCollection 副本，options 为 parse_options 的结果"""
+    tolerance, decimals, encoding = options
+    simplified = {key: value for key, value in collection.items() if key != 'features'}
+    simplified['features'] = [
+        dict(feature, geometry=simplify_geometry(feature.get('geometry'), tolerance, decimals, encoding))
+        for feature in collection.get('features', [])
+    ]
+    if encoding == 'delta':
+        simplified['encoding'] = {'type': 'delta', 'scale': 10 ** decimals}
+    return simplified
+
@@ -0,0 +1,133 @@
+# library_store.py
+"""城市书房的内存索引：坐标只解析一次，存入连续的 NumPy 数组，并按经纬度网格分桶。
+
+最近邻 / 半径查询只计算附近几个网格里的书房，球面距离整批向量化计算。
+"""
+import json
+import math
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+# 网格边长（度），约 1 公里，洛阳的书房大多集中在市区，每格只有几个
+DEFAULT_CELL_DEG = 0.01
+
+
+def haversine_m(lng, lat, lngs, lats):
+    """一个点到一组点的大圆距离（米），lngs/lats 为数组"""
+    lng1, lat1 = math.radians(lng), math.radians(lat)
+    lng2, lat2 = np.radians(lngs), np.radians(lats)
+    h = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+
+class LibraryStore:
+    """只读的书房数据 + 网格索引，加载后线程间共享"""
+
+    def __init__(self, path, cell_deg=DEFAULT_CELL_DEG):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        self.cell_deg = cell_deg
+        self.libraries = []
+        for district_name, district_data in data['districts'].items():
+            for library in district_data['libraries']:
+                library = dict(library)
+                library.setdefault('district', district_name)
+                lng, lat = library.pop('coordinates').split(',')
+                library['lng'], library['lat'] = float(lng), float(lat)
+                self.libraries.append(library)
+
+        self.lngs = np.array([library['lng'] for library in self.libraries], dtype=np.float64)
+        self.lats = np.array([library['lat'] for library in self.libraries], dtype=np.float64)
+        self._by_id = {library['id']: i for i, library in enumerate(self.libraries)}
+
+        buckets = {}
+        for i, cell in enumerate(zip(self._cell(self.lngs), self._cell(self.lats))):
+            buckets.setdefault(cell, []).append(i)
+        self._grid = {cell: np.array(indices, dtype=np.int64) for cell, indices in buckets.items()}
+        if self.libraries:
+            self._cell_range = (int(self._cell(self.lngs).min()), int(self._cell(self.lngs).max()),
+                                int(self._cell(self.lats).min()), int(self._cell(self.lats).max()))
+
+    def __len__(self):
+        return len(self.libraries)
+
+    def _cell(self, values):
+        return np.floor(np.asarray(values) / self.cell_deg).astype(np.int64)
+
+    def get(self, library_id):
+        """按 id 返回书房记录，不存在时抛出 KeyError"""
+        return self.libraries[self._by_id[library_id]]
+
+    def coordinates(self, library_id):
+        library = self.get(library_id)
+        return library['lng'], library['lat']
+
+    def _candidates(self, col_min, col_max, row_min, row_max):
+        # 先裁剪到有书房的网格范围；范围内格子比非空格子还多时直接遍历非空格子
+        index_col_min, index_col_max, index_row_min, index_row_max = self._cell_range
+        col_min, col_max = max(col_min, index_col_min), min(col_max, index_col_max)
+        row_min, row_max = max(row_min, index_row_min), min(row_max, index_row_max)
+        if col_min > col_max or row_min > row_max:
+            return np.empty(0, dtype=np.int64)
+        if (col_max - col_min + 1) * (row_max - row_min + 1) > len(self._grid):
+            found = [indices for (col, row), indices in self._grid.items()
+                     if col_min <= col <= col_max and row_min <= row <= row_max]
+        else:
+            found = [self._grid[(col, row)]
+                     for col in range(col_min, col_max + 1)
+                     for row in range(row_min, row_max + 1)
+                     if (col, row) in self._grid]
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def _results(self, indices, distances):
+        order = np.argsort(distances, kind='stable')
+        return [dict(self.libraries[int(indices[i])], distance_m=round(float(distances[i]), 1)) for i in order]
+
+    def within(self, lng, lat, radius_m):
+        """radius_m 米内的书房，按距离升序"""
+        if not self.libraries:
+            return []
+        # 半径换算为经纬度范围，只取覆盖到的网格
+        dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+        dlng = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        indices = self._candidates(int(math.floor((lng - dlng) / self.cell_deg)),
+                                   int(math.floor((lng + dlng) / self.cell_deg)),
+                                   int(math.floor((lat - dlat) / self.cell_deg)),
+                                   int(math.floor((lat + dlat) / self.cell_deg)))
+        distances = haversine_m(lng, lat, self.lngs[indices], self.lats[indices])
+        keep = distances <= radius_m
+        return self._results(indices[keep], distances[keep])
+
+    def nearest(self, lng, lat, k=1):
+        """最近的 k 个书房，按距离升序。
+
+        以查询点所在网格为中心一圈圈向外扩，找到 k 个后再多扩到足以排除更远网格为止。
+        """
+        k = min(k, len(self.libraries))
+        if k <= 0:
+            return []
+        col, row = int(math.floor(lng / self.cell_deg)), int(math.floor(lat / self.cell_deg))
+        col_min, col_max, row_min, row_max = self._cell_range
+        # 查询点在索引范围外时，至少要扩到能碰到索引的那一圈
+        max_ring = max(abs(col - col_min), abs(col - col_max), abs(row - row_min), abs(row - row_max))
+        # 一圈网格在南北方向上对应的最短距离（经度方向按纬度余弦缩短，取较小者）
+        ring_m = math.radians(self.cell_deg) * EARTH_RADIUS_M * min(1.0, math.cos(math.radians(lat)))
+
+        ring = 0
+        while True:
+            indices = self._candidates(col - ring, col + ring, row - ring, row + ring)
+            if len(indices) >= k:
+                distances = haversine_m(lng, lat, self.lngs[indices], self.lats[indices])
+                kth = np.partition(distances, k - 1)[k - 1]
+                # 第 ring 圈之外的书房距离至少为 ring * ring_m
+                if kth <= ring * ring_m or ring >= max_ring:
+                    break
+                ring = max(ring + 1, min(max_ring, int(math.ceil(kth / ring_m))))
+                continue
+            if ring >= max_ring:
+                distances = haversine_m(lng, lat, self.lngs[indices], self.lats[indices])
+                break
+            ring += 1
+        return self._results(indices, distances)[:k]
@@ -0,0 +1,76 @@
+# log_setup.py
+"""代理的日志配置：分级、结构化，经队列由后台线程写出。
+
+请求线程只把日志记录放进内存队列（QueueHandler），格式化和写 stdout 由 QueueListener 的线程完成，
+慢速的终端或日志管道不会拖慢请求。每个请求的明细为 DEBUG 级别，默认 INFO 时不输出。
+
+    LOG_LEVEL=DEBUG LOG_FORMAT=json python app.py
+
+通过 extra 传入的字段会作为结构化字段输出：logger.info("...", extra={'route': ..., 'ms': ...})
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+# LogRecord 自带的属性，其余属性视为通过 extra 传入的字段
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+
+
+def record_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行 JSON：ts、level、logger、msg 加上 extra 字段"""
+
+    def format(self, record):
+        payload = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        payload.update(record_fields(record))
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """便于阅读的单行格式，extra 字段以 key=value 附在消息后面"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def setup_logging():
+    """配置根 logger，重复调用无副作用"""
+    global _listener
+    if _listener is not None:
+        return
+    level = os.getenv('LOG_LEVEL', 'INFO').upper()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if os.getenv('LOG_FORMAT', 'text') == 'json' else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    # 退出前把队列里剩下的日志写完
+    atexit.register(_listener.stop)
@@ -0,0 +1,184 @@
+# metrics.py
+"""进程内的 Prometheus 指标：计数器、仪表、直方图，由 /metrics 以文本格式输出。
+
+不依赖 prometheus_client，每次记录只是一次加锁的字典更新。缓存、连接池这类已经自带统计的对象
+通过 add_collector 注册回调，抓取时才读取，不在热路径上重复计数。
+gunicorn 多 worker 时每个进程各自计数，/metrics 返回的是处理该次抓取的 worker 的数据。
+"""
+import math
+import threading
+
+# 秒；覆盖从命中缓存的几毫秒到上游读取超时
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，收到 {labels}")
+        return tuple(str(label) for label in labels)
+
+    def samples(self):
+        """[(后缀, 标签值, 额外标签, 数值)]"""
+        with self._lock:
+            return [('', labels, (), value) for labels, value in sorted(self._values.items())]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            state[1] += 1
+            state[2] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(state[0]), state[1], state[2]) for labels, state in sorted(self._values.items())]
+        samples = []
+        for labels, counts, count, total in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', labels, (('le', _format_value(float(bound))),), cumulative))
+            samples.append(('_count', labels, (), count))
+            samples.append(('_sum', labels, (), total))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collect):
+        """collect() 在抓取时调用，返回 [(名称, 类型, 说明, [(标签 dict, 数值)])]"""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, extra, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(metric.labelnames, labels, extra)} "
+                             f"{_format_value(value)}")
+        for collect in self._collectors:
+            for name, kind, documentation, samples in collect():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# === 代理路由 ===
+HTTP_REQUESTS = REGISTRY.counter(
+    'proxy_http_requests_total', '按路由、方法和状态码统计的请求数', ('route', 'method', 'status'))
+HTTP_DURATION = REGISTRY.histogram(
+    'proxy_http_request_duration_seconds', '从收到请求到响应体发送完毕的耗时', ('route',))
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    'proxy_http_requests_in_flight', '正在处理（含正在流式发送）的请求数', ('route',))
+HTTP_RESPONSE_BYTES = REGISTRY.counter(
+    'proxy_http_response_bytes_total', '发送给客户端的响应体字节数', ('route',))
+
+# === 上游 (Mapbox) ===
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    'proxy_upstream_requests_total', '按接口类型和状态码统计的上游请求数（含重试后的最终结果）', ('kind', 'status'))
+UPSTREAM_DURATION = REGISTRY.histogram(
+    'proxy_upstream_request_duration_seconds', '上游请求到收到响应头的耗时（含重试）', ('kind',))
+UPSTREAM_ERRORS = REGISTRY.counter(
+    'proxy_upstream_errors_total', '上游错误：timeout / connection / http (4xx/5xx) / circuit_open / overloaded / other',
+    ('kind', 'class'))
+UPSTREAM_QUEUE_WAIT = REGISTRY.histogram(
+    'proxy_upstream_queue_wait_seconds', '上游请求在调度器中排队等待名额的时间', ('priority',),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+UPSTREAM_REJECTED = REGISTRY.counter(
+    'proxy_upstream_rejected_total', '调度器拒绝的上游请求：queue_full / client_limit / timeout', ('priority', 'reason'))
+
+# === 过期缓存与后台刷新 ===
+STALE_SERVED = REGISTRY.counter(
+    'proxy_stale_served_total', '过期但未超过上限的缓存先返回给浏览器的次数', ('cache',))
+BACKGROUND_REFRESHES = REGISTRY.counter(
+    'proxy_background_refresh_total', '后台刷新过期缓存的结果：ok / error', ('cache', 'result'))
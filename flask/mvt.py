@@ -0,0 +1,109 @@
+# mvt.py
+"""Mapbox Vector Tile (MVT 2.1) 编码器，只实现点要素，不依赖 protobuf / mapbox-vector-tile。
+
+    layer = mvt.Layer('population')
+    layer.add_point(x, y, {'count': 12.5})        # x / y 为瓦片内坐标 (0..extent)
+    data = mvt.encode_tile([layer])
+
+属性的键和值在图层内去重；整数按 uint / sint 编码，浮点数按 double，字符串按 string，布尔按 bool。
+"""
+import struct
+
+DEFAULT_EXTENT = 4096
+VERSION = 2
+
+# Feature.type
+POINT = 1
+# 几何命令
+MOVE_TO = 1
+
+
+def varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def tag(number, wire_type):
+    return varint(number << 3 | wire_type)
+
+
+def length_delimited(number, payload):
+    """长度前缀字段 (wire type 2)"""
+    return tag(number, 2) + varint(len(payload)) + payload
+
+
+def packed(number, values):
+    return length_delimited(number, b''.join(varint(value) for value in values))
+
+
+def encode_value(value):
+    """Value 消息：string = 1, double = 3, uint = 5, sint = 6, bool = 7"""
+    if isinstance(value, bool):
+        return tag(7, 0) + varint(int(value))
+    if isinstance(value, int):
+        return tag(5, 0) + varint(value) if value >= 0 else tag(6, 0) + varint(zigzag(value))
+    if isinstance(value, float):
+        return tag(3, 1) + struct.pack('<d', value)
+    return length_delimited(1, str(value).encode('utf-8'))
+
+
+class Layer:
+    """一个图层的要素、键表和值表"""
+
+    def __init__(self, name, extent=DEFAULT_EXTENT):
+        self.name = name
+        self.extent = extent
+        self._features = []
+        self._keys = {}
+        self._values = {}
+
+    def __len__(self):
+        return len(self._features)
+
+    def _index(self, table, item):
+        index = table.get(item)
+        if index is None:
+            index = table[item] = len(table)
+        return index
+
+    def add_point(self, x, y, properties=None, feature_id=None):
+        tags = []
+        for key, value in (properties or {}).items():
+            if value is None:
+                continue
+            tags.append(self._index(self._keys, key))
+            # 类型也作为键的一部分，1 和 1.0、True 不会合并为同一个值
+            tags.append(self._index(self._values, (type(value), value)))
+        feature = b''
+        if feature_id is not None:
+            feature += tag(1, 0) + varint(feature_id)
+        if tags:
+            feature += packed(2, tags)
+        feature += tag(3, 0) + varint(POINT)
+        # MoveTo 一次，坐标为相对 (0, 0) 的 zigzag 编码
+        feature += packed(4, (1 << 3 | MOVE_TO, zigzag(int(x)), zigzag(int(y))))
+        self._features.append(feature)
+
+    def encode(self):
+        return (tag(15, 0) + varint(VERSION)
+                + length_delimited(1, self.name.encode('utf-8'))
+                + b''.join(length_delimited(2, feature) for feature in self._features)
+                + b''.join(length_delimited(3, key.encode('utf-8')) for key in self._keys)
+                + b''.join(length_delimited(4, encode_value(value)) for _, value in self._values)
+                + tag(5, 0) + varint(self.extent))
+
+
+def encode_tile(layers):
+    """编码为 Tile 消息，跳过没有要素的图层；全部为空时返回 b''"""
+    return b''.join(length_delimited(3, layer.encode()) for layer in layers if len(layer))
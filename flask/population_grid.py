@@ -0,0 +1,179 @@
+# population_grid.py
+"""人口网格的紧凑二进制格式：导出、内存映射读取。
+
+population_data.json / heatmapData.js 中的格子落在规则网格上，却用 16 位小数的经纬度逐个存储。
+这里只存网格原点和步长，再存一个按行排列的稠密数值数组（空格子为 0）：
+未压缩约为原文件的 1/9，gzip 后约为 1/40。
+
+文件结构（小端序，头部 56 字节，数据按 8 字节对齐，浏览器可直接用 TypedArray 读取）：
+
+    0   4s   magic 'PGRD'
+    4   B    版本号 1
+    5   B    数值类型：1 = uint16 量化，2 = float32
+    6   2x   保留
+    8   I    列数 (经度方向)
+    12  I    行数 (纬度方向)
+    16  d    原点经度 (第 0 列格子中心)
+    24  d    原点纬度 (第 0 行格子中心，最南一行)
+    32  d    经度步长
+    40  d    纬度步长
+    48  d    量化比例：count = 存储值 * scale（float32 时为 1）
+    56  ...  rows * cols 个数值，行优先
+
+    python population_grid.py                        # 生成 static/data/population_grid.bin 及 .gz/.br（.br 需安装 brotli）
+    python population_grid.py --dtype float32
+"""
+import argparse
+import gzip
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(APP_DIR, '..', 'static', 'data')
+SOURCE_PATH = os.path.join(DATA_DIR, 'population_data.json')
+GRID_PATH = os.path.join(DATA_DIR, 'population_grid.bin')
+
+MAGIC = b'PGRD'
+VERSION = 1
+HEADER = struct.Struct('<4sBB2xIIddddd')
+DTYPES = {1: np.dtype('<u2'), 2: np.dtype('<f4')}
+DTYPE_CODES = {'uint16': 1, 'float32': 2}
+
+
+def detect_axis(values):
+    """从一组坐标推算网格原点和步长，返回 (原点, 步长, 每个值的下标)。
+
+    步长取相邻不同坐标差值中最小的那一档（中间空着的行列会是步长的整数倍），
+    所有坐标都必须在千分之一步长内落到网格上，否则抛出 ValueError。
+    """
+    unique = np.unique(values)
+    if len(unique) == 1:
+        return float(unique[0]), 1.0, np.zeros(len(values), dtype=np.int64)
+    diffs = np.diff(unique)
+    smallest = diffs.min()
+    step = float(np.median(diffs[diffs < smallest * 1.5]))
+    origin = float(unique[0])
+    positions = (values - origin) / step
+    indices = np.rint(positions).astype(np.int64)
+    if np.abs(positions - indices).max() > 1e-3:
+        raise ValueError("坐标不在规则网格上")
+    # 用所有点做一次最小二乘，减小只用相邻差值带来的累积误差
+    step = float(np.sum((values - origin) * indices) / np.sum(indices * indices))
+    return origin, step, indices
+
+
+def build_grid(lngs, lats, counts):
+    """返回 (原点经度, 原点纬度, 经度步长, 纬度步长, rows x cols 的 float64 数组)"""
+    origin_lng, step_lng, cols = detect_axis(lngs)
+    origin_lat, step_lat, rows = detect_axis(lats)
+    grid = np.zeros((int(rows.max()) + 1, int(cols.max()) + 1), dtype=np.float64)
+    np.add.at(grid, (rows, cols), counts)
+    return origin_lng, origin_lat, step_lng, step_lat, grid
+
+
+def encode(grid, origin_lng, origin_lat, step_lng, step_lat, dtype='uint16'):
+    """编码为上面描述的二进制格式"""
+    code = DTYPE_CODES[dtype]
+    if code == 1:
+        peak = float(grid.max())
+        scale = peak / 65535 if peak > 0 else 1.0
+        values = np.rint(grid / scale)
+        # 有人口但量化后为 0 的格子保留为 1，避免在热力图上消失
+        values[(grid > 0) & (values == 0)] = 1
+        data = values.astype(DTYPES[1])
+    else:
+        scale = 1.0
+        data = grid.astype(DTYPES[2])
+    rows, cols = grid.shape
+    header = HEADER.pack(MAGIC, VERSION, code, cols, rows, origin_lng, origin_lat, step_lng, step_lat, scale)
+    return header + data.tobytes()
+
+
+class PopulationGrid:
+    """内存映射读取的人口网格，数值数组只有访问时才会读入"""
+
+    def __init__(self, path=GRID_PATH):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path} 不是人口网格文件")
+        (magic, version, code, self.cols, self.rows, self.origin_lng, self.origin_lat,
+         self.step_lng, self.step_lat, self.scale) = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or code not in DTYPES:
+            raise ValueError(f"{path} 不是人口网格文件或版本不支持")
+        self.values = np.memmap(path, dtype=DTYPES[code], mode='r', offset=HEADER.size,
+                                shape=(self.rows, self.cols))
+
+    def cells(self):
+        """非空格子的 (lng, lat, count) 三个数组，与 JSON 中的格子一一对应"""
+        rows, cols = np.nonzero(self.values)
+        counts = self.values[rows, cols].astype(np.float64) * self.scale
+        return self.origin_lng + cols * self.step_lng, self.origin_lat + rows * self.step_lat, counts
+
+
+def load_source(path=SOURCE_PATH):
+    """读取 `heatmapData = [...]` 形式的 JS/JSON 文件，返回 (lng, lat, count) 三个数组"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    cells = json.loads(text[text.index('['):text.rindex(']') + 1])
+    lngs = np.fromiter((cell['lng'] for cell in cells), dtype=np.float64, count=len(cells))
+    lats = np.fromiter((cell['lat'] for cell in cells), dtype=np.float64, count=len(cells))
+    counts = np.fromiter((cell['count'] for cell in cells), dtype=np.float64, count=len(cells))
+    return lngs, lats, counts
+
+
+def write_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='把人口热力图数据导出为紧凑的二进制网格')
+    parser.add_argument('--source', default=SOURCE_PATH, help='population_data.json 或 heatmapData.js')
+    parser.add_argument('--out', default=GRID_PATH)
+    parser.add_argument('--dtype', choices=sorted(DTYPE_CODES), default='uint16',
+                        help='uint16 量化（默认，误差不超过最大值的 1/65535）或 float32')
+    args = parser.parse_args()
+
+    lngs, lats, counts = load_source(args.source)
+    origin_lng, origin_lat, step_lng, step_lat, grid = build_grid(lngs, lats, counts)
+    data = encode(grid, origin_lng, origin_lat, step_lng, step_lat, args.dtype)
+    write_atomic(args.out, data)
+    outputs = [(args.out, len(data))]
+
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    write_atomic(f"{args.out}.gz", compressed)
+    outputs.append((f"{args.out}.gz", len(compressed)))
+    try:
+        import brotli
+    except ImportError:
+        br_path = f"{args.out}.br"
+        if os.path.exists(br_path):
+            os.remove(br_path)  # 旧的 .br 与新的 .bin 不一致，不能留下
+        print(f"警告：未安装 brotli，没有生成 {os.path.basename(br_path)} (pip install brotli)", file=sys.stderr)
+    else:
+        compressed = brotli.compress(data, quality=11)
+        write_atomic(f"{args.out}.br", compressed)
+        outputs.append((f"{args.out}.br", len(compressed)))
+
+    source_size = os.path.getsize(args.source)
+    print(f"{len(counts)} 个格子 -> {grid.shape[0]} 行 x {grid.shape[1]} 列, "
+          f"步长 {step_lng:.8f} x {step_lat:.8f}")
+    for path, size in outputs:
+        print(f"  {os.path.basename(path)}: {size} 字节 (原文件 {source_size} 字节的 1/{source_size / size:.0f})")
+
+    # 校验：读回后与原始数据比较
+    lngs_back, lats_back, counts_back = PopulationGrid(args.out).cells()
+    order = np.lexsort((lngs, lats))  # 与读回的顺序一致：先按行（纬度）再按列（经度）
+    coordinate_error = max(np.abs(lngs[order] - lngs_back).max(), np.abs(lats[order] - lats_back).max())
+    print(f"  坐标最大误差 {coordinate_error:.2e} 度, 人口最大误差 {np.abs(counts[order] - counts_back).max():.4f}")
+
+
+if __name__ == '__main__':
+    main()
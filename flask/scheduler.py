@@ -0,0 +1,288 @@
+# scheduler.py
+"""上游请求调度：加权优先级队列 + 全局令牌桶 + 按客户端 IP 的公平排队。
+
+所有路由共用同一个 Mapbox 配额和连接池。不调度时，"生成所有等时圈"的几百个请求会和底图瓦片抢同一批连接，
+一个用户的批量操作就能让所有人的地图卡住。请求在发往上游前先取得一个名额：
+
+    优先级    interactive（样式、TileJSON、瓦片、字体、精灵图）> isochrone（单个等时圈）
+              > bulk（批量等时圈、通用代理）> background（后台刷新过期缓存）
+              空出名额时按权重做平滑加权轮询，高优先级占大头，低优先级也不会饿死
+    令牌桶    每秒 rate 个、最多攒 burst 个，对应 Mapbox 配额；没有令牌时请求排队等待
+    公平排队  同一优先级内按客户端 IP 轮流出队，一个客户端排队 + 进行中的请求数有上限
+
+队列已满、单个客户端超限或排队超过 max_wait 秒时抛出 Overloaded，路由返回 429 和 Retry-After。
+"""
+import contextvars
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+import requests
+
+# 优先级 -> 默认权重，顺序即优先级从高到低
+DEFAULT_WEIGHTS = OrderedDict([('interactive', 8), ('isochrone', 4), ('bulk', 2), ('background', 1)])
+# 上游接口类型 -> 默认优先级；路由可以覆盖（例如批量等时圈为 bulk）
+KIND_PRIORITIES = {
+    'styles': 'interactive',
+    'v4': 'interactive',
+    'tiles': 'interactive',
+    'fonts': 'interactive',
+    'sprites': 'interactive',
+    'isochrone': 'isochrone',
+}
+
+# 当前请求的 (优先级覆盖, 客户端)；请求开始时由路由设置，后台线程各自设置
+_context = contextvars.ContextVar('upstream_request_context', default=(None, None))
+
+
+def set_context(priority=None, client=None):
+    """设置之后本线程 / 协程发出的上游请求使用的优先级（None 表示按接口类型）和客户端"""
+    _context.set((priority, client))
+
+
+def current_context():
+    return _context.get()
+
+
+def priority_for(kind):
+    """路由覆盖的优先级优先，否则按上游接口类型，未知类型为 bulk"""
+    override, _ = _context.get()
+    return override or KIND_PRIORITIES.get(kind, 'bulk')
+
+
+def parse_weights(text):
+    """'interactive=8,bulk=1' -> 在默认权重基础上覆盖；未知优先级抛出 ValueError"""
+    weights = OrderedDict(DEFAULT_WEIGHTS)
+    for item in filter(None, (part.strip() for part in (text or '').split(','))):
+        name, value = item.split('=', 1)
+        if name.strip() not in weights:
+            raise ValueError(f"Unknown priority: {name}")
+        weights[name.strip()] = max(1, int(value))
+    return weights
+
+
+class Overloaded(requests.exceptions.RequestException):
+    """调度器拒绝请求；是 RequestException 的子类，已有的上游失败处理（返回旧缓存等）照常生效"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"上游请求排队已满 ({reason})，{retry_after} 秒后重试")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """调用方需持有调度器的锁；rate <= 0 时不限速"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self):
+        if self.rate <= 0:
+            return True
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_seconds(self):
+        """下一个令牌还要等多久"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class _Ticket:
+    __slots__ = ('priority', 'client', 'event', 'granted', 'enqueued_at')
+
+    def __init__(self, priority, client):
+        self.priority = priority
+        self.client = client
+        self.event = threading.Event()
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+
+class Scheduler:
+    """线程安全；acquire() 取得名额后必须调用 release()，推荐用 slot() 上下文管理器"""
+
+    def __init__(self, max_concurrency=16, rate=0, burst=None, weights=None, max_queue=256,
+                 max_per_client=64, max_wait=10.0, observe_wait=None):
+        self.max_concurrency = max_concurrency
+        self.weights = OrderedDict(weights or DEFAULT_WEIGHTS)
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+        self.max_wait = max_wait
+        self.bucket = TokenBucket(rate, burst if burst is not None else max(1, int(rate * 2)))
+        # observe_wait(优先级, 秒)：每个取得名额的请求排队了多久，用于指标
+        self.observe_wait = observe_wait
+        self._lock = threading.Lock()
+        # 优先级 -> OrderedDict(客户端 -> deque[_Ticket])；客户端按轮转顺序排列
+        self._queues = {priority: OrderedDict() for priority in self.weights}
+        self._queued = dict.fromkeys(self.weights, 0)
+        # 平滑加权轮询的当前值
+        self._current = dict.fromkeys(self.weights, 0)
+        self._client_load = {}
+        self._in_flight = 0
+        self._stats = {'admitted': dict.fromkeys(self.weights, 0), 'rejected': {}}
+
+    # --- 入队 / 出队 ---
+    def acquire(self, priority, client=None):
+        """排队直到取得名额；client 为 None 时不计入单个客户端的上限。超限时抛出 Overloaded"""
+        if priority not in self.weights:
+            priority = 'bulk'
+        ticket = _Ticket(priority, client)
+        with self._lock:
+            if client is not None and self._client_load.get(client, 0) >= self.max_per_client:
+                self._reject(priority, 'client_limit')
+            if self._queued[priority] >= self.max_queue:
+                self._reject(priority, 'queue_full')
+            self._enqueue(ticket)
+            self._dispatch()
+
+        deadline = ticket.enqueued_at + self.max_wait
+        while not ticket.event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._lock:
+                    if not ticket.granted:
+                        self._remove(ticket)
+                        self._reject(priority, 'timeout')
+                break
+            with self._lock:
+                token_wait = self.bucket.wait_seconds() if self._queued_total() else 0.0
+            # 令牌不足时没有 release() 来唤醒，等待的请求到点后自己尝试出队
+            ticket.event.wait(min(remaining, token_wait) if token_wait > 0 else remaining)
+            if not ticket.event.is_set():
+                with self._lock:
+                    self._dispatch()
+
+        if self.observe_wait:
+            self.observe_wait(priority, time.monotonic() - ticket.enqueued_at)
+        return ticket
+
+    def release(self, ticket):
+        with self._lock:
+            self._in_flight -= 1
+            if ticket.client is not None:
+                load = self._client_load[ticket.client] - 1
+                if load:
+                    self._client_load[ticket.client] = load
+                else:
+                    del self._client_load[ticket.client]
+            self._dispatch()
+
+    def slot(self, priority, client=None):
+        return _Slot(self, priority, client)
+
+    # --- 内部，调用方需持有 self._lock ---
+    def _enqueue(self, ticket):
+        self._queues[ticket.priority].setdefault(ticket.client, deque()).append(ticket)
+        self._queued[ticket.priority] += 1
+        if ticket.client is not None:
+            self._client_load[ticket.client] = self._client_load.get(ticket.client, 0) + 1
+
+    def _remove(self, ticket):
+        clients = self._queues[ticket.priority]
+        tickets = clients.get(ticket.client)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del clients[ticket.client]
+            self._queued[ticket.priority] -= 1
+            if ticket.client is not None:
+                load = self._client_load[ticket.client] - 1
+                if load:
+                    self._client_load[ticket.client] = load
+                else:
+                    del self._client_load[ticket.client]
+
+    def _queued_total(self):
+        return sum(self._queued.values())
+
+    def _pick_priority(self):
+        """平滑加权轮询（与 nginx upstream 相同），只在有请求排队的优先级之间选"""
+        waiting = [priority for priority, count in self._queued.items() if count]
+        if not waiting:
+            return None
+        total = 0
+        for priority in waiting:
+            self._current[priority] += self.weights[priority]
+            total += self.weights[priority]
+        chosen = max(waiting, key=lambda priority: self._current[priority])
+        self._current[chosen] -= total
+        return chosen
+
+    def _dispatch(self):
+        while self._in_flight < self.max_concurrency and self._queued_total():
+            if not self.bucket.take():
+                return
+            priority = self._pick_priority()
+            clients = self._queues[priority]
+            # 队首客户端出一个请求后移到队尾，各客户端轮流
+            client, tickets = next(iter(clients.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                clients.move_to_end(client)
+            else:
+                del clients[client]
+            self._queued[priority] -= 1
+            self._in_flight += 1
+            self._stats['admitted'][priority] += 1
+            ticket.granted = True
+            ticket.event.set()
+
+    def _reject(self, priority, reason):
+        key = (priority, reason)
+        self._stats['rejected'][key] = self._stats['rejected'].get(key, 0) + 1
+        # 按当前排队长度和令牌速率估算多久后可以重试
+        backlog = self._queued_total() + self._in_flight
+        rate = self.bucket.rate if self.bucket.rate > 0 else self.max_concurrency
+        raise Overloaded(reason, max(1, math.ceil(backlog / rate)))
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            oldest = {}
+            for priority, clients in self._queues.items():
+                heads = [tickets[0].enqueued_at for tickets in clients.values() if tickets]
+                oldest[priority] = round(now - min(heads), 3) if heads else 0.0
+            return {
+                'in_flight': self._in_flight,
+                'max_concurrency': self.max_concurrency,
+                'queued': dict(self._queued),
+                'oldest_wait_seconds': oldest,
+                'clients': len(self._client_load),
+                'tokens': round(self.bucket.tokens, 2) if self.bucket.rate > 0 else None,
+                'rate': self.bucket.rate,
+                'weights': dict(self.weights),
+                'admitted': dict(self._stats['admitted']),
+                'rejected': [{'priority': priority, 'reason': reason, 'count': count}
+                             for (priority, reason), count in sorted(self._stats['rejected'].items())],
+            }
+
+
+class _Slot:
+    def __init__(self, scheduler, priority, client):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.client = client
+        self.ticket = None
+
+    def __enter__(self):
+        self.ticket = self.scheduler.acquire(self.priority, self.client)
+        return self.ticket
+
+    def __exit__(self, *exc_info):
+        self.scheduler.release(self.ticket)
+        return False
@@ -0,0 +1,225 @@
+# seed_tiles.py
+"""预热代理的瓦片 / 字体 / 精灵图磁盘缓存。
+
+按样式解析出用到的矢量瓦片集、字体和精灵图，枚举范围内的 z/x/y 瓦片和字体区间，
+限速并发地写入与 app.py 相同的缓存目录，浏览器之后请求时直接命中缓存。
+
+    python seed_tiles.py --dry-run                       # 只统计数量
+    python seed_tiles.py --zoom 10 15                    # 默认范围为所有城市书房的外包框
+    python seed_tiles.py --bbox 112.2 34.5 112.7 34.8 --style mapbox/dark-v10 --rate 20
+
+进度写入缓存目录下的 seed_progress.txt，中断后重新运行会跳过已完成的资源。
+"""
+import argparse
+import json
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+import tile_cache as tile_cache_module
+from upstream import client_from_env
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+LIBRARY_DATA_PATH = os.path.join(APP_DIR, '..', 'static', 'data', '城市书房数据.json')
+GLYPH_RANGE_SIZE = 256
+
+
+class RateLimiter:
+    """简单的全局限速：相邻两次请求至少间隔 1/rate 秒"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_until = max(self._next, now)
+            self._next = wait_until + self.interval
+        if wait_until > now:
+            time.sleep(wait_until - now)
+
+
+def library_bbox(padding=0.02):
+    """所有城市书房坐标的外包框 (west, south, east, north)，四周留 padding 度"""
+    with open(LIBRARY_DATA_PATH, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    lngs, lats = [], []
+    for district_data in data['districts'].values():
+        for library in district_data['libraries']:
+            lng, lat = library['coordinates'].split(',')
+            lngs.append(float(lng))
+            lats.append(float(lat))
+    return min(lngs) - padding, min(lats) - padding, max(lngs) + padding, max(lats) + padding
+
+
+def lnglat_to_tile(lng, lat, zoom):
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_in_bbox(bbox, zoom):
+    west, south, east, north = bbox
+    x_min, y_min = lnglat_to_tile(west, north, zoom)
+    x_max, y_max = lnglat_to_tile(east, south, zoom)
+    for x in range(x_min, x_max + 1):
+        for y in range(y_min, y_max + 1):
+            yield x, y
+
+
+def fetch_json(client, upstream_path, params):
+    response = client.get(client.url(upstream_path), params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+def resolve_style(client, token, style):
+    """返回 (瓦片 URL 模板及其缩放范围列表, 字体列表, 精灵图路径前缀, 字形路径模板)"""
+    style_json = fetch_json(client, f"styles/v1/{style}", {'access_token': token})
+
+    tile_templates = []
+    for source in style_json.get('sources', {}).values():
+        if source.get('type') not in ('vector', 'raster', 'raster-dem'):
+            continue
+        if 'tiles' in source:
+            tilejson = source
+        elif str(source.get('url', '')).startswith('mapbox://'):
+            # mapbox://mapbox.mapbox-streets-v8 -> v4/mapbox.mapbox-streets-v8.json，与 vector_source_proxy 一致
+            tileset = source['url'][len('mapbox://'):]
+            tilejson = fetch_json(client, f"v4/{tileset}.json", {'access_token': token, 'secure': True})
+        else:
+            continue
+        for template in tilejson.get('tiles', []):
+            # 与 vector_source_proxy 相同：去掉域名，交给 /api/mapbox/tiles 代理
+            path = re.sub(r'^https?://[^/]+', '', template).split('?', 1)[0]
+            tile_templates.append((path.lstrip('/'), tilejson.get('minzoom', 0), tilejson.get('maxzoom', 22)))
+
+    fontstacks = set()
+    for layer in style_json.get('layers', []):
+        text_font = layer.get('layout', {}).get('text-font')
+        # 只处理字面量数组，表达式形式的 text-font 无法静态展开
+        if isinstance(text_font, list) and all(isinstance(f, str) for f in text_font):
+            fontstacks.add(','.join(text_font))
+
+    sprite = style_json.get('sprite')
+    sprite_path = sprite[len('mapbox://sprites/'):] if isinstance(sprite, str) and sprite.startswith('mapbox://sprites/') else None
+    glyphs = style_json.get('glyphs', '')
+    glyph_owner = glyphs[len('mapbox://fonts/'):].split('/', 1)[0] if glyphs.startswith('mapbox://fonts/') else None
+    return tile_templates, sorted(fontstacks), sprite_path, glyph_owner
+
+
+def enumerate_resources(tile_templates, fontstacks, sprite_path, glyph_owner, bbox, min_zoom, max_zoom):
+    """生成 (kind, upstream_path) 列表，upstream_path 与对应代理路由转发到上游的路径一致"""
+    resources = []
+    for template, source_min, source_max in tile_templates:
+        for zoom in range(max(min_zoom, source_min), min(max_zoom, source_max) + 1):
+            for x, y in tiles_in_bbox(bbox, zoom):
+                path = template.replace('{z}', str(zoom)).replace('{x}', str(x)).replace('{y}', str(y))
+                resources.append(('tiles', f"tiles/{path}"))
+    if glyph_owner:
+        for fontstack in fontstacks:
+            for start in range(0, 65536, GLYPH_RANGE_SIZE):
+                resources.append(('fonts', f"fonts/v1/{glyph_owner}/{fontstack}/{start}-{start + GLYPH_RANGE_SIZE - 1}.pbf"))
+    if sprite_path:
+        for suffix in ('.json', '.png', '@2x.json', '@2x.png'):
+            resources.append(('sprites', f"sprites/v1/{sprite_path}/sprite{suffix}"))
+    return resources
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='预热 Mapbox 瓦片 / 字体 / 精灵图缓存')
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'),
+                        help='范围，默认为所有城市书房的外包框')
+    parser.add_argument('--zoom', nargs=2, type=int, default=[10, 16], metavar=('MIN', 'MAX'))
+    parser.add_argument('--style', action='append', help='样式，如 mapbox/dark-v10，可重复指定')
+    parser.add_argument('--workers', type=int, default=8, help='并发请求数')
+    parser.add_argument('--rate', type=float, default=20, help='每秒最多请求数，0 表示不限速')
+    parser.add_argument('--no-fonts', action='store_true', help='不预热字体')
+    parser.add_argument('--progress', help='进度文件，默认在缓存目录下')
+    parser.add_argument('--dry-run', action='store_true', help='只统计需要请求的数量')
+    args = parser.parse_args()
+
+    token = os.getenv('MAPBOX_ACCESS_TOKEN')
+    if not token:
+        parser.error('Mapbox Access Token 未在 .env 文件中设置！')
+    cache = tile_cache_module.cache_from_env(os.path.join(APP_DIR, 'cache', 'mapbox'))
+    if cache is None:
+        parser.error('TILE_CACHE_DIR 为空，代理未启用瓦片缓存')
+    client = client_from_env()
+    bbox = tuple(args.bbox) if args.bbox else library_bbox()
+    min_zoom, max_zoom = args.zoom
+
+    resources = []
+    for style in args.style or ['mapbox/dark-v10']:
+        tile_templates, fontstacks, sprite_path, glyph_owner = resolve_style(client, token, style)
+        if args.no_fonts:
+            fontstacks = []
+        print(f"样式 {style}: {len(tile_templates)} 个瓦片模板, {len(fontstacks)} 组字体, 精灵图 {sprite_path or '无'}")
+        resources.extend(enumerate_resources(tile_templates, fontstacks, sprite_path, glyph_owner,
+                                             bbox, min_zoom, max_zoom))
+    resources = list(dict.fromkeys(resources))  # 多个样式共用的资源只请求一次
+
+    counts = {}
+    for kind, _ in resources:
+        counts[kind] = counts.get(kind, 0) + 1
+    print(f"范围 {bbox}, 缩放级别 {min_zoom}-{max_zoom}: 共 {len(resources)} 个资源 {counts}")
+    if args.dry_run:
+        return
+
+    progress_path = args.progress or os.path.join(cache.root, 'seed_progress.txt')
+    done = set()
+    if os.path.exists(progress_path):
+        with open(progress_path, 'r', encoding='utf-8') as f:
+            done = {line.rstrip('\n') for line in f}
+    pending = [(kind, path) for kind, path in resources if f"{kind} {path}" not in done]
+    print(f"已完成 {len(resources) - len(pending)} 个，待预热 {len(pending)} 个")
+
+    limiter = RateLimiter(args.rate)
+    progress_lock = threading.Lock()
+    params = {'access_token': token}
+
+    def seed(kind, path):
+        key = tile_cache_module.make_cache_key(kind, path, params)
+        entry = cache.lookup(kind, key)
+        if entry is not None and cache.is_fresh(entry):
+            return 'cached'
+        limiter.wait()
+        cache.fill(client, kind, key, path, params, entry)
+        return 'fetched'
+
+    results = {'cached': 0, 'fetched': 0, 'failed': 0}
+    with open(progress_path, 'a', encoding='utf-8') as progress, \
+            ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(seed, kind, path): (kind, path) for kind, path in pending}
+        for count, future in enumerate(as_completed(futures), 1):
+            kind, path = futures[future]
+            try:
+                results[future.result()] += 1
+                with progress_lock:
+                    progress.write(f"{kind} {path}\n")
+            except Exception as e:
+                results['failed'] += 1
+                print(f"预热失败: {path} ({e})")
+            if count % 100 == 0 or count == len(pending):
+                progress.flush()
+                print(f"[{count}/{len(pending)}] {results}")
+
+    print(f"预热完成: {results}, 缓存 {cache.stats()}")
+    if results['failed']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
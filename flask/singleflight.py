@@ -0,0 +1,68 @@
+# singleflight.py
+"""合并同时进行的相同上游请求 (single-flight)。
+
+多个请求同时需要同一份上游数据时，只有第一个（leader）真正请求上游，
+其余的等待它完成并共享结果或异常。冷缓存时可以避免把突发流量原样转发给 Mapbox。
+"""
+import threading
+
+
+def make_flight_key(url, params=None):
+    """规范化的请求键：URL + 排序后的查询参数，不含 access_token"""
+    query = '&'.join(f"{k}={v}" for k, v in sorted((params or {}).items()) if k != 'access_token')
+    return f"{url}?{query}"
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """按键合并并发调用（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'leaders': 0, 'shared': 0}
+
+    def do(self, key, fn):
+        """执行 fn()；若相同 key 的调用正在进行，则等待并返回它的结果（或抛出它的异常）"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats['shared'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats['leaders'] += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        return stats
@@ -0,0 +1,238 @@
+# site_selection.py
+"""新书房选址：在人口网格上用贪心最大覆盖找出能新增覆盖最多居民的 k 个位置。
+
+候选位置为有人口的网格中心。每个候选点在半径内覆盖的网格预先算成稀疏矩阵（CSR：indptr / indices），
+邻域查找按半径大小分桶，只比较相邻 3x3 个桶，全部为 NumPy 批量运算。
+已被现有书房覆盖的网格权重置 0，之后用 CELF（惰性贪心）选点：候选点的边际收益只会减少，
+堆顶的旧收益重新计算后仍是最大值时直接选中，绝大多数候选点不需要每轮重算。
+
+预算可以是半径（米），也可以是 出行方式 + 分钟数，按 /api/libraries/within 的约定换算为直线距离
+（步行 15 分钟约 1200 米）。使用出行方式时，现有书房的覆盖范围优先取静态等时圈包中的真实等时圈。
+
+    python site_selection.py --k 5                        # 步行 15 分钟，全市
+    python site_selection.py --k 3 --radius 1500 --district 涧西区
+    python site_selection.py --k 2 --per-district --json
+"""
+import argparse
+import heapq
+import json
+import math
+import threading
+import time
+
+import numpy as np
+
+import coverage
+from library_store import LibraryStore
+
+EARTH_RADIUS_M = 6371008.8
+# 直线距离换算速度（米/分钟），已计入道路绕行
+BUDGET_SPEED_M_PER_MIN = {'walking': 80, 'cycling': 200, 'driving': 400}
+# 同一半径的覆盖矩阵缓存个数
+MATRIX_CACHE_SIZE = 8
+
+
+def budget_radius(profile, minutes):
+    return BUDGET_SPEED_M_PER_MIN[profile] * minutes
+
+
+def neighbors(src_x, src_y, dst_x, dst_y, radius):
+    """每个 src 点 radius 内的 dst 点，返回 CSR (indptr, indices)；坐标为平面米制坐标。
+
+    dst 按边长为 radius 的方格分桶并排序，每个 src 只需查看所在格及周围 8 格。
+    """
+    dst_cx = np.floor(dst_x / radius).astype(np.int64)
+    dst_cy = np.floor(dst_y / radius).astype(np.int64)
+    src_cx = np.floor(src_x / radius).astype(np.int64)
+    src_cy = np.floor(src_y / radius).astype(np.int64)
+    # 把二维格号压成一维 (cx * span + cy)，便于 searchsorted；相邻格的 cy 也要落在 [0, span) 内
+    cy_min = int(min(dst_cy.min(), src_cy.min())) - 1
+    span = int(max(dst_cy.max(), src_cy.max())) + 2 - cy_min
+    dst_key = dst_cx * span + (dst_cy - cy_min)
+    order = np.argsort(dst_key, kind='stable')
+    sorted_key = dst_key[order]
+
+    radius_sq = radius * radius
+    rows, cols = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            key = (src_cx + dx) * span + (src_cy + dy - cy_min)
+            start = np.searchsorted(sorted_key, key, side='left')
+            stop = np.searchsorted(sorted_key, key, side='right')
+            counts = stop - start
+            total = int(counts.sum())
+            if not total:
+                continue
+            # 展开为 (src, dst) 对：每个 src 重复 counts 次，dst 取 [start, stop) 中的每一个
+            src = np.repeat(np.arange(len(src_x)), counts)
+            within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            dst = order[np.repeat(start, counts) + within]
+            keep = (src_x[src] - dst_x[dst]) ** 2 + (src_y[src] - dst_y[dst]) ** 2 <= radius_sq
+            rows.append(src[keep])
+            cols.append(dst[keep])
+
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(len(src_x) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(src_x)), out=indptr[1:])
+    return indptr, cols[order]
+
+
+def lazy_greedy(indptr, indices, weights, candidates, k):
+    """CELF 最大覆盖：weights 为各网格尚未覆盖的人口，会被原地置 0；返回 [(候选点, 新增人口)]"""
+    lengths = np.diff(indptr)
+    row_ids = np.repeat(np.arange(len(lengths)), lengths)
+    gains = np.bincount(row_ids, weights=weights[indices], minlength=len(lengths))
+
+    # (负收益, 候选点, 计算收益时已选的点数)；收益相同时编号小的优先，结果可复现
+    heap = [(-float(gains[c]), int(c), 0) for c in candidates if gains[c] > 0]
+    heapq.heapify(heap)
+    selected = []
+    while heap and len(selected) < k:
+        negative_gain, candidate, computed_at = heapq.heappop(heap)
+        covered = indices[indptr[candidate]:indptr[candidate + 1]]
+        if computed_at == len(selected):
+            selected.append((candidate, -negative_gain))
+            weights[covered] = 0
+            continue
+        gain = float(weights[covered].sum())
+        if gain > 0:
+            heapq.heappush(heap, (-gain, candidate, len(selected)))
+    return selected
+
+
+class SiteSelector:
+    """人口网格和书房位置只加载一次（复用 CoverageAnalyzer），覆盖矩阵按半径缓存"""
+
+    def __init__(self, analyzer, library_store, bundle_path=coverage.ISOCHRONE_BUNDLE_PATH):
+        self.analyzer = analyzer
+        self.bundle_path = bundle_path
+        self.library_store = library_store
+        self.counts = analyzer.counts
+        # 以网格中心纬度做等距圆柱投影，城市范围内误差远小于网格间距
+        lat0 = math.radians(float(analyzer.lats.mean()))
+        scale = math.radians(1) * EARTH_RADIUS_M
+        self.x = analyzer.lngs * scale * math.cos(lat0)
+        self.y = analyzer.lats * scale
+        self.library_x = library_store.lngs * scale * math.cos(lat0)
+        self.library_y = library_store.lats * scale
+        self._matrices = {}
+        self._lock = threading.Lock()
+
+    def coverage_matrix(self, radius_m):
+        """候选点（网格中心）-> 半径内网格的 CSR 矩阵"""
+        with self._lock:
+            matrix = self._matrices.get(radius_m)
+            if matrix is None:
+                if len(self._matrices) >= MATRIX_CACHE_SIZE:
+                    self._matrices.pop(next(iter(self._matrices)))
+                matrix = self._matrices[radius_m] = neighbors(self.x, self.y, self.x, self.y, radius_m)
+        return matrix
+
+    def existing_coverage(self, radius_m, profile=None, minutes=None):
+        """现有书房覆盖的网格：有静态等时圈时用等时圈，否则用半径；返回 (布尔数组, 来源)"""
+        if profile is not None:
+            geometries = coverage.isochrones_from_bundle(profile, minutes, self.bundle_path)
+            if geometries:
+                covered = np.zeros(len(self.counts), dtype=bool)
+                for geometry in geometries.values():
+                    covered |= coverage.geometry_contains(self.analyzer.lngs, self.analyzer.lats, geometry)
+                return covered, 'isochrone'
+        indptr, indices = neighbors(self.library_x, self.library_y, self.x, self.y, radius_m)
+        covered = np.zeros(len(self.counts), dtype=bool)
+        covered[indices] = True
+        return covered, 'radius'
+
+    def select(self, k, radius_m=None, profile='walking', minutes=15, district=None):
+        """返回 k 个新增覆盖人口最多的位置；district 只在该区县内选点并只计该区县的人口"""
+        started = time.perf_counter()
+        if radius_m is None:
+            radius_m = budget_radius(profile, minutes)
+        else:
+            profile = minutes = None
+        covered, existing = self.existing_coverage(radius_m, profile, minutes)
+        indptr, indices = self.coverage_matrix(radius_m)
+
+        in_scope = np.ones(len(self.counts), dtype=bool)
+        if district is not None:
+            if district not in self.analyzer.districts:
+                raise ValueError(f"未知区县: {district}")
+            in_scope = self.analyzer.cell_district == self.analyzer.districts.index(district)
+        weights = np.where(in_scope & ~covered, self.counts, 0.0)
+        population = float(self.counts[in_scope].sum())
+        covered_before = float(self.counts[in_scope & covered].sum())
+
+        sites = []
+        cumulative = covered_before
+        for rank, (cell, gain) in enumerate(
+                lazy_greedy(indptr, indices, weights, np.flatnonzero(in_scope & (self.counts > 0)), k), 1):
+            cumulative += gain
+            lng, lat = float(self.analyzer.lngs[cell]), float(self.analyzer.lats[cell])
+            nearest = self.library_store.nearest(lng, lat, 1)
+            sites.append({
+                'rank': rank,
+                'lng': round(lng, 6),
+                'lat': round(lat, 6),
+                'district': self.analyzer.districts[self.analyzer.cell_district[cell]],
+                'population': round(gain, 2),
+                'cumulative_ratio': round(cumulative / population, 4) if population else 0.0,
+                'nearest_library': {key: nearest[0][key] for key in ('id', 'name', 'distance_m')} if nearest else None,
+            })
+
+        return {
+            'k': k,
+            'radius_m': radius_m,
+            'profile': profile,
+            'minutes': minutes,
+            'district': district,
+            'existing': existing,
+            'population': round(population, 2),
+            'covered_before': round(covered_before, 2),
+            'covered_after': round(cumulative, 2),
+            'ratio_before': round(covered_before / population, 4) if population else 0.0,
+            'ratio_after': round(cumulative / population, 4) if population else 0.0,
+            'sites': sites,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    def select_per_district(self, k, **kwargs):
+        """每个区县各自选 k 个点"""
+        return {district: self.select(k, district=district, **kwargs) for district in self.analyzer.districts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='贪心最大覆盖：推荐新增覆盖人口最多的书房位置')
+    parser.add_argument('--k', type=int, default=5, help='推荐的位置数')
+    parser.add_argument('--radius', type=float, help='覆盖半径（米），指定时忽略 --profile / --minutes')
+    parser.add_argument('--profile', default='walking', choices=sorted(BUDGET_SPEED_M_PER_MIN))
+    parser.add_argument('--minutes', type=int, default=15)
+    parser.add_argument('--district', help='只在该区县内选点')
+    parser.add_argument('--per-district', action='store_true', help='每个区县各选 k 个')
+    parser.add_argument('--population', help='人口网格文件，默认同 coverage.py')
+    parser.add_argument('--json', action='store_true', help='输出 JSON')
+    args = parser.parse_args()
+
+    library_store = LibraryStore(coverage.LIBRARY_DATA_PATH)
+    selector = SiteSelector(coverage.CoverageAnalyzer(args.population, library_store), library_store)
+    options = dict(radius_m=args.radius, profile=args.profile, minutes=args.minutes)
+    if args.per_district:
+        results = selector.select_per_district(args.k, **options)
+    else:
+        results = {args.district or '全市': selector.select(args.k, district=args.district, **options)}
+
+    if args.json:
+        print(json.dumps(results if args.per_district else next(iter(results.values())), ensure_ascii=False, indent=2))
+        return
+    for name, result in results.items():
+        print(f"{name}：半径 {result['radius_m']:.0f} 米（现有覆盖按{'等时圈' if result['existing'] == 'isochrone' else '半径'}），"
+              f"覆盖 {result['covered_before']:.0f} -> {result['covered_after']:.0f} / {result['population']:.0f} "
+              f"({result['ratio_before']:.1%} -> {result['ratio_after']:.1%})，用时 {result['elapsed_ms']} ms")
+        for site in result['sites']:
+            nearest = site['nearest_library']
+            print(f"  {site['rank']}. {site['lng']},{site['lat']} {site['district']} +{site['population']:.0f} 人"
+                  + (f"，最近书房 {nearest['name']} {nearest['distance_m']:.0f} 米" if nearest else ''))
+
+
+if __name__ == '__main__':
+    main()
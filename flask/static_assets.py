@@ -0,0 +1,223 @@
+# static_assets.py
+"""静态资源构建：内容哈希文件名 + 预压缩的 .br / .gz，由代理的 /assets/ 路由提供。
+
+    python static_assets.py                  # 生成到 static/dist/
+    python static_assets.py --out /tmp/dist
+
+每个资源复制为 名称.<哈希>.扩展名（例如 static/js/echarts.min.3f2a9c1b2d4e.js），文本类资源另写
+同名的 .gz（gzip -9）和 .br（brotli q11，需安装 brotli）。压缩在构建时一次完成，请求时只选文件，
+所以可以用最高压缩级别。哈希文件名的内容永不变化，浏览器可按 immutable 缓存一年。
+
+HTML 是入口页，不加哈希，但其中 src / href 引用的资源会改写为哈希文件名。
+原路径（如 /assets/static/js/echarts.min.js）同样可以访问，只是需要向服务器验证 ETag，
+CSS 中以相对路径引用的字体仍然可以加载。
+
+manifest.json 记录 原路径 -> 哈希文件名、内容 sha1 和各编码大小；内容未变化的资源不会重新压缩，
+不再被引用的旧版本文件在构建结束时删除。
+"""
+import argparse
+import glob
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+
+import compression
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SITE_DIR = os.path.normpath(os.path.join(APP_DIR, '..'))
+DIST_DIR = os.path.join(SITE_DIR, 'static', 'dist')
+MANIFEST_NAME = 'manifest.json'
+
+# 相对网站根目录
+ASSET_PATTERNS = (
+    '*.html', '*.css', '*.js',
+    'static/**/*.js', 'static/**/*.css', 'static/**/*.json', 'static/**/*.bin',
+    'static/**/*.svg', 'static/**/*.ttf', 'static/**/*.woff', 'static/**/*.woff2',
+)
+EXCLUDE_PREFIXES = ('static/dist/', 'static/data/__pycache__/')
+EXCLUDE_NAMES = ('cost_analysis_cache.json', 'isochrones.manifest.json')
+
+# 构建时用最高压缩级别
+BUILD_LEVELS = {'br': 11, 'gzip': 9}
+# 压缩后不小于原大小的这个比例时不写该编码（例如已压缩的字体、图片）
+MIN_SAVING_RATIO = 0.95
+
+mimetypes.add_type('font/woff2', '.woff2')
+mimetypes.add_type('font/woff', '.woff')
+mimetypes.add_type('font/ttf', '.ttf')
+mimetypes.add_type('text/javascript', '.js')
+
+HTML_REFERENCE_RE = re.compile(r'''((?:src|href)\s*=\s*["'])(?:\./)?([^"'?#:]+)(?=[?#"'])''')
+
+
+def hashed_name(path, digest):
+    """static/js/echarts.min.js -> static/js/echarts.min.<哈希>.js"""
+    root, extension = os.path.splitext(path)
+    return f"{root}.{digest[:12]}{extension}"
+
+
+def guess_type(path):
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def find_assets(site_dir=SITE_DIR, patterns=ASSET_PATTERNS):
+    """返回网站根目录下的资源相对路径（/ 分隔），已排序"""
+    found = set()
+    for pattern in patterns:
+        for path in glob.glob(os.path.join(site_dir, pattern), recursive=True):
+            name = os.path.relpath(path, site_dir).replace(os.sep, '/')
+            if (os.path.isfile(path) and not name.startswith(EXCLUDE_PREFIXES)
+                    and os.path.basename(name) not in EXCLUDE_NAMES):
+                found.add(name)
+    return sorted(found)
+
+
+def rewrite_html(text, files):
+    """把 HTML 中 src / href 引用的本地资源改为哈希文件名，其余引用不变"""
+    def replace(match):
+        entry = files.get(match.group(2))
+        return match.group(1) + (entry['file'] if entry else match.group(2))
+    return HTML_REFERENCE_RE.sub(replace, text)
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f).get('files', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def ext(encoding):
+    return 'gz' if encoding == 'gzip' else encoding
+
+
+def build_asset(name, data, out_dir, previous):
+    """写入一个资源及其预压缩版本，内容未变化且文件齐全时跳过；返回 (清单条目, 是否写入)"""
+    digest = hashlib.sha1(data).hexdigest()
+    # HTML 是入口页，保持原文件名
+    file_name = name if name.endswith('.html') else hashed_name(name, digest)
+    path = os.path.join(out_dir, file_name)
+    old = previous.get(name)
+    if (old and old['sha1'] == digest and old['file'] == file_name and os.path.exists(path)
+            and all(os.path.exists(f"{path}.{ext(encoding)}") for encoding in old['encodings'])):
+        return old, False
+
+    write_atomic(path, data)
+    encodings = {}
+    if compression.is_compressible(guess_type(name)):
+        for encoding in compression.ENCODINGS:
+            compressed = compression.compress(data, encoding, BUILD_LEVELS[encoding])
+            if len(compressed) < len(data) * MIN_SAVING_RATIO:
+                write_atomic(f"{path}.{ext(encoding)}", compressed)
+                encodings[encoding] = len(compressed)
+    return {'file': file_name, 'sha1': digest, 'bytes': len(data), 'encodings': encodings}, True
+
+
+def prune(out_dir, files):
+    """删除清单中已不存在的旧版本文件"""
+    keep = {MANIFEST_NAME}
+    for entry in files.values():
+        keep.add(entry['file'])
+        keep.update(f"{entry['file']}.{ext(encoding)}" for encoding in entry['encodings'])
+    removed = 0
+    for dirpath, _, filenames in os.walk(out_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if os.path.relpath(path, out_dir).replace(os.sep, '/') not in keep:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def build(out_dir=DIST_DIR, site_dir=SITE_DIR):
+    """生成哈希文件名和预压缩版本，返回新的清单"""
+    if not compression.brotli:
+        print("未安装 brotli，只生成 .gz 文件 (pip install brotli)")
+    previous = load_manifest(out_dir)
+    names = find_assets(site_dir)
+    files = {}
+    written = 0
+    # 先处理被引用的资源，HTML 改写时才知道它们的哈希文件名
+    for name in sorted(names, key=lambda name: name.endswith('.html')):
+        with open(os.path.join(site_dir, name), 'rb') as f:
+            data = f.read()
+        if name.endswith('.html'):
+            data = rewrite_html(data.decode('utf-8'), files).encode('utf-8')
+        files[name], changed = build_asset(name, data, out_dir, previous)
+        written += changed
+
+    if files != previous:
+        write_atomic(os.path.join(out_dir, MANIFEST_NAME),
+                     json.dumps({'files': files}, ensure_ascii=False, indent=2).encode('utf-8'))
+    removed = prune(out_dir, files)
+
+    total = sum(entry['bytes'] for entry in files.values())
+    print(f"{len(files)} 个资源，{written} 个有变化，删除 {removed} 个旧文件")
+    for encoding in compression.ENCODINGS:
+        smallest = sum(entry['encodings'].get(encoding, entry['bytes']) for entry in files.values())
+        print(f"  {encoding}: {total} -> {smallest} 字节 ({smallest / max(total, 1):.0%})")
+    return files
+
+
+class AssetManifest:
+    """读取构建结果，按原路径或哈希文件名查找资源；清单文件更新后自动重新加载"""
+
+    def __init__(self, out_dir=DIST_DIR):
+        self.out_dir = out_dir
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._by_name = {}
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(os.path.join(self.out_dir, MANIFEST_NAME)).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            files = load_manifest(self.out_dir) if mtime else {}
+            by_name = {}
+            for name, entry in files.items():
+                by_name[name] = (entry, False)
+                by_name[entry['file']] = (entry, entry['file'] != name)
+            self._by_name, self._mtime = by_name, mtime
+
+    def resolve(self, name):
+        """返回 (清单条目, 是否为哈希文件名)，找不到时返回 None"""
+        self._refresh()
+        return self._by_name.get(name)
+
+    def path(self, entry, encoding=None):
+        path = os.path.join(self.out_dir, entry['file'])
+        return f"{path}.{ext(encoding)}" if encoding else path
+
+    def __len__(self):
+        self._refresh()
+        return len({entry['file'] for entry, _ in self._by_name.values()})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成内容哈希文件名和预压缩的静态资源')
+    parser.add_argument('--out', default=DIST_DIR, help='输出目录')
+    parser.add_argument('--site', default=SITE_DIR, help='网站根目录')
+    args = parser.parse_args()
+    build(args.out, args.site)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+# style_bundle.py
+"""样式包：把 Mapbox 样式和它引用的 TileJSON 一次解析好，所有地址改写到代理 (/api/style-bundle/<用户>/<样式>)。
+
+直接使用 mapbox:// 样式时，浏览器要先取样式，再逐个取数据源的 TileJSON，之后才能请求瓦片、精灵图和字体，
+首屏前是一串串行的往返。样式包在服务端完成这些步骤：
+
+    sources   url 为 mapbox:// 的数据源并发取 TileJSON，tiles / minzoom / maxzoom / bounds 等字段内联，去掉 url
+    tiles     指向 api.mapbox.com 的瓦片地址改为 /api/mapbox/tiles/...，去掉 access_token
+    sprite    mapbox://sprites/<用户>/<样式> -> /api/mapbox/sprites/v1/<用户>/<样式>/sprite
+    glyphs    mapbox://fonts/<用户>/{fontstack}/{range}.pbf -> /api/mapbox/fonts/v1/<用户>/{fontstack}/{range}.pbf
+
+改写后的文档按 (样式, 版本) 缓存，版本取样式的 modified 字段（没有时取内容哈希）。
+过了 TTL 只重新取一次样式，版本不变就沿用已有结果，不再请求 TileJSON；
+过期不超过 max_stale 时先返回旧结果，重新获取放到后台。
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+MAPBOX_SCHEME = 'mapbox://'
+HOST_RE = re.compile(r'^https?://[^/]+')
+# Mapbox GL 加载 TileJSON 时从中取用的字段；vector_layers 体积大且只用于校验，不内联
+TILEJSON_FIELDS = ('tiles', 'minzoom', 'maxzoom', 'attribution', 'bounds', 'scheme', 'tileSize', 'encoding')
+MAX_TILEJSON_WORKERS = 8
+
+
+def is_mapbox_host(url):
+    host = urlsplit(url).hostname or ''
+    return host == 'mapbox.com' or host.endswith('.mapbox.com')
+
+
+def proxied_tile_url(tile_url, base=''):
+    """https://a.tiles.mapbox.com/v4/... -> {base}/api/mapbox/tiles/v4/...；access_token 由代理补上，不下发给浏览器"""
+    path = HOST_RE.sub('', tile_url)
+    if '?' in path:
+        path, query = path.split('?', 1)
+        # {z} 等占位符不能被转义
+        query = urlencode([(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k != 'access_token'],
+                          safe='{}')
+        if query:
+            path = f"{path}?{query}"
+    return f"{base}/api/mapbox/tiles{path}"
+
+
+def proxy_tiles(tiles, base=''):
+    """改写瓦片地址列表；a/b.tiles.mapbox.com 改写后相同，去重"""
+    return list(dict.fromkeys(proxied_tile_url(url, base) if is_mapbox_host(url) else url for url in tiles))
+
+
+def rewrite_sprite(sprite, base):
+    if isinstance(sprite, list):
+        # 多精灵图 [{id, url}, ...]
+        return [dict(item, url=rewrite_sprite(item.get('url'), base)) for item in sprite]
+    if isinstance(sprite, str) and sprite.startswith(MAPBOX_SCHEME + 'sprites/'):
+        return f"{base}/api/mapbox/sprites/v1/{sprite[len(MAPBOX_SCHEME + 'sprites/'):]}/sprite"
+    return sprite
+
+
+def rewrite_glyphs(glyphs, base):
+    if isinstance(glyphs, str) and glyphs.startswith(MAPBOX_SCHEME + 'fonts/'):
+        return f"{base}/api/mapbox/fonts/v1/{glyphs[len(MAPBOX_SCHEME + 'fonts/'):]}"
+    return glyphs
+
+
+def tileset_id(source):
+    """mapbox://mapbox.mapbox-streets-v8（可为逗号分隔的组合数据源）-> 瓦片集 ID；其他数据源返回 None"""
+    url = source.get('url')
+    if isinstance(url, str) and url.startswith(MAPBOX_SCHEME) and not url.startswith(MAPBOX_SCHEME + 'styles/'):
+        return url[len(MAPBOX_SCHEME):]
+    return None
+
+
+def style_version(style, raw=None):
+    """样式的版本：Mapbox 样式带 modified 时间戳，否则用内容哈希"""
+    if style.get('modified'):
+        return str(style['modified'])
+    return hashlib.sha1(raw if raw is not None else json.dumps(style, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def bundle_style(style, fetch_tilejson, base, logger=None):
+    """返回 (改写后的样式副本, 是否完整)。
+
+    fetch_tilejson(瓦片集 ID) 返回 TileJSON；某个数据源失败时该数据源的 url 改为代理的 TileJSON 地址，
+    地图仍然可用，只是这个数据源要多一次往返，此时返回的结果不算完整。
+    """
+    bundled = dict(style)
+    sources = {name: dict(source) for name, source in (style.get('sources') or {}).items()}
+    pending = {name: tileset_id(source) for name, source in sources.items() if tileset_id(source)}
+
+    complete = True
+    if pending:
+        tilesets = sorted(set(pending.values()))
+        with ThreadPoolExecutor(max_workers=min(len(tilesets), MAX_TILEJSON_WORKERS)) as executor:
+            futures = {tileset: executor.submit(fetch_tilejson, tileset) for tileset in tilesets}
+        for name, tileset in pending.items():
+            source = sources[name]
+            try:
+                tilejson = futures[tileset].result()
+            except Exception as e:
+                if logger:
+                    logger.warning("样式包获取 TileJSON 失败: %s (%s)", tileset, e)
+                source['url'] = f"{base}/api/mapbox/v4/{tileset}.json"
+                complete = False
+                continue
+            del source['url']
+            for field in TILEJSON_FIELDS:
+                if field in tilejson:
+                    source[field] = tilejson[field]
+
+    for source in sources.values():
+        if isinstance(source.get('tiles'), list):
+            source['tiles'] = proxy_tiles(source['tiles'], base)
+    bundled['sources'] = sources
+    if 'sprite' in bundled:
+        bundled['sprite'] = rewrite_sprite(bundled['sprite'], base)
+    if 'glyphs' in bundled:
+        bundled['glyphs'] = rewrite_glyphs(bundled['glyphs'], base)
+    return bundled, complete
+
+
+class StyleBundleCache:
+    """(样式路径, 代理地址) -> {'version', 'body', 'etag', 'checked_at'}；改写结果只在样式版本变化时重建"""
+
+    def __init__(self, ttl, max_entries=64, max_stale=0):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = self.revalidated = self.built = self.stale = 0
+
+    def lookup(self, key):
+        """返回 (缓存条目, 状态)：fresh 在 TTL 内，stale 可先返回再后台刷新，expired 需要同步重建"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, 'expired'
+            age = time.monotonic() - entry['checked_at']
+            if age < self.ttl:
+                self.hits += 1
+                return entry, 'fresh'
+            if age < self.ttl + self.max_stale:
+                self.stale += 1
+                return entry, 'stale'
+            return entry, 'expired'
+
+    def refresh(self, key, fetch_style, fetch_tilejson, base, logger=None):
+        """重新取样式；版本未变时沿用旧条目，否则重新解析并序列化"""
+        style, raw = fetch_style()
+        version = style_version(style, raw)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['version'] == version and entry['complete']:
+                entry['checked_at'] = time.monotonic()
+                self.revalidated += 1
+                return entry
+
+        bundled, complete = bundle_style(style, fetch_tilejson, base, logger)
+        body = json.dumps(bundled, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        entry = {
+            'version': version,
+            'body': body,
+            'etag': hashlib.sha1(body).hexdigest()[:32],
+            'complete': complete,
+            # 不完整的结果下次请求时重建
+            'checked_at': time.monotonic() if complete else float('-inf'),
+        }
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = entry
+            self.built += 1
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'revalidated': self.revalidated,
+                'built': self.built,
+                'stale': self.stale,
+                'entries': len(self._entries),
+                'bytes': sum(len(entry['body']) for entry in self._entries.values()),
+            }
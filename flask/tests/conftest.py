@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 模块按 flask/ 目录下的平铺导入方式组织（与 app.py 相同）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
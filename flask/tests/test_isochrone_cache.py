@@ -0,0 +1,49 @@
+import pytest
+
+from isochrone_cache import IsochroneCache
+
+
+@pytest.fixture(params=[False, True], ids=['memory', 'sqlite'])
+def cache(request, tmp_path):
+    return IsochroneCache(ttl=60, db_path=str(tmp_path / 'cache.db') if request.param else None)
+
+
+def counted(cache):
+    stats = cache.stats()
+    return {name: stats[name] for name in ('memory_hits', 'disk_hits', 'stale_hits', 'misses')}
+
+
+def test_peek_many_is_not_counted(cache):
+    cache.set('a', {'id': 'a'})
+    cache.set('b', {'id': 'b'})
+    before = counted(cache)
+    found = cache.peek_many(['a', 'b', 'missing'])
+    assert {key: value for key, (value, _) in found.items()} == {'a': {'id': 'a'}, 'b': {'id': 'b'}}
+    assert cache.peek('missing') == (None, None)
+    assert counted(cache) == before
+
+
+def test_peek_many_reads_disk_entries(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    IsochroneCache(db_path=path).set('a', {'id': 'a'})
+    # 新实例内存为空，只能从 SQLite 读到
+    value, stored_at = IsochroneCache(db_path=path).peek('a')
+    assert value == {'id': 'a'} and stored_at is not None
+
+
+def test_setting_raw_entry_drops_its_variants(cache):
+    cache.set('walking:15:1:2', {'v': 1})
+    _, stored_at = cache.peek('walking:15:1:2')
+    variant = cache.variant_key('walking:15:1:2', stored_at, 'simplified:z12')
+    cache.set(variant, {'v': 'simplified'})
+    cache.set('walking:15:1:20', {'other': True})
+    other_variant = cache.variant_key('walking:15:1:20', 0.0, 'simplified:z12')
+    cache.set(other_variant, {'other': 'simplified'})
+    assert cache.peek(variant)[0] == {'v': 'simplified'}
+
+    cache.set('walking:15:1:2', {'v': 2})
+    assert cache.peek(variant) == (None, None)
+    _, refreshed_at = cache.peek('walking:15:1:2')
+    assert cache.variant_key('walking:15:1:2', refreshed_at, 'simplified:z12') != variant
+    # 其他原始键的派生结果不受影响（即使原始键是它的字符串前缀）
+    assert cache.peek(other_variant)[0] == {'other': 'simplified'}
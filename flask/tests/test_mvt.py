@@ -0,0 +1,167 @@
+import struct
+
+import pytest
+
+import mvt
+
+
+def read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def read_fields(data):
+    """最小的 protobuf 解码：返回 [(字段号, wire type, 值)]，长度前缀字段的值为 bytes"""
+    fields = []
+    pos = 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        elif wire_type == 5:
+            value, pos = data[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f"unsupported wire type {wire_type}")
+        fields.append((number, wire_type, value))
+    assert pos == len(data)
+    return fields
+
+
+def read_packed(data):
+    values, pos = [], 0
+    while pos < len(data):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    return values
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def decode_value(data):
+    (number, wire_type, value), = read_fields(data)
+    if number == 1:
+        return value.decode('utf-8')
+    if number == 3:
+        assert wire_type == 1
+        return struct.unpack('<d', value)[0]
+    if number == 5:
+        return value
+    if number == 6:
+        return unzigzag(value)
+    if number == 7:
+        return bool(value)
+    raise AssertionError(f"unexpected value field {number}")
+
+
+def decode_tile(data):
+    """Tile -> {图层名: {'version', 'extent', 'features': [{'id', 'type', 'point', 'properties'}]}}"""
+    layers = {}
+    for number, wire_type, layer_data in read_fields(data):
+        assert (number, wire_type) == (3, 2)
+        layer = {'features': []}
+        keys, values, raw_features = [], [], []
+        for field, _, value in read_fields(layer_data):
+            if field == 15:
+                layer['version'] = value
+            elif field == 1:
+                layer['name'] = value.decode('utf-8')
+            elif field == 2:
+                raw_features.append(value)
+            elif field == 3:
+                keys.append(value.decode('utf-8'))
+            elif field == 4:
+                values.append(decode_value(value))
+            elif field == 5:
+                layer['extent'] = value
+        for raw in raw_features:
+            feature = {'id': None, 'properties': {}}
+            for field, _, value in read_fields(raw):
+                if field == 1:
+                    feature['id'] = value
+                elif field == 2:
+                    tags = read_packed(value)
+                    feature['properties'] = {keys[k]: values[v] for k, v in zip(tags[::2], tags[1::2])}
+                elif field == 3:
+                    feature['type'] = value
+                elif field == 4:
+                    command, x, y = read_packed(value)
+                    assert command == (1 << 3 | mvt.MOVE_TO)
+                    feature['point'] = (unzigzag(x), unzigzag(y))
+            layer['features'].append(feature)
+        layers[layer.pop('name')] = layer
+    return layers
+
+
+def test_point_layers_round_trip():
+    population = mvt.Layer('population')
+    population.add_point(0, 0, {'count': 12.5, 'cells': 3})
+    population.add_point(4095, 17, {'count': 12.5, 'cells': 1}, feature_id=7)
+    # 缓冲区内的点坐标可以为负
+    population.add_point(-64, 4160, {'count': 0.25, 'delta': -300})
+    libraries = mvt.Layer('libraries', extent=512)
+    libraries.add_point(100, 200, {'name': '城市书房', 'open': True, 'skipped': None, 'id': 1}, feature_id=2**40)
+
+    tile = decode_tile(mvt.encode_tile([population, libraries]))
+
+    assert list(tile) == ['population', 'libraries']
+    assert tile['population']['version'] == mvt.VERSION
+    assert tile['population']['extent'] == mvt.DEFAULT_EXTENT
+    assert tile['libraries']['extent'] == 512
+    assert [f['point'] for f in tile['population']['features']] == [(0, 0), (4095, 17), (-64, 4160)]
+    assert [f['id'] for f in tile['population']['features']] == [None, 7, None]
+    assert [f['properties'] for f in tile['population']['features']] == [
+        {'count': 12.5, 'cells': 3},
+        {'count': 12.5, 'cells': 1},
+        {'count': 0.25, 'delta': -300},
+    ]
+    assert all(f['type'] == mvt.POINT for layer in tile.values() for f in layer['features'])
+    library, = tile['libraries']['features']
+    assert library['id'] == 2**40
+    assert library['point'] == (100, 200)
+    assert library['properties'] == {'name': '城市书房', 'open': True, 'id': 1}
+
+
+def test_values_are_deduplicated_by_type():
+    layer = mvt.Layer('values')
+    layer.add_point(1, 1, {'a': 1, 'b': 1.0, 'c': True})
+    layer.add_point(2, 2, {'a': 1, 'b': 1.0, 'c': True})
+    (_, _, layer_data), = read_fields(mvt.encode_tile([layer]))
+    fields = read_fields(layer_data)
+    keys = [value.decode('utf-8') for number, _, value in fields if number == 3]
+    values = [decode_value(value) for number, _, value in fields if number == 4]
+    assert keys == ['a', 'b', 'c']
+    # 1、1.0、True 相等但类型不同，各自占一个值
+    assert [(type(value), value) for value in values] == [(int, 1), (float, 1.0), (bool, True)]
+    decoded = decode_tile(mvt.encode_tile([layer]))['values']['features']
+    assert decoded[0]['properties'] == decoded[1]['properties'] == {'a': 1, 'b': 1.0, 'c': True}
+
+
+@pytest.mark.parametrize('value', [0, 1, 127, 128, 300, 2**32, 2**63 - 1])
+def test_varint_round_trip(value):
+    assert read_varint(mvt.varint(value), 0) == (value, len(mvt.varint(value)))
+
+
+@pytest.mark.parametrize('value', [0, -1, 1, -64, 64, -2**31, 2**31 - 1])
+def test_zigzag_round_trip(value):
+    assert unzigzag(mvt.zigzag(value)) == value
+
+
+def test_empty_layers_are_skipped():
+    assert mvt.encode_tile([mvt.Layer('population')]) == b''
+    libraries = mvt.Layer('libraries')
+    libraries.add_point(5, 5)
+    assert list(decode_tile(mvt.encode_tile([mvt.Layer('population'), libraries]))) == ['libraries']
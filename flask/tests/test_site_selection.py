@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from site_selection import lazy_greedy, neighbors
+
+
+def brute_force_neighbors(src_x, src_y, dst_x, dst_y, radius):
+    """O(n²) 对照：每个 src 点 radius 内的 dst 下标（升序）"""
+    distance_sq = (src_x[:, None] - dst_x[None, :]) ** 2 + (src_y[:, None] - dst_y[None, :]) ** 2
+    return [np.flatnonzero(row <= radius * radius) for row in distance_sq]
+
+
+def naive_greedy(indptr, indices, weights, candidates, k):
+    """每轮重算所有候选点的收益，收益相同时取编号小的"""
+    weights = weights.copy()
+    selected = []
+    for _ in range(k):
+        best, best_gain = None, 0.0
+        for candidate in sorted(candidates):
+            gain = float(weights[indices[indptr[candidate]:indptr[candidate + 1]]].sum())
+            if gain > best_gain:
+                best, best_gain = candidate, gain
+        if best is None:
+            break
+        selected.append((best, best_gain))
+        weights[indices[indptr[best]:indptr[best + 1]]] = 0
+    return selected
+
+
+@pytest.mark.parametrize('seed, radius', [(0, 50.0), (1, 120.0), (2, 400.0), (3, 1.0)])
+def test_neighbors_matches_brute_force(seed, radius):
+    rng = np.random.default_rng(seed)
+    # 含负坐标，src 与 dst 为不同的点集
+    src_x, src_y = rng.uniform(-500, 800, 300), rng.uniform(-300, 600, 300)
+    dst_x, dst_y = rng.uniform(-500, 800, 500), rng.uniform(-300, 600, 500)
+
+    indptr, indices = neighbors(src_x, src_y, dst_x, dst_y, radius)
+
+    assert indptr.shape == (len(src_x) + 1,)
+    assert indptr[-1] == len(indices)
+    for row, expected in enumerate(brute_force_neighbors(src_x, src_y, dst_x, dst_y, radius)):
+        np.testing.assert_array_equal(indices[indptr[row]:indptr[row + 1]], expected)
+
+
+def test_neighbors_same_point_set_includes_self():
+    rng = np.random.default_rng(4)
+    x, y = rng.uniform(0, 1000, 200), rng.uniform(0, 1000, 200)
+    indptr, indices = neighbors(x, y, x, y, 80.0)
+    for row in range(len(x)):
+        assert row in indices[indptr[row]:indptr[row + 1]]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_lazy_greedy_matches_naive_greedy(seed):
+    rng = np.random.default_rng(seed)
+    cells = 400
+    x, y = rng.uniform(0, 2000, cells), rng.uniform(0, 2000, cells)
+    weights = rng.uniform(0, 100, cells)
+    weights[rng.random(cells) < 0.2] = 0  # 已被现有书房覆盖的格子
+    indptr, indices = neighbors(x, y, x, y, 250.0)
+    candidates = np.flatnonzero(rng.random(cells) < 0.6)
+
+    expected = naive_greedy(indptr, indices, weights, candidates, 8)
+    remaining = weights.copy()
+    selected = lazy_greedy(indptr, indices, remaining, candidates, 8)
+
+    np.testing.assert_allclose([gain for _, gain in selected], [gain for _, gain in expected])
+    # 覆盖范围相同的候选点收益只差浮点误差，此时两边选中的点可以不同，但每一步都必须是当时收益最大的点
+    covered = weights.copy()
+    for candidate, gain in selected:
+        gains = [covered[indices[indptr[c]:indptr[c + 1]]].sum() for c in candidates]
+        assert gain == pytest.approx(max(gains))
+        assert covered[indices[indptr[candidate]:indptr[candidate + 1]]].sum() == pytest.approx(gain)
+        covered[indices[indptr[candidate]:indptr[candidate + 1]]] = 0
+    # 选中点覆盖的格子被原地置 0
+    for candidate, _ in selected:
+        assert not remaining[indices[indptr[candidate]:indptr[candidate + 1]]].any()
+
+
+def test_lazy_greedy_stops_when_nothing_left_to_cover():
+    x = np.array([0.0, 10.0, 1000.0])
+    y = np.zeros(3)
+    indptr, indices = neighbors(x, y, x, y, 50.0)
+    weights = np.array([5.0, 3.0, 0.0])
+    selected = lazy_greedy(indptr, indices, weights, np.arange(3), 5)
+    assert selected == [(0, 8.0)]
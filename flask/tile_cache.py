@@ -0,0 +1,250 @@
+# tile_cache.py
+"""矢量瓦片 / 字体 / 精灵图的磁盘缓存。
+
+- 响应体按 SHA-256 内容寻址存放在 objects/ 下，相同内容（例如大量空白海面瓦片）只存一份
+- 元数据（上游 ETag、Last-Modified、Content-Type/Encoding、存入时间）存放在 meta/ 下，
+  瓦片按 meta/tiles/{z}/{x}/{y}-{hash}.json 组织，便于按缩放级别查看或清理
+- 总大小超过上限时按最近最少使用 (LRU) 淘汰；索引在进程内，多个 gunicorn worker 共用目录时上限按每个 worker 计算
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# 例如 v4/mapbox.mapbox-streets-v8/14/13400/6500.vector.pbf
+TILE_PATH_RE = re.compile(r'(?:^|/)(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)(?:@\dx)?(?:\.[\w.]+)?$')
+
+
+def make_cache_key(kind, path, params):
+    """规范化后的缓存键：类型 + 路径 + 排序后的查询参数（不含 access_token）"""
+    query = '&'.join(f"{k}={v}" for k, v in sorted(params.items()) if k != 'access_token')
+    return f"{kind}:{path}?{query}"
+
+
+class TileCache:
+    """内容寻址、带大小上限和 LRU 淘汰的磁盘缓存（进程内线程安全）"""
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024, revalidate_after=7 * 24 * 3600, max_stale=0):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.max_stale = max_stale
+        self._lock = threading.Lock()
+        # meta 文件路径 -> sha，按访问顺序排列，最前面的最久未使用
+        self._index = OrderedDict()
+        self._refcounts = {}
+        self._object_sizes = {}
+        self._total_bytes = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'revalidated': 0,
+            'stores': 0,
+            'evictions': 0,
+        }
+        os.makedirs(os.path.join(self.root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(self.root, 'meta'), exist_ok=True)
+        self._load_index()
+
+    # --- 路径 ---
+    def meta_path(self, kind, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        if kind == 'tiles':
+            path = key.split(':', 1)[1].split('?', 1)[0]
+            match = TILE_PATH_RE.search(path)
+            if match:
+                return os.path.join(self.root, 'meta', 'tiles', match.group('z'), match.group('x'),
+                                    f"{match.group('y')}-{digest[:16]}.json")
+        return os.path.join(self.root, 'meta', kind, digest[:2], f"{digest}.json")
+
+    def object_path(self, sha):
+        return os.path.join(self.root, 'objects', sha[:2], sha)
+
+    # --- 读写 ---
+    def lookup(self, kind, key):
+        """返回元数据 dict，未缓存或对象文件已丢失时返回 None"""
+        meta_path = self.meta_path(kind, key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+        if not os.path.exists(self.object_path(entry['sha'])):
+            # 可能被其他进程淘汰
+            with self._lock:
+                self._forget(meta_path)
+                self._stats['misses'] += 1
+            return None
+        entry['meta_path'] = meta_path
+        with self._lock:
+            if meta_path not in self._index:
+                self._remember(meta_path, entry['sha'], entry['size'])
+            self._index.move_to_end(meta_path)
+            self._stats['hits'] += 1
+        return entry
+
+    def read(self, entry):
+        """返回响应体；lookup 之后对象文件被其他 worker 淘汰时，移除索引条目、改记为未命中并返回 None"""
+        try:
+            with open(self.object_path(entry['sha']), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(entry.get('meta_path'))
+                self._stats['hits'] -= 1
+                self._stats['misses'] += 1
+            return None
+
+    def is_fresh(self, entry):
+        return time.time() - entry['stored_at'] < self.revalidate_after
+
+    def is_servable_stale(self, entry):
+        """已过新鲜期但未超过 max_stale：可以先返回，再在后台重新验证"""
+        return time.time() - entry['stored_at'] < self.revalidate_after + self.max_stale
+
+    def store(self, kind, key, body, headers):
+        """写入响应体和元数据，headers 为上游响应头"""
+        sha = hashlib.sha256(body).hexdigest()
+        object_path = self.object_path(sha)
+        if not os.path.exists(object_path):
+            self._write_atomic(object_path, body)
+        entry = {
+            'key': key,
+            'sha': sha,
+            'size': len(body),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'content_type': headers.get('Content-Type'),
+            'content_encoding': headers.get('Content-Encoding'),
+            'stored_at': time.time(),
+        }
+        meta_path = self.meta_path(kind, key)
+        self._write_atomic(meta_path, json.dumps(entry).encode('utf-8'))
+        with self._lock:
+            self._forget(meta_path)
+            self._remember(meta_path, sha, len(body))
+            self._stats['stores'] += 1
+            self._evict()
+        entry['meta_path'] = meta_path
+        return entry
+
+    def fill(self, client, kind, key, upstream_path, params, entry=None):
+        """通过上游客户端请求资源并写入缓存。
+
+        entry 不为空时带 If-None-Match/If-Modified-Since 做条件请求，上游返回 304 只刷新存入时间。
+        缓存中统一保存 gzip 编码的原始字节，返回给浏览器时再按其 Accept-Encoding 处理。
+        """
+        headers = {'Accept-Encoding': 'gzip'}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        response = client.get(client.url(upstream_path), params=params, headers=headers, stream=True)
+        try:
+            if response.status_code == 304 and entry is not None:
+                return self.refresh(entry)
+            response.raise_for_status()
+            body = response.raw.read(decode_content=False)
+            return self.store(kind, key, body, response.headers)
+        finally:
+            response.close()
+
+    def refresh(self, entry):
+        """上游返回 304 后更新存入时间，重新计算新鲜期"""
+        entry = dict(entry)
+        meta_path = entry.pop('meta_path')
+        entry['stored_at'] = time.time()
+        self._write_atomic(meta_path, json.dumps(entry).encode('utf-8'))
+        with self._lock:
+            self._stats['revalidated'] += 1
+        entry['meta_path'] = meta_path
+        return entry
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._index)
+            stats['objects'] = len(self._object_sizes)
+            stats['bytes'] = self._total_bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['max_bytes'] = self.max_bytes
+        stats['max_stale'] = self.max_stale
+        return stats
+
+    # --- 索引与淘汰 ---
+    def _load_index(self):
+        metas = []
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, 'meta')):
+            for filename in filenames:
+                if not filename.endswith('.json'):
+                    continue
+                meta_path = os.path.join(dirpath, filename)
+                try:
+                    with open(meta_path, 'r', encoding='utf-8') as f:
+                        entry = json.load(f)
+                    metas.append((os.path.getmtime(meta_path), meta_path, entry['sha'], entry['size']))
+                except (OSError, ValueError, KeyError):
+                    continue
+        # 重启后按写入时间近似 LRU 顺序
+        for _, meta_path, sha, size in sorted(metas):
+            self._remember(meta_path, sha, size)
+        self._evict()
+
+    def _remember(self, meta_path, sha, size):
+        # 调用方需持有 self._lock（初始化时除外）
+        self._index[meta_path] = sha
+        self._refcounts[sha] = self._refcounts.get(sha, 0) + 1
+        if sha not in self._object_sizes:
+            self._object_sizes[sha] = size
+            self._total_bytes += size
+
+    def _forget(self, meta_path):
+        sha = self._index.pop(meta_path, None)
+        if sha is None:
+            return None
+        self._refcounts[sha] -= 1
+        if self._refcounts[sha] == 0:
+            del self._refcounts[sha]
+            self._total_bytes -= self._object_sizes.pop(sha)
+            return sha
+        return None
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._index:
+            meta_path = next(iter(self._index))
+            orphan = self._forget(meta_path)
+            self._stats['evictions'] += 1
+            for path in (meta_path, self.object_path(orphan) if orphan else None):
+                if path:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    @staticmethod
+    def _write_atomic(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+def cache_from_env(default_root):
+    """根据环境变量 (.env) 创建瓦片缓存，TILE_CACHE_DIR 设为空字符串时禁用"""
+    root = os.getenv('TILE_CACHE_DIR', default_root)
+    if not root:
+        return None
+    return TileCache(
+        root,
+        max_bytes=int(float(os.getenv('TILE_CACHE_MAX_MB', 512)) * 1024 * 1024),
+        revalidate_after=float(os.getenv('TILE_CACHE_REVALIDATE_AFTER', 7 * 24 * 3600)),
+        max_stale=float(os.getenv('TILE_CACHE_STALE_MAX', 30 * 24 * 3600)),
+    )
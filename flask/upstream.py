@@ -0,0 +1,381 @@
+# upstream.py
+"""所有 Mapbox 代理路由共用的上游 HTTP 客户端。
+
+一个 requests.Session 对应一组按主机划分的 keep-alive 连接池，避免每个瓦片、
+字体、精灵图请求都重新建立 TCP+TLS 连接；同时统一连接/读取超时和 GET 重试策略，
+并统计连接池的占用情况。
+
+按接口类型（isochrone / styles / tiles / fonts / sprites ...）分别维护：
+
+- 熔断器：最近的请求中失败（超时、连接错误、429、5xx）过多时断开，断开期间直接抛出
+  UpstreamUnavailable，不占用工作线程等待超时；冷却后放行一个探测请求，成功则恢复
+- 自适应读取超时：取最近成功请求耗时的 p95 乘以系数，限制在 [最小值, 配置的读取超时] 之间，
+  上游变慢时不再每次都等满 10 秒
+
+配置了调度器 (scheduler.Scheduler) 时，每个请求发出前先按优先级和客户端排队取得名额，见 scheduler.py。
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+import scheduler as scheduler_module
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+
+
+class UpstreamUnavailable(requests.exceptions.ConnectionError):
+    """熔断器断开时直接抛出；是 ConnectionError 的子类，已有的“上游失败时返回旧缓存”逻辑照常生效"""
+
+    def __init__(self, kind, retry_after):
+        super().__init__(f"上游 {kind} 熔断中，{retry_after:.0f} 秒后重试")
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """滑动窗口熔断器：窗口内请求数不少于 min_requests 且失败率达到 failure_ratio，
+    或连续失败 consecutive_failures 次时断开；open_seconds 后半开，只放行一个探测请求"""
+
+    def __init__(self, window=20, min_requests=10, failure_ratio=0.5, consecutive_failures=5, open_seconds=30):
+        self.window = window
+        self.min_requests = min_requests
+        self.failure_ratio = failure_ratio
+        self.consecutive_failures = consecutive_failures
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        """返回 (是否放行, 距离下次探测的秒数)"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True, 0.0
+            remaining = self._opened_at + self.open_seconds - time.monotonic()
+            if self.state == OPEN and remaining <= 0:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True, 0.0
+            self.rejected += 1
+            return False, max(remaining, 1.0)
+
+    def cancel(self):
+        """放行后请求没有发出（例如被调度器拒绝）：半开状态下允许下一个探测"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, success):
+        with self._lock:
+            if self.state != CLOSED:
+                self._probing = False
+                if success:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                    self._consecutive = 0
+                else:
+                    self._trip()
+                return
+            self._outcomes.append(success)
+            self._consecutive = 0 if success else self._consecutive + 1
+            failures = self._outcomes.count(False)
+            if (self._consecutive >= self.consecutive_failures
+                    or (len(self._outcomes) >= self.min_requests
+                        and failures >= self.failure_ratio * len(self._outcomes))):
+                self._trip()
+
+    def _trip(self):
+        # 调用方需持有 self._lock
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.opened += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'window_failures': self._outcomes.count(False),
+                'window_requests': len(self._outcomes),
+                'opened': self.opened,
+                'rejected': self.rejected,
+            }
+
+
+class LatencyTracker:
+    """最近 samples 个成功请求的耗时，读取超时 = clamp(p95 * factor, min_timeout, max_timeout)"""
+
+    def __init__(self, max_timeout, min_timeout=2.0, factor=3.0, samples=200, min_samples=20):
+        self.max_timeout = max_timeout
+        self.min_timeout = min(min_timeout, max_timeout)
+        self.factor = factor
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=samples)
+        self._lock = threading.Lock()
+        self._timeout = max_timeout
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            if len(self._samples) >= self.min_samples:
+                self._timeout = min(self.max_timeout, max(self.min_timeout, self._p95() * self.factor))
+
+    def _p95(self):
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    def stats(self):
+        with self._lock:
+            return {
+                'p95_seconds': round(self._p95(), 4) if self._samples else None,
+                'read_timeout': round(self._timeout, 3),
+                'samples': len(self._samples),
+            }
+
+
+class UpstreamClient:
+    """带连接池、超时、重试和占用统计的上游客户端（线程安全）"""
+
+    def __init__(self, base_url='https://api.mapbox.com', pool_size=16, connect_timeout=3.05,
+                 read_timeout=10, retries=2, backoff_factor=0.3, breaker_options=None,
+                 min_read_timeout=2.0, timeout_p95_factor=3.0, scheduler=None):
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker_options = breaker_options or {}
+        self.min_read_timeout = min_read_timeout
+        self.timeout_p95_factor = timeout_p95_factor
+        self.scheduler = scheduler
+        # 接口类型 -> 熔断器 / 耗时统计，第一次请求该类型时创建
+        self._breakers = {}
+        self._latencies = {}
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset(['GET', 'HEAD']),  # 只重试幂等请求
+            respect_retry_after_header=True,
+            raise_on_status=False,  # 重试用尽后把最后一个响应交给调用方处理
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {
+            'requests': 0,
+            'errors': 0,
+            'max_in_flight': 0,
+            # 发起请求时并发数已达到连接池大小的次数：此时 urllib3 会临时新建连接且用后丢弃
+            'saturated': 0,
+            'total_seconds': 0.0,
+        }
+
+    def url(self, path):
+        """把 'styles/v1/...' 这样的相对路径拼成完整的上游地址"""
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def kind(self, url):
+        """上游接口类型（isochrone / styles / tiles / fonts / sprites / v4 ...），用作指标标签"""
+        if url.startswith(self.base_url):
+            return url[len(self.base_url):].lstrip('/').split('/', 1)[0] or 'other'
+        return 'other'
+
+    def _resilience(self, kind):
+        with self._lock:
+            breaker = self._breakers.get(kind)
+            if breaker is None:
+                breaker = self._breakers[kind] = CircuitBreaker(**self.breaker_options)
+                self._latencies[kind] = LatencyTracker(
+                    self.timeout[1], self.min_read_timeout, self.timeout_p95_factor)
+            return breaker, self._latencies[kind]
+
+    def get(self, url, params=None, **kwargs):
+        """与 requests.get 相同的调用方式；未指定 timeout 时读取超时按该类型接口的 p95 自适应。
+
+        熔断器断开时不发请求，直接抛出 UpstreamUnavailable。
+        """
+        kind = self.kind(url)
+        breaker, latency = self._resilience(kind)
+        allowed, retry_after = breaker.allow()
+        if not allowed:
+            metrics.UPSTREAM_ERRORS.inc(kind, 'circuit_open')
+            raise UpstreamUnavailable(kind, retry_after)
+        kwargs.setdefault('timeout', (self.timeout[0], latency.timeout))
+        ticket = None
+        if self.scheduler is not None:
+            priority = scheduler_module.priority_for(kind)
+            try:
+                ticket = self.scheduler.acquire(priority, scheduler_module.current_context()[1])
+            except scheduler_module.Overloaded as e:
+                breaker.cancel()
+                metrics.UPSTREAM_ERRORS.inc(kind, 'overloaded')
+                metrics.UPSTREAM_REJECTED.inc(priority, e.reason)
+                raise
+        release = (lambda: self.scheduler.release(ticket)) if ticket is not None else (lambda: None)
+        try:
+            response, start, healthy = self._send(kind, breaker, url, params, kwargs)
+        except BaseException:
+            release()
+            raise
+        if not kwargs.get('stream'):
+            if healthy:
+                latency.observe(time.monotonic() - start)
+            release()
+            return response
+
+        # 流式响应返回时只收到了响应头，响应体还要占着连接继续读。
+        # 名额保留到响应体读完或 close() 为止，自适应超时也按读完整个响应体的耗时统计
+        def finish():
+            if healthy:
+                latency.observe(time.monotonic() - start)
+            release()
+
+        _call_once_on_release(response, finish)
+        return response
+
+    def _send(self, kind, breaker, url, params, kwargs):
+        """发出请求并记录统计；返回 (响应, 开始时间, 上游是否健康)"""
+        with self._lock:
+            if self._in_flight >= self.pool_size:
+                self._stats['saturated'] += 1
+            self._in_flight += 1
+            self._stats['requests'] += 1
+            self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._in_flight)
+        start = time.monotonic()
+        try:
+            response = self.session.get(url, params=params, **kwargs)
+        except requests.exceptions.RequestException as e:
+            breaker.record(False)
+            with self._lock:
+                self._stats['errors'] += 1
+            if isinstance(e, requests.exceptions.Timeout):
+                error_class = 'timeout'
+            elif isinstance(e, requests.exceptions.ConnectionError):
+                error_class = 'connection'
+            else:
+                error_class = 'other'
+            metrics.UPSTREAM_ERRORS.inc(kind, error_class)
+            metrics.UPSTREAM_REQUESTS.inc(kind, error_class)
+            raise
+        except Exception:
+            # 其他异常也要结束半开状态的探测
+            breaker.record(False)
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self._in_flight -= 1
+                self._stats['total_seconds'] += elapsed
+            metrics.UPSTREAM_DURATION.observe(elapsed, kind)
+        metrics.UPSTREAM_REQUESTS.inc(kind, response.status_code)
+        if response.status_code >= 400:
+            metrics.UPSTREAM_ERRORS.inc(kind, 'http')
+        # 4xx（无此瓦片、等时圈参数错误等）说明上游是健康的
+        healthy = response.status_code < 500 and response.status_code != 429
+        breaker.record(healthy)
+        return response, start, healthy
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = self._in_flight
+        stats['pool_size'] = self.pool_size
+        stats['pool_utilization'] = round(stats['in_flight'] / self.pool_size, 4) if self.pool_size else 0.0
+        stats['avg_seconds'] = round(stats['total_seconds'] / stats['requests'], 4) if stats['requests'] else 0.0
+        stats['total_seconds'] = round(stats['total_seconds'], 4)
+        stats['connect_timeout'], stats['read_timeout'] = self.timeout
+        stats['kinds'] = self.kind_stats()
+        if self.scheduler is not None:
+            stats['scheduler'] = self.scheduler.stats()
+        return stats
+
+    def kind_stats(self):
+        """各接口类型的熔断器状态和当前读取超时"""
+        with self._lock:
+            kinds = list(self._breakers.items())
+        return {kind: dict(breaker.stats(), **self._latencies[kind].stats()) for kind, breaker in kinds}
+
+
+def _call_once_on_release(response, callback):
+    """响应体读完（urllib3 自动归还连接）或 Response.close() 时都会调用 raw.release_conn()，
+    在这里挂上回调，只执行一次"""
+    raw = response.raw
+    release_conn = raw.release_conn
+    lock = threading.Lock()
+    pending = [callback]
+
+    def release():
+        try:
+            release_conn()
+        finally:
+            with lock:
+                callbacks, pending[:] = list(pending), []
+            for pending_callback in callbacks:
+                pending_callback()
+
+    raw.release_conn = release
+
+
+def scheduler_from_env(pool_size):
+    """UPSTREAM_SCHEDULER=0 时不调度；令牌桶速率是整台机器的配额，按 gunicorn worker 数平分"""
+    if os.getenv('UPSTREAM_SCHEDULER', '1') == '0':
+        return None
+    workers = max(1, int(os.getenv('UPSTREAM_WORKERS', 1)))
+    rate = float(os.getenv('UPSTREAM_RATE_LIMIT', 100)) / workers
+    burst = os.getenv('UPSTREAM_RATE_BURST')
+    return scheduler_module.Scheduler(
+        max_concurrency=int(os.getenv('UPSTREAM_MAX_CONCURRENCY') or pool_size),
+        rate=rate,
+        burst=float(burst) / workers if burst else None,
+        weights=scheduler_module.parse_weights(os.getenv('UPSTREAM_PRIORITY_WEIGHTS')),
+        max_queue=int(os.getenv('UPSTREAM_QUEUE_MAX', 256)),
+        max_per_client=int(os.getenv('UPSTREAM_CLIENT_MAX_QUEUED', 64)),
+        max_wait=float(os.getenv('UPSTREAM_QUEUE_TIMEOUT', 10)),
+        observe_wait=lambda priority, seconds: metrics.UPSTREAM_QUEUE_WAIT.observe(seconds, priority),
+    )
+
+
+def client_from_env():
+    """根据环境变量 (.env) 创建上游客户端，连接池默认与工作线程数一致"""
+    pool_size = int(os.getenv('UPSTREAM_POOL_SIZE') or os.getenv('WORKER_THREADS') or 16)
+    return UpstreamClient(
+        base_url=os.getenv('MAPBOX_API_BASE', 'https://api.mapbox.com'),
+        pool_size=pool_size,
+        connect_timeout=float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 3.05)),
+        read_timeout=float(os.getenv('UPSTREAM_READ_TIMEOUT', 10)),
+        retries=int(os.getenv('UPSTREAM_RETRIES', 2)),
+        backoff_factor=float(os.getenv('UPSTREAM_BACKOFF', 0.3)),
+        breaker_options={
+            'window': int(os.getenv('UPSTREAM_BREAKER_WINDOW', 20)),
+            'min_requests': int(os.getenv('UPSTREAM_BREAKER_MIN_REQUESTS', 10)),
+            'failure_ratio': float(os.getenv('UPSTREAM_BREAKER_FAILURE_RATIO', 0.5)),
+            'consecutive_failures': int(os.getenv('UPSTREAM_BREAKER_CONSECUTIVE', 5)),
+            'open_seconds': float(os.getenv('UPSTREAM_BREAKER_OPEN_SECONDS', 30)),
+        },
+        min_read_timeout=float(os.getenv('UPSTREAM_MIN_READ_TIMEOUT', 2)),
+        timeout_p95_factor=float(os.getenv('UPSTREAM_TIMEOUT_P95_FACTOR', 3)),
+        scheduler=scheduler_from_env(pool_size),
+    )
@@ -0,0 +1,203 @@
+# vector_tiles.py
+"""人口网格和书房的动态矢量瓦片 (/api/tiles/<图层>/<z>/<x>/<y>.pbf)。
+
+启动后第一次请求时为每个缩放级别预先分箱（金字塔）：每个瓦片每边分 BINS_PER_TILE 个箱，
+同一箱内的点合并为一个点，坐标取按权重的重心，人口为箱内之和。低缩放级别下全市只有几十个点，
+放大后箱变小，每个网格各自成为一个点。书房在 LIBRARY_CLUSTER_MAX_ZOOM 以下同样合并，
+属性改为 cluster / point_count，与 Mapbox GL 的 GeoJSON 聚合一致；以上每个书房一个点并带完整属性。
+
+请求时只取该瓦片的箱编码为 MVT，编码结果按 (图层, z, x, y) 缓存在进程内 LRU 中，
+各种压缩编码的结果也随条目缓存。
+"""
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import compression
+import mvt
+
+BINS_PER_TILE = 64
+LIBRARY_CLUSTER_MAX_ZOOM = 11
+# 低于这个数的瓦片压缩不划算
+COMPRESS_MIN_BYTES = 256
+
+
+def world_coordinates(lngs, lats):
+    """经纬度 -> Web 墨卡托归一化坐标 [0, 1)，y 向南增大"""
+    lats = np.clip(lats, -85.05112878, 85.05112878)
+    x = (np.asarray(lngs, dtype=np.float64) + 180.0) / 360.0
+    sin_lat = np.sin(np.radians(lats))
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return x, y
+
+
+class PointPyramid:
+    """各缩放级别下按瓦片分组的点箱：{(x, y): (瓦片内 x, 瓦片内 y, 权重, [成员下标数组])}"""
+
+    def __init__(self, lngs, lats, weights, max_zoom, aggregate_max_zoom=None,
+                 bins_per_tile=BINS_PER_TILE, extent=mvt.DEFAULT_EXTENT):
+        self.max_zoom = max_zoom
+        self.extent = extent
+        self.count = len(lngs)
+        self._x, self._y = world_coordinates(lngs, lats)
+        self._weights = np.asarray(weights, dtype=np.float64)
+        if self.count:
+            self.bounds = [float(np.min(lngs)), float(np.min(lats)), float(np.max(lngs)), float(np.max(lats))]
+        else:
+            self.bounds = [-180.0, -85.0511, 180.0, 85.0511]
+        self.levels = [self._build(z, bins_per_tile if aggregate_max_zoom is None or z <= aggregate_max_zoom else None)
+                       for z in range(max_zoom + 1)]
+
+    def _build(self, z, bins_per_tile):
+        if not self.count:
+            return {}
+        tiles = 2 ** z
+        if bins_per_tile is None:
+            # 不合并：每个点自成一箱
+            bin_keys = np.arange(self.count)
+        else:
+            scale = tiles * bins_per_tile
+            bin_x = np.minimum(np.floor(self._x * scale).astype(np.int64), scale - 1)
+            bin_y = np.minimum(np.floor(self._y * scale).astype(np.int64), scale - 1)
+            bin_keys = bin_x * scale + bin_y
+        order = np.argsort(bin_keys, kind='stable')
+        starts = np.flatnonzero(np.r_[True, np.diff(bin_keys[order]) != 0])
+        sizes = np.diff(np.r_[starts, len(order)])
+
+        weights = self._weights[order]
+        totals = np.add.reduceat(weights, starts)
+        # 权重全为 0 的箱取算术平均
+        use_weights = np.where(np.repeat(totals > 0, sizes), weights, 1.0)
+        divisor = np.add.reduceat(use_weights, starts)
+        center_x = np.add.reduceat(self._x[order] * use_weights, starts) / divisor
+        center_y = np.add.reduceat(self._y[order] * use_weights, starts) / divisor
+
+        tile_x = np.minimum(np.floor(center_x * tiles).astype(np.int64), tiles - 1)
+        tile_y = np.minimum(np.floor(center_y * tiles).astype(np.int64), tiles - 1)
+        local_x = np.clip(((center_x * tiles - tile_x) * self.extent).astype(np.int64), 0, self.extent - 1)
+        local_y = np.clip(((center_y * tiles - tile_y) * self.extent).astype(np.int64), 0, self.extent - 1)
+
+        level = {}
+        for i in np.lexsort((tile_y, tile_x)):
+            key = (int(tile_x[i]), int(tile_y[i]))
+            level.setdefault(key, []).append(
+                (int(local_x[i]), int(local_y[i]), float(totals[i]), order[starts[i]:starts[i] + sizes[i]]))
+        return level
+
+    def tile(self, z, x, y):
+        return self.levels[z].get((x, y), [])
+
+
+class TileCache:
+    """编码后瓦片的 LRU：值为 {'body': 原始字节, 'etag': ..., 'encoded': {编码: 字节}}"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, build):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        # 在锁外编码；同一瓦片并发未命中时各自编码一次，结果相同
+        entry = build()
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': sum(len(entry['body']) for entry in self._entries.values()),
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class VectorTileService:
+    """population / libraries 两个图层；金字塔在创建时一次算好"""
+
+    LAYERS = ('population', 'libraries')
+
+    def __init__(self, population, libraries, max_zoom=14, cache_size=4096):
+        lngs, lats, counts = population
+        self.max_zoom = max_zoom
+        self.population = PointPyramid(lngs, lats, counts, max_zoom)
+        self.libraries = libraries
+        self.library_pyramid = PointPyramid(
+            [library['lng'] for library in libraries], [library['lat'] for library in libraries],
+            np.ones(len(libraries)), max_zoom, aggregate_max_zoom=LIBRARY_CLUSTER_MAX_ZOOM)
+        self.cache = TileCache(cache_size)
+
+    def _encode(self, name, z, x, y):
+        layer = mvt.Layer(name)
+        if name == 'population':
+            for local_x, local_y, total, members in self.population.tile(z, x, y):
+                layer.add_point(local_x, local_y, {'count': round(total, 2), 'cells': len(members)})
+        else:
+            for local_x, local_y, total, members in self.library_pyramid.tile(z, x, y):
+                if len(members) == 1:
+                    library = self.libraries[int(members[0])]
+                    layer.add_point(local_x, local_y, {
+                        'id': library['id'],
+                        'name': library['name'],
+                        'district': library['district'],
+                        'area': library.get('area'),
+                        'seats': library.get('seats'),
+                    }, feature_id=library['id'])
+                else:
+                    layer.add_point(local_x, local_y, {'cluster': True, 'point_count': len(members)})
+        body = mvt.encode_tile([layer])
+        return {'body': body, 'etag': hashlib.sha1(body).hexdigest()[:32], 'encoded': {}}
+
+    def tile(self, name, z, x, y):
+        """返回缓存条目；图层名或坐标非法时抛出 ValueError"""
+        if name not in self.LAYERS:
+            raise ValueError(f"Unknown layer: {name}")
+        if not (0 <= z <= self.max_zoom and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            raise ValueError("Tile out of range")
+        return self.cache.get((name, z, x, y), lambda: self._encode(name, z, x, y))
+
+    def encoded_body(self, entry, encoding):
+        """按编码返回瓦片字节，压缩结果随缓存条目保存；不值得压缩时返回 (原始字节, None)"""
+        if encoding is None or len(entry['body']) < COMPRESS_MIN_BYTES:
+            return entry['body'], None
+        body = entry['encoded'].get(encoding)
+        if body is None:
+            body = entry['encoded'][encoding] = compression.compress(
+                entry['body'], encoding, 11 if encoding == 'br' else 9)
+        return body, encoding
+
+    def tilejson(self, name, tiles_url):
+        pyramid = self.population if name == 'population' else self.library_pyramid
+        fields = ({'count': 'Number', 'cells': 'Number'} if name == 'population' else
+                  {'id': 'Number', 'name': 'String', 'district': 'String', 'area': 'Number', 'seats': 'Number',
+                   'cluster': 'Boolean', 'point_count': 'Number'})
+        west, south, east, north = pyramid.bounds
+        return {
+            'tilejson': '2.2.0',
+            'name': name,
+            'scheme': 'xyz',
+            'tiles': [tiles_url],
+            'minzoom': 0,
+            'maxzoom': self.max_zoom,
+            'bounds': [west, south, east, north],
+            'center': [(west + east) / 2, (south + north) / 2, min(10, self.max_zoom)],
+            'vector_layers': [{'id': name, 'fields': fields, 'minzoom': 0, 'maxzoom': self.max_zoom}],
+        }
@@ -0,0 +1,6 @@
+# wsgi.py
+"""WSGI 入口，供 gunicorn 等生产服务器加载：gunicorn -c gunicorn.conf.py wsgi:app"""
+from app import app
+
+if __name__ == '__main__':
+    app.run()
@@ -0,0 +1,268 @@
+"""离线生成所有城市书房的等时圈，输出一个静态 GeoJSON 包供地图直接加载。
+
+用法示例：
+
+    python build_isochrones.py                      # 使用 .env / 环境变量中的 MAPBOX_ACCESS_TOKEN
+    python build_isochrones.py --base-url http://127.0.0.1:8765 --token test   # 指向本地模拟服务
+    python build_isochrones.py --fetcher proxy --base-url http://localhost:5002  # 通过 Flask 代理获取
+    python build_isochrones.py --force               # 忽略清单，全部重新生成
+
+增量构建：每个书房按 (坐标, 出行方式, 分钟数) 计算内容哈希并写入清单，
+只有哈希变化（新增书房或坐标修改）的书房才会重新请求等时圈。
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from dotenv import load_dotenv
+
+# 获取当前文件的绝对路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 从当前目录向上查找 .env，再读取 Flask 代理的 flask/.env；已设置的环境变量不会被覆盖
+load_dotenv()
+load_dotenv(os.path.join(current_dir, '..', '..', 'flask', '.env'))
+json_path = os.path.join(current_dir, '城市书房数据.json')
+bundle_path = os.path.join(current_dir, 'isochrones.geojson')
+manifest_path = os.path.join(current_dir, 'isochrones.manifest.json')
+
+BUNDLE_FORMAT = 1
+DEFAULT_MINUTES = [5, 10, 15]
+DEFAULT_PROFILES = ['walking', 'cycling']
+COORDINATE_DECIMALS = 5  # 约 1 米精度，足够城市尺度展示
+
+
+class MapboxFetcher:
+    """直接请求 Mapbox Isochrone API（或兼容的本地模拟服务）"""
+
+    def __init__(self, base_url='https://api.mapbox.com', token=None, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def fetch(self, profile, lng, lat, minutes):
+        """返回包含 minutes 中每个等时线的 FeatureCollection"""
+        url = f"{self.base_url}/isochrone/v1/mapbox/{profile}/{lng},{lat}"
+        params = {
+            # Mapbox 单次最多支持 4 条等时线，一次请求即可拿到 5/10/15 分钟
+            'contours_minutes': ','.join(str(m) for m in minutes),
+            'polygons': 'true',
+            'access_token': self.token,
+        }
+        response = self.session.get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+class ProxyFetcher:
+    """通过本项目的 Flask 代理 (/api/isochrone) 获取，每个分钟数单独请求"""
+
+    def __init__(self, base_url='http://localhost:5002', token=None, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def fetch(self, profile, lng, lat, minutes):
+        features = []
+        for minute in minutes:
+            response = self.session.get(
+                f"{self.base_url}/api/isochrone",
+                params={'lng': lng, 'lat': lat, 'minutes': minute, 'profile': profile},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            features.extend(response.json().get('features', []))
+        return {'type': 'FeatureCollection', 'features': features}
+
+
+FETCHERS = {
+    'mapbox': MapboxFetcher,
+    'proxy': ProxyFetcher,
+}
+
+
+def load_libraries():
+    """读取城市书房数据，返回 [{id, name, district, lng, lat}]"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    libraries = []
+    for district_name, district_data in data['districts'].items():
+        for library in district_data['libraries']:
+            lng, lat = (float(v) for v in library['coordinates'].split(','))
+            libraries.append({
+                'id': library['id'],
+                'name': library['name'],
+                'district': library.get('district', district_name),
+                'lng': lng,
+                'lat': lat,
+            })
+    return libraries
+
+
+def library_hash(library, profiles, minutes):
+    """决定是否需要重新生成的内容哈希：坐标 + 出行方式 + 分钟数"""
+    key = f"{library['lng']},{library['lat']}|{','.join(profiles)}|{','.join(map(str, minutes))}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def round_coordinates(coords, decimals=COORDINATE_DECIMALS):
+    """递归地对 GeoJSON 坐标数组取整，去掉连续重复点"""
+    if coords and isinstance(coords[0], (int, float)):
+        return [round(c, decimals) for c in coords]
+    rounded = [round_coordinates(c, decimals) for c in coords]
+    if rounded and isinstance(rounded[0], list) and rounded[0] and isinstance(rounded[0][0], (int, float)):
+        deduped = [rounded[0]]
+        for point in rounded[1:]:
+            if point != deduped[-1]:
+                deduped.append(point)
+        return deduped
+    return rounded
+
+
+def compact_features(collection, library, profile):
+    """把上游返回的等时圈转换为只带必要属性的紧凑 Feature 列表"""
+    features = []
+    for feature in collection.get('features', []):
+        properties = feature.get('properties', {})
+        geometry = feature['geometry']
+        features.append({
+            'type': 'Feature',
+            'properties': {
+                'library_id': library['id'],
+                'name': library['name'],
+                'district': library['district'],
+                'profile': profile,
+                'contour': properties.get('contour'),
+            },
+            'geometry': {
+                'type': geometry['type'],
+                'coordinates': round_coordinates(geometry['coordinates']),
+            },
+        })
+    return features
+
+
+def load_previous_build():
+    """读取上一次的清单和包，返回 (清单, {library_id: [features]})"""
+    if not (os.path.exists(manifest_path) and os.path.exists(bundle_path)):
+        return {}, {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    with open(bundle_path, 'r', encoding='utf-8') as f:
+        bundle = json.load(f)
+    features_by_library = {}
+    for feature in bundle.get('features', []):
+        features_by_library.setdefault(str(feature['properties']['library_id']), []).append(feature)
+    return manifest, features_by_library
+
+
+def write_json_atomic(path, payload):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def build(fetcher, profiles, minutes, force=False, workers=4):
+    libraries = load_libraries()
+    previous_manifest, previous_features = ({}, {}) if force else load_previous_build()
+    previous_libraries = previous_manifest.get('libraries', {})
+
+    features_by_library = {}
+    hashes = {}
+    to_build = []
+    for library in libraries:
+        key = str(library['id'])
+        hashes[key] = library_hash(library, profiles, minutes)
+        if previous_libraries.get(key) == hashes[key] and key in previous_features:
+            features_by_library[key] = previous_features[key]
+        else:
+            to_build.append(library)
+
+    print(f"共 {len(libraries)} 个书房，需要生成 {len(to_build)} 个，复用 {len(libraries) - len(to_build)} 个")
+
+    def build_library(library):
+        features = []
+        for profile in profiles:
+            collection = fetcher.fetch(profile, library['lng'], library['lat'], minutes)
+            features.extend(compact_features(collection, library, profile))
+        return features
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(build_library, library): library for library in to_build}
+        for done, future in enumerate(as_completed(futures), 1):
+            library = futures[future]
+            key = str(library['id'])
+            try:
+                features_by_library[key] = future.result()
+                print(f"[{done}/{len(to_build)}] {library['name']} 完成")
+            except Exception as e:
+                # 失败的书房不写入清单，下次构建会重试
+                print(f"[{done}/{len(to_build)}] {library['name']} 失败: {e}")
+                failed.append(key)
+                hashes.pop(key)
+
+    features = []
+    for library in libraries:
+        features.extend(features_by_library.get(str(library['id']), []))
+    body = json.dumps(features, ensure_ascii=False, separators=(',', ':'))
+    version = hashlib.sha1(body.encode('utf-8')).hexdigest()[:12]
+
+    if previous_manifest.get('version') == version and not force:
+        print(f"等时圈包内容未变化 (版本 {version})，跳过写入")
+    else:
+        write_json_atomic(bundle_path, {
+            'type': 'FeatureCollection',
+            'format': BUNDLE_FORMAT,
+            'version': version,
+            'profiles': profiles,
+            'minutes': minutes,
+            'features': features,
+        })
+        print(f"已写入 {bundle_path} (版本 {version}, {len(features)} 个要素)")
+
+    write_json_atomic(manifest_path, {
+        'format': BUNDLE_FORMAT,
+        'version': version,
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'libraries': hashes,
+    })
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线生成城市书房等时圈静态包')
+    parser.add_argument('--fetcher', choices=sorted(FETCHERS), default='mapbox', help='等时圈来源')
+    parser.add_argument('--base-url', help='上游地址，可指向本地模拟服务')
+    parser.add_argument('--token', default=os.getenv('MAPBOX_ACCESS_TOKEN'), help='Mapbox Access Token')
+    parser.add_argument('--profiles', nargs='+', default=DEFAULT_PROFILES,
+                        choices=['walking', 'cycling', 'driving'])
+    parser.add_argument('--minutes', nargs='+', type=int, default=DEFAULT_MINUTES)
+    parser.add_argument('--workers', type=int, default=4, help='并发请求数')
+    parser.add_argument('--force', action='store_true', help='忽略清单，全部重新生成')
+    args = parser.parse_args()
+
+    if len(args.minutes) > 4 or not all(1 <= m <= 60 for m in args.minutes):
+        parser.error('--minutes 最多 4 个，取值 1-60')
+    fetcher_cls = FETCHERS[args.fetcher]
+    fetcher_kwargs = {'token': args.token}
+    if args.base_url:
+        fetcher_kwargs['base_url'] = args.base_url
+    if args.fetcher == 'mapbox' and not args.token:
+        parser.error('缺少 Mapbox Access Token (--token 或环境变量 MAPBOX_ACCESS_TOKEN)')
+
+    ok = build(fetcher_cls(**fetcher_kwargs), args.profiles, sorted(args.minutes),
+               force=args.force, workers=args.workers)
+    if not ok:
+        print("部分书房生成失败，重新运行即可只补齐失败的部分")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""把页面用到的统计数据生成为独立的小数据文件，代替用正则改写整个 HTML。
+
+    python build_site_data.py                    # 生成到 site_data/
+    python build_site_data.py --data-file crawled_results.csv
+
+输出（都在 site_data/ 下）：
+
+    cost_data.json / cost_data.js                   成本构成
+    area_distribution.json / area_distribution.js   面积分档统计（分布面积统计.py），填充成本表的“占比”列
+    library_stats.json / library_stats.js           各区县书房数量、面积、藏书、座位
+    manifest.json                                   各文件内容的 sha1，页面可用作缓存版本号
+
+cost_visualization.html 通过 <script> 加载三个 .js 文件，.json 供其他页面或脚本使用。
+
+每个文件先在内存中生成，内容哈希与清单中一致且文件存在时跳过，只有变化的文件才以临时文件 + 替换的方式写入。
+采购数据不存在时保留上次生成的成本数据；从未生成过时写入全为 0 的占位数据，页面加载 cost_data.js 不会 404。
+"""
+import argparse
+import hashlib
+import json
+import os
+
+from cost_analysis import analyze_costs, cost_categories
+from 分布面积统计 import area_distribution, load_data
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+output_dir = os.path.join(current_dir, 'site_data')
+
+MANIFEST_NAME = 'manifest.json'
+
+# 不同规模书房相对标准（平均）成本的系数
+ROOM_TYPE_FACTORS = {
+    'micro': 0.7,   # 微型书房成本约为标准的70%
+    'small': 0.9,   # 小型书房成本约为标准的90%
+    'medium': 1.0,  # 中型书房成本为标准
+    'large': 1.5,   # 大型书房成本约为标准的150%
+}
+
+
+def cost_data(results):
+    """把 analyze_costs 的结果换算为页面使用的 costData（金额单位：万元）"""
+    std_cost = results['avg_cost']  # 使用平均成本作为标准
+    categories = {}
+    for category, percentage in results['percentages'].items():
+        if percentage > 0:
+            categories[category] = {
+                'cost': (std_cost * percentage / 100) / 10000,
+                'percentage': percentage,
+            }
+    return {
+        'categories': categories,
+        'totalCost': std_cost / 10000,
+        'roomTypes': {name: std_cost * factor / 10000 for name, factor in ROOM_TYPE_FACTORS.items()},
+    }
+
+
+def to_number(value):
+    """书房数据中的数字有的是字符串（如 books），无法解析时按 0 计"""
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def library_stats(data):
+    """按区县汇总书房数量、总面积、藏书量和座位数"""
+    districts = {}
+    for district_name, district_data in data['districts'].items():
+        for library in district_data['libraries']:
+            name = library.get('district') or district_name
+            stats = districts.setdefault(name, {'count': 0, 'area': 0, 'books': 0, 'seats': 0})
+            stats['count'] += 1
+            for key in ('area', 'books', 'seats'):
+                stats[key] += to_number(library.get(key))
+
+    total = {'count': 0, 'area': 0, 'books': 0, 'seats': 0}
+    for stats in districts.values():
+        for key in total:
+            total[key] += stats[key]
+    for stats in (*districts.values(), total):
+        stats['area'] = round(stats['area'], 2)
+        stats['books'], stats['seats'] = int(stats['books']), int(stats['seats'])
+    return {'total': total, 'districts': districts}
+
+
+def render_json(payload):
+    return json.dumps(payload, ensure_ascii=False, indent=2) + '\n'
+
+
+def render_js(name, payload):
+    """页面直接用 <script> 加载的版本，本地打开 HTML（file://）时也能用"""
+    return f"window.{name} = {json.dumps(payload, ensure_ascii=False, indent=2)};\n"
+
+
+def placeholder_cost_data():
+    """没有采购数据时的占位成本数据，各项均为 0"""
+    return {
+        'categories': {category: {'cost': 0, 'percentage': 0} for category in cost_categories},
+        'totalCost': 0,
+        'roomTypes': dict.fromkeys(ROOM_TYPE_FACTORS, 0),
+    }
+
+
+def build_outputs(data_file=None, out_dir=output_dir):
+    """返回 {文件名: 文件内容}"""
+    data = load_data()
+    outputs = {}
+    for name, variable, payload in (('area_distribution', 'areaDistribution', area_distribution(data)),
+                                    ('library_stats', 'libraryStats', library_stats(data))):
+        outputs[f'{name}.json'] = render_json(payload)
+        outputs[f'{name}.js'] = render_js(variable, payload)
+    results = analyze_costs(data_file)
+    if results:
+        costs = cost_data(results)
+    elif not os.path.exists(os.path.join(out_dir, 'cost_data.js')):
+        print("无法获取成本分析结果，写入占位成本数据")
+        costs = placeholder_cost_data()
+    else:
+        print("无法获取成本分析结果，保留上次的成本数据")
+        return outputs
+    outputs['cost_data.json'] = render_json(costs)
+    outputs['cost_data.js'] = render_js('costData', costs)
+    return outputs
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def write_text_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f).get('files', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def build(out_dir=output_dir, data_file=None):
+    """生成数据文件，返回实际写入的文件名列表"""
+    os.makedirs(out_dir, exist_ok=True)
+    previous = load_manifest(out_dir)
+    # 本次没有生成的文件（例如缺少采购数据）保留上次的结果和清单记录
+    hashes = {name: digest for name, digest in previous.items()
+              if os.path.exists(os.path.join(out_dir, name))}
+
+    written = []
+    for name, text in build_outputs(data_file, out_dir).items():
+        digest = content_hash(text)
+        path = os.path.join(out_dir, name)
+        hashes[name] = digest
+        if previous.get(name) == digest and os.path.exists(path):
+            continue
+        write_text_atomic(path, text)
+        written.append(name)
+
+    if hashes != previous:
+        write_text_atomic(os.path.join(out_dir, MANIFEST_NAME), render_json({'files': dict(sorted(hashes.items()))}))
+
+    if written:
+        print(f"已更新 {len(written)} 个数据文件: {', '.join(written)}")
+    else:
+        print("数据文件均未变化，跳过写入")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成页面使用的统计数据文件')
+    parser.add_argument('--out', default=output_dir, help='输出目录')
+    parser.add_argument('--data-file', help='采购数据 CSV，默认使用 cost_analysis.py 中的路径')
+    args = parser.parse_args()
+    build(args.out, args.data_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,22 @@
 import csv
+import hashlib
 import json
 import re
 import os
-import matplotlib.pyplot as plt
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 import numpy as np
 
 # 定义数据文件路径
 data_file = 'C:/Users/Administrator/Desktop/数据新闻网页/数据集/采购数据/crawled_results.csv'
 
+# 分析结果缓存：按数据文件内容哈希保存，数据文件不变时重复运行直接复用
+cache_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cost_analysis_cache.json')
+CACHE_VERSION = 1
+# 每个子进程一次处理的行数；小于 PARALLEL_MIN_BYTES 的文件直接在当前进程处理，省去启动进程池的开销
+CHUNK_SIZE = 5000
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+AMOUNT_KEY = '1、合同金额'
+
 # 定义成本类别
 cost_categories = {
     '土建装修': ['建设', '装修', '施工', '工程', '改造'],
@@ -32,57 +41,146 @@ def extract_amount(text):
         return float(match.group(1))
     return 0
 
+# 按类别顺序展开的 (关键词, 类别) 列表，只在模块加载时构建一次
+keyword_rules = [(keyword.lower(), category)
+                 for category, keywords in cost_categories.items()
+                 for keyword in keywords]
+
 def categorize_project(title, content):
     """根据项目标题和内容分类项目"""
     title = title.lower() if title else ""
     content = content.lower() if content else ""
+    # 关键词都不含换行，拼成一个字符串后每个关键词只需查找一次，也不会跨越标题和内容误匹配
+    text = f"{title}\n{content}"
     
-    for category, keywords in cost_categories.items():
-        for keyword in keywords:
-            if keyword in title or keyword in content:
-                return category
+    for keyword, category in keyword_rules:
+        if keyword in text:
+            return category
     
     return '其他费用'  # 默认类别
 
-def analyze_costs():
-    """分析采购数据中的成本构成"""
-    if not os.path.exists(data_file):
-        print(f"数据文件不存在: {data_file}")
-        return None
-    
+def analyze_chunk(rows):
+    """统计一批 (标题, 内容, 结构化数据) 行，返回可合并的部分结果"""
     category_costs = {category: 0 for category in cost_categories.keys()}
     total_projects = 0
     total_cost = 0
     
-    try:
-        with open(data_file, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            next(reader, None)  # 跳过表头
+    for title, content, structured_data in rows:
+        # 没有合同金额字段（也没有 \u 转义）的行金额必为 0，不必解析 JSON
+        if AMOUNT_KEY not in structured_data and '\\u' not in structured_data:
+            continue
+        
+        # 尝试解析JSON数据
+        try:
+            data = json.loads(structured_data)
+            key_value_pairs = data.get('key_value_pairs', {})
+            
+            # 提取合同金额
+            amount_text = key_value_pairs.get(AMOUNT_KEY, '')
+            amount = extract_amount(amount_text)
             
-            for row in reader:
-                if len(row) < 6:  # 确保行有足够的列
-                    continue
-                
-                title = row[0]
-                content = row[1]
-                structured_data = row[5]
-                
-                # 尝试解析JSON数据
-                try:
-                    data = json.loads(structured_data)
-                    key_value_pairs = data.get('key_value_pairs', {})
-                    
-                    # 提取合同金额
-                    amount_text = key_value_pairs.get('1、合同金额', '')
-                    amount = extract_amount(amount_text)
-                    
-                    if amount > 0:
-                        category = categorize_project(title, content)
-                        category_costs[category] += amount
-                        total_cost += amount
-                        total_projects += 1
-                except (json.JSONDecodeError, TypeError):
-                    continue
+            if amount > 0:
+                category = categorize_project(title, content)
+                category_costs[category] += amount
+                total_cost += amount
+                total_projects += 1
+        except (json.JSONDecodeError, TypeError):
+            continue
+    
+    return category_costs, total_cost, total_projects
+
+def iter_chunks(path, chunk_size=CHUNK_SIZE):
+    """流式读取 CSV，每次产出 chunk_size 行，只保留分析需要的三列"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # 跳过表头
+        
+        chunk = []
+        for row in reader:
+            if len(row) < 6:  # 确保行有足够的列
+                continue
+            chunk.append((row[0], row[1], row[5]))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def file_hash(path):
+    """数据文件内容的 SHA-256，按块读取"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cache_key(path):
+    """数据内容、分类规则或缓存格式任一变化都会使缓存失效"""
+    rules = json.dumps(cost_categories, ensure_ascii=False, sort_keys=True)
+    return f"{CACHE_VERSION}:{file_hash(path)}:{hashlib.sha256(rules.encode('utf-8')).hexdigest()}"
+
+def load_cached_results(key):
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cached.get('results') if cached.get('key') == key else None
+
+def save_cached_results(key, results):
+    tmp_path = f"{cache_file}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'key': key, 'results': results}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, cache_file)
+
+def analyze_costs(path=None, workers=None, use_cache=True):
+    """分析采购数据中的成本构成。
+
+    CSV 按 CHUNK_SIZE 行分块，交给进程池并行统计后合并；同时在途的分块数有上限，内存占用与文件大小无关。
+    结果按文件内容哈希缓存，数据文件不变时直接返回上次的结果。
+    """
+    path = path or data_file
+    if not os.path.exists(path):
+        print(f"数据文件不存在: {path}")
+        return None
+    
+    try:
+        key = cache_key(path)
+        if use_cache:
+            cached = load_cached_results(key)
+            if cached is not None:
+                print("数据文件未变化，使用缓存的成本分析结果")
+                return cached
+        
+        category_costs = {category: 0 for category in cost_categories.keys()}
+        totals = {'cost': 0, 'projects': 0}
+        
+        def merge(partial):
+            partial_costs, partial_cost, partial_projects = partial
+            for category, cost in partial_costs.items():
+                category_costs[category] += cost
+            totals['cost'] += partial_cost
+            totals['projects'] += partial_projects
+        
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1 or os.path.getsize(path) < PARALLEL_MIN_BYTES:
+            for chunk in iter_chunks(path):
+                merge(analyze_chunk(chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = set()
+                for chunk in iter_chunks(path):
+                    # 最多 2 倍进程数的分块在途，避免整个文件被读进内存排队
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            merge(future.result())
+                    pending.add(executor.submit(analyze_chunk, chunk))
+                for future in as_completed(pending):
+                    merge(future.result())
+        
+        total_cost = totals['cost']
+        total_projects = totals['projects']
         
         # 计算百分比
         if total_cost > 0:
@@ -93,13 +191,16 @@ def analyze_costs():
         # 计算平均成本
         avg_cost = total_cost / total_projects if total_projects > 0 else 0
         
-        return {
+        results = {
             'category_costs': category_costs,
             'percentages': percentages,
             'total_cost': total_cost,
             'total_projects': total_projects,
             'avg_cost': avg_cost
         }
+        if use_cache:
+            save_cached_results(key, results)
+        return results
     
     except Exception as e:
         print(f"分析数据时出错: {e}")
@@ -110,6 +211,9 @@ def generate_charts(results):
     if not results:
         return
     
+    # 只有画图时才需要 matplotlib，进程池的子进程导入本模块时不必加载它
+    import matplotlib.pyplot as plt
+    
     # 饼图 - 成本构成
     plt.figure(figsize=(10, 6))
     labels = []
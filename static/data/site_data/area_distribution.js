@@ -0,0 +1,30 @@
+window.areaDistribution = {
+  "total": 205,
+  "average_area": 156.8,
+  "bins": [
+    {
+      "type": "微型书房",
+      "label": "100㎡以下",
+      "count": 61,
+      "percentage": 29.8
+    },
+    {
+      "type": "小型书房",
+      "label": "100-150㎡",
+      "count": 63,
+      "percentage": 30.7
+    },
+    {
+      "type": "中型书房",
+      "label": "150-250㎡",
+      "count": 59,
+      "percentage": 28.8
+    },
+    {
+      "type": "大型书房",
+      "label": "250㎡以上",
+      "count": 22,
+      "percentage": 10.7
+    }
+  ]
+};
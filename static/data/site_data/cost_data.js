@@ -0,0 +1,35 @@
+window.costData = {
+  "categories": {
+    "土建装修": {
+      "cost": 0,
+      "percentage": 0
+    },
+    "设备采购": {
+      "cost": 0,
+      "percentage": 0
+    },
+    "图书资源": {
+      "cost": 0,
+      "percentage": 0
+    },
+    "智能系统": {
+      "cost": 0,
+      "percentage": 0
+    },
+    "维护运营": {
+      "cost": 0,
+      "percentage": 0
+    },
+    "其他费用": {
+      "cost": 0,
+      "percentage": 0
+    }
+  },
+  "totalCost": 0,
+  "roomTypes": {
+    "micro": 0,
+    "small": 0,
+    "medium": 0,
+    "large": 0
+  }
+};
@@ -0,0 +1,100 @@
+window.libraryStats = {
+  "total": {
+    "count": 205,
+    "area": 32140.25,
+    "books": 1181712,
+    "seats": 9277
+  },
+  "districts": {
+    "西工区": {
+      "count": 17,
+      "area": 2793.0,
+      "books": 83000,
+      "seats": 761
+    },
+    "涧西区": {
+      "count": 32,
+      "area": 7337.0,
+      "books": 246246,
+      "seats": 1878
+    },
+    "老城区": {
+      "count": 12,
+      "area": 2040.0,
+      "books": 67000,
+      "seats": 604
+    },
+    "瀍河区": {
+      "count": 12,
+      "area": 2190.0,
+      "books": 90750,
+      "seats": 602
+    },
+    "洛龙区": {
+      "count": 31,
+      "area": 5077.9,
+      "books": 179780,
+      "seats": 1401
+    },
+    "伊滨区": {
+      "count": 9,
+      "area": 1590.0,
+      "books": 50374,
+      "seats": 503
+    },
+    "偃师区": {
+      "count": 9,
+      "area": 835.0,
+      "books": 45100,
+      "seats": 330
+    },
+    "孟津区": {
+      "count": 20,
+      "area": 2795.0,
+      "books": 116174,
+      "seats": 931
+    },
+    "新安县": {
+      "count": 10,
+      "area": 791.0,
+      "books": 44000,
+      "seats": 261
+    },
+    "宜阳县": {
+      "count": 10,
+      "area": 1211.8,
+      "books": 47921,
+      "seats": 358
+    },
+    "洛宁县": {
+      "count": 7,
+      "area": 642.5,
+      "books": 29000,
+      "seats": 195
+    },
+    "伊川县": {
+      "count": 9,
+      "area": 1695.0,
+      "books": 54000,
+      "seats": 542
+    },
+    "汝阳县": {
+      "count": 11,
+      "area": 1140.0,
+      "books": 48130,
+      "seats": 353
+    },
+    "嵩县": {
+      "count": 8,
+      "area": 1061.5,
+      "books": 33148,
+      "seats": 266
+    },
+    "栾川县": {
+      "count": 8,
+      "area": 940.55,
+      "books": 47089,
+      "seats": 292
+    }
+  }
+};
@@ -0,0 +1,48 @@
+// 人口网格二进制格式解码（格式见 flask/population_grid.py）
+// 比 heatmapData.js 小一个数量级，解码结果与 heatmapData 相同：[{lng, lat, count}]
+
+function decodePopulationGrid(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+    if (magic !== 'PGRD' || view.getUint8(4) !== 1) {
+        throw new Error('不是人口网格文件或版本不支持');
+    }
+    const dtype = view.getUint8(5);
+    const cols = view.getUint32(8, true);
+    const rows = view.getUint32(12, true);
+    const originLng = view.getFloat64(16, true);
+    const originLat = view.getFloat64(24, true);
+    const stepLng = view.getFloat64(32, true);
+    const stepLat = view.getFloat64(40, true);
+    const scale = view.getFloat64(48, true);
+    // 头部 56 字节，数据已按 TypedArray 要求对齐；格式为小端序，与浏览器常见字节序一致
+    const values = dtype === 1
+        ? new Uint16Array(buffer, 56, rows * cols)
+        : new Float32Array(buffer, 56, rows * cols);
+
+    const cells = [];
+    for (let row = 0; row < rows; row++) {
+        for (let col = 0; col < cols; col++) {
+            const value = values[row * cols + col];
+            if (value > 0) {
+                cells.push({
+                    lng: originLng + col * stepLng,
+                    lat: originLat + row * stepLat,
+                    count: value * scale
+                });
+            }
+        }
+    }
+    return cells;
+}
+
+function loadPopulationGrid(url = 'static/data/population_grid.bin') {
+    return fetch(url)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return response.arrayBuffer();
+        })
+        .then(decodePopulationGrid);
+}